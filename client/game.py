@@ -1,44 +1,39 @@
 from random import randrange
-import  time
+from common.watcher import get_watcher
+from common.txpipe import send, confirm
 
-def waitForPhase(contract,_phase, name,wait=1,debug=False):
-    while True:
-        phase = contract.functions.getPhase().call()
-        if debug:
-            print(phase)
-        if phase >= _phase:
-            print(f"✅ Now in {name}!{_phase}<=id:{phase}")
-            break
+def waitForPhase(contract,_phase, name,debug=False):
+    phase = get_watcher(contract.w3).wait_phase(contract, _phase)
+    if debug:
+        print(phase)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
 
-        print(f"⏳ Still waiting for {name}...")
-        time.sleep(wait)
+def random_action(game):
+    return "hit" if randrange(0,2) == 0 else "stand"
 
-def gameExec(game,ctl,w3):
+def gameExec(game,ctl,w3, strategy=random_action):
 
     while not game.functions.allFinished().call():
         waitForRound(game)
         print("player turn")
         hasPlayed = game.functions.hasPlayed().call()
-        action =randrange(0,2)
-        if action == 0 and not hasPlayed:
+        action = strategy(game)
+        if action == "hit" and not hasPlayed:
             print("hit")
             try:
-                tx = game.functions.hit().transact()
-                w3.eth.wait_for_transaction_receipt(tx)
+                confirm(w3, send(w3, game.functions.hit()))
             except:
                 pass
         elif not hasPlayed:
             print("stand")
             try:
-                tx = game.functions.stand().transact()
-                w3.eth.wait_for_transaction_receipt(tx)
+                confirm(w3, send(w3, game.functions.stand()))
             except:
                 pass
             return 
-        time.sleep(1)
+        get_watcher(w3).wait_block(timeout=1)
 
 
 
 def waitForRound(game):
-    while game.functions.playerRoundOver().call():
-        time.sleep(1)
+    get_watcher(game.w3).wait(game, "playerRoundOver", lambda over: not over)
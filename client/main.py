@@ -4,14 +4,22 @@ from web3.middleware import SignAndSendRawMiddlewareBuilder
 import os
 from setup import setupExec 
 from game import gameExec 
-import time
+from common.watcher import get_watcher
+from common.bundle import load_contracts
+from common.txpipe import install
+from strategy import load_tables
+from common.tracing import Tracer, TraceMiddlewareBuilder, TRACE_FILE, span
+from common import schedule
+from common.transport import connect
+from common.recorder import recorder
 
 
 
 def main():
     CLIENT_PRIVATE_KEY = os.environ["CLIENT_PK"]
 
-    w3 = Web3(Web3.HTTPProvider("http://127.0.0.1:8545"))
+    # HTTP, WebSocket or IPC by RPC_URL (see common/transport.py)
+    w3 = connect()
     assert w3.is_connected(), "Node is not running!"
 
     client_account = w3.eth.account.from_key(CLIENT_PRIVATE_KEY)
@@ -23,63 +31,56 @@ def main():
         SignAndSendRawMiddlewareBuilder.build(client_account),
         layer=0
     )
+    # every RPC request into a ring buffer, dumped on exit / SIGUSR1 with TRACE_FILE
+    # set (see common/tracing.py); the round trace takes its RPC calls from it too
+    tracer = None
+    if TRACE_FILE or recorder.path:
+        tracer = Tracer()
+        w3.middleware_onion.inject(TraceMiddlewareBuilder.build(tracer), layer=0)
+    if TRACE_FILE:
+        tracer.dump_to(TRACE_FILE)
     w3.eth.default_account = client_account.address
-    # Load contract ABI + address
-    import json
-
-    with open("./../out/Controller.sol/BlackjackController.json") as f:
-        artifact = json.load(f)
-    abi = artifact["abi"]
-
-    controllerAddr= Web3.to_checksum_address("0x5FbDB2315678afecb367f032d93F642f64180aa3")
-    controller  = w3.eth.contract(address=controllerAddr, abi=abi)
-
-
-    setup_address = controller.functions.setup().call()
-    with open("./../out/Setup.sol/Setup.json") as f:
-        artifact = json.load(f)
-    abi = artifact["abi"]
-
-    setupAddr= Web3.to_checksum_address(setup_address)
-    setup = w3.eth.contract(address=setupAddr, abi=abi)
-
-    with open("./../out/CRR2.sol/CommitReveal2.json") as f:
-        artifact = json.load(f)
-    abi = artifact["abi"]
-
-    cr2_address = setup.functions.cr().call()
-    cr2Addr= Web3.to_checksum_address(cr2_address)
-    cr2 = w3.eth.contract(address=cr2Addr, abi=abi)
-
-    game_address = controller.functions.game().call()
-    with open("./../out/Game.sol/Blackjack.json") as f:
-        artifact = json.load(f)
-    abi = artifact["abi"]
-
-    gameAddr= Web3.to_checksum_address(game_address)
-    game = w3.eth.contract(address=gameAddr, abi=abi)
+    install(w3, client_account)
+    # Load contract ABIs + addresses (cached bundle, see common/bundle.py)
+    controllerAddr= "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+    controller, setup, cr2, game, verify = load_contracts(w3, controllerAddr)
+    if tracer is not None:
+        tracer.label(controller=controller, setup=setup, cr2=cr2, game=game, verify=verify)
+    # phase changes, RPC calls, transactions and failures per round, with
+    # unless ROUND_TRACE_FILE=off (see common/recorder.py)
+    recorder.attach(w3, tracer, "client")
+    recorder.label(controller=controller, setup=setup, cr2=cr2, game=game, verify=verify)
+    # time based phases are slept through until their on-chain deadline (see common/schedule.py)
+    schedule.install(w3, setup, cr2, game)
+    # hit/stand tables, built once and cached (see strategy.py)
+    tables = load_tables()
 
 
     joined = False
     while True:
         id = controller.functions.roundId().call()
+        recorder.round(id)
         phase = controller.functions.getPhase().call()
         print("controller phase",phase)
         if phase == 0 :
             try:
-                setupExec(setup,cr2,w3,client_account,controller)
+                with span("setup"):
+                    setupExec(setup,cr2,w3,client_account,controller)
                 joined = True
                 waitForPhase(controller,1,"waiting for game phase")
             except  Exception as e:
                 print("error :(", e)
+                recorder.error("setup", e)
                 joined = False
 
         elif phase == 1 and joined:
             try:
                 print("gaming...")
-                gameExec(game,cr2,w3)
+                with span("game"):
+                    gameExec(game,cr2,w3,tables.strategy)
             except  Exception as e:
                 print("error :(", e)
+                recorder.error("game", e)
             waitForPhase(controller,2,"waiting  verify phase")
             
         elif phase == 2 and joined:
@@ -90,23 +91,17 @@ def main():
             #     print("error :(", e)
             joined = False
 
-        time.sleep(1)
+        get_watcher(w3).wait_block(timeout=1)
 
 
 
 
 
-def waitForPhase(contract,_phase, name,wait=1,debug=False):
-    while True:
-        phase = contract.functions.getPhase().call()
-        if debug:
-            print(phase)
-        if phase >= _phase:
-            print(f"✅ Now in {name}!{_phase}<=id:{phase}")
-            break
-
-        print(f"⏳ Still waiting for {name}...")
-        time.sleep(wait)
+def waitForPhase(contract,_phase, name,debug=False):
+    phase = get_watcher(contract.w3).wait_phase(contract, _phase)
+    if debug:
+        print(phase)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
 
 
 if __name__ == "__main__":
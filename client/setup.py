@@ -1,30 +1,35 @@
-import time
 import secrets
 from web3 import Web3
 from random import randrange
-
-def setupExec(setup,cr2,w3,addr,ctl):
+from common.txpipe import send, confirm, flush
+from common.revealorder import RevealOrder
+from common.schedule import wait_phase
+from common.skipper import wait_turn
+
+def setupExec(setup,cr2,w3,addr,ctl, amount=1):
+    # our own commit can't come before this; others' only if they bet before we started
+    start_block = w3.eth.block_number
     waitForStage(setup,0,"BETTING")
 
-    tx_hash = setup.functions.bet().transact({
-        "value": w3.to_wei(1, "ether")
+    tx_hash = send(w3, setup.functions.bet(), {
+        "value": w3.to_wei(amount, "ether")
     })
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    tx_receipt = confirm(w3, tx_hash)
 
     if tx_receipt.status==0:
         print("failed sending muuney :(")
-        return
+        return False
 
     waitForStage(setup,1,"rng")
 
-    random = crr(cr2,w3,addr)
+    random = crr(cr2,w3,addr,start_block)
     print(random)
 
     waitForStage(setup,3,"cut",debug=True)
     cut = randrange(10)
 
-    tx_hash = setup.functions.submitCut(cut).transact()
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    tx_receipt = confirm(w3, send(w3, setup.functions.submitCut(cut)))
+    return True
 
 
 
@@ -43,7 +48,7 @@ def make_commit(secret_str:str):
     assert Web3.keccak(co) == cv, "Local hash mismatch! cv != keccak(co)"
     return s, co, cv
 
-def crr(cr2,w3,addr):
+def crr(cr2,w3,addr,start_block=0):
     s, co, cv = make_commit("MyLiveSecret") #TODO: set some actual value
 
     assert Web3.keccak(co) == cv, "Local hash mismatch! cv != keccak(co)"
@@ -53,11 +58,11 @@ def crr(cr2,w3,addr):
     phase = cr2.functions.getParticipant().call()
     print("Submitting commit...")
 
-    tx= cr2.functions.commit(cv).transact({
+    tx= send(w3, cr2.functions.commit(cv), {
         "value": w3.to_wei(0.1, "ether")
     })
 
-    receipt = w3.eth.wait_for_transaction_receipt(tx)
+    receipt = confirm(w3, tx)
     if receipt["status"] == 0:
         phase = cr2.functions.getPhase().call()
         raise Exception("Commit tx reverted on-chain")
@@ -65,43 +70,26 @@ def crr(cr2,w3,addr):
     waitForStage(cr2,1,"reveal1")
 
     print("Submitting Reveal1...")
-    tx = cr2.functions.reveal1(co).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+    # confirmed once reveal2 opens, it has the whole OrderCalculation phase
+    send(w3, cr2.functions.reveal1(co))
+    tracker = RevealOrder(cr2, start_block)
+    tracker.load()
 
 
     waitForStage(cr2,3,"Reveal2")
+    flush(w3)
+
+    order = tracker.order()
+    if addr.address in order:
+        print(f"revealing {order.index(addr.address) + 1} of {len(order)}")
 
-    addresses, dvals = cr2.functions.getParticipantsAndDVals().call()
-
-    participants = list(zip(addresses, dvals))
-    valid_participants = [p for p in participants if p[1] > 0]
-
-    sorted_participants = sorted(valid_participants, key=lambda x: x[1], reverse=True)
-    sorted_addresses_payload = [p[0] for p in sorted_participants]
-    print(f"Sorted {len(sorted_addresses_payload)} addresses for submission.")
-
-    start_time = time.time()
-    timeout= cr2.functions.TURN_TIMEOUT().call()
-    while True:
-        current = cr2.functions.getCurrentRevealer().call()
-        print(current)
-        if addr.address == current:  
-            print("your turn!")
-            break
-        elapsed = time.time() - start_time
-        if timeout > 30:
-            print("waiting too long")
-            try:
-                current = cr2.functions.skipStalledUser().transact()
-            except:
-                print("skip failed")
-
-        print(f"⏳ Still waiting for currenttltly waiting for{addr}...")
-        time.sleep(1)
+    print(f"⏳ Still waiting for currenttltly waiting for{addr}...")
+    # stalled revealers ahead of us are skipped by one elected waiter (see common/skipper.py)
+    wait_turn(cr2, w3, addr.address, order)
+    print("your turn!")
 
     print("Submitting Reveal2...")
-    tx = cr2.functions.reveal2(s).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+    confirm(w3, send(w3, cr2.functions.reveal2(s)))
 
     waitForStage(cr2,4,"finish")
 
@@ -110,15 +98,9 @@ def crr(cr2,w3,addr):
     return final_randomness 
 
 
-def waitForStage(contract,_phase, name,wait=1,debug=False):
-    while True:
-        phase = contract.functions.getPhase().call()
-        if debug:
-            print(phase)
-        if phase >= _phase:
-            print(f"✅ Now in {name}!{_phase}<=id:{phase}")
-            break
-
-        print(f"⏳ Still waiting for {name}...")
-        time.sleep(wait)
+def waitForStage(contract,_phase, name,debug=False):
+    phase = wait_phase(contract, _phase)
+    if debug:
+        print(phase)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
 
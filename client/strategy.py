@@ -0,0 +1,231 @@
+from functools import lru_cache
+from common.batch import read
+import argparse
+import json
+import os
+
+# Hit/stand tables for the contract's blackjack rules, built once by dynamic
+# programming and cached on disk; each decision in the game is a lookup.
+#
+# The rules are the ones in Game.sol/BlackjackHelper.sol, not casino rules:
+# - every card is rand % 13 + 1 with replacement (J/Q/K count 10, ace 11)
+# - an ace is counted as 11 and knocked down by 10 once the hand busts, after
+#   which the hand is hard again (A,A is hard 12)
+# - reaching 21 at any point is BLACKJACK and pays 3:2, pushes against a
+#   two-card dealer 21
+# - the dealer starts from one card and draws while below 17
+# - a player who doesn't stand is dealt a card, so "hit" is also the default
+#
+#   tables = load_tables()
+#   gameExec(game, ctl, w3, tables.strategy)
+#   python strategy.py --validate 200000
+
+STRATEGY_CACHE = os.environ.get("STRATEGY_CACHE", "strategy.json")
+# bump when the rules above change so cached tables are rebuilt
+RULES = 1
+CARDS = range(1, 14)
+P = 1 / 13
+UP_CARDS = range(1, 11)
+
+
+def add_card(total, soft, card):
+    # Helper._updateHandTotal
+    if card == 1:
+        total, soft = total + 11, True
+    else:
+        total += min(card, 10)
+    if total > 21 and soft:
+        total, soft = total - 10, False
+    return total, soft
+
+
+@lru_cache(maxsize=None)
+def dealer(total, soft, cards):
+    # distribution of the dealer's final hand: 17-21, "bust" or "bj"
+    if total >= 17:
+        if total > 21:
+            return {"bust": 1.0}
+        return {"bj" if total == 21 and cards == 2 else total: 1.0}
+    outcomes = {}
+    for card in CARDS:
+        for outcome, p in dealer(*add_card(total, soft, card), cards + 1).items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + P * p
+    return outcomes
+
+
+def dealer_from(up):
+    return dealer(*add_card(0, False, up), 1)
+
+
+def blackjack_ev(up):
+    return 1.5 * (1 - dealer_from(up).get("bj", 0))
+
+
+def stand_ev(total, up):
+    ev = 0
+    for outcome, p in dealer_from(up).items():
+        if outcome == "bust":
+            ev += p
+        elif outcome == "bj":
+            ev -= p
+        else:
+            ev += p * ((total > outcome) - (total < outcome))
+    return ev
+
+
+def build():
+    @lru_cache(maxsize=None)
+    def value(total, soft, up):
+        return max(hit(total, soft, up), stand_ev(total, up))
+
+    @lru_cache(maxsize=None)
+    def hit(total, soft, up):
+        ev = 0
+        for card in CARDS:
+            t, s = add_card(total, soft, card)
+            if t == 21:
+                ev += P * blackjack_ev(up)
+            elif t > 21:
+                ev -= P
+            else:
+                ev += P * value(t, s, up)
+        return ev
+
+    # indexed [up][soft][total]; totals 21 and up never get a decision
+    return Tables(
+        [[[hit(t, s, up) for t in range(21)] for s in (False, True)] for up in range(11)],
+        [[stand_ev(t, up) for t in range(21)] for up in range(11)],
+    )
+
+
+class Tables:
+    def __init__(self, hit, stand):
+        self.hit = hit
+        self.stand = stand
+
+    def action(self, total, soft, up):
+        up = min(up, 10)
+        return "hit" if self.hit[up][soft][total] > self.stand[up][total] else "stand"
+
+    def value(self, total, soft, up):
+        up = min(up, 10)
+        return max(self.hit[up][soft][total], self.stand[up][total])
+
+    def strategy(self, game):
+        # the game.py strategy hook: two views in one batch, then a lookup
+        (cards, total, soft), (dealer_cards, _, _) = read(
+            game.w3, game.functions.getPlayerCards(), game.functions.getDealreHand()
+        )
+        if total >= 21 or not dealer_cards:
+            return "stand"
+        return self.action(total, soft, dealer_cards[0][0])
+
+    def deal_ev(self):
+        # expected return of a fresh deal (two player cards, one dealer card)
+        ev = 0
+        for up in CARDS:
+            for a in CARDS:
+                for b in CARDS:
+                    total, soft = add_card(*add_card(0, False, a), b)
+                    ev += P ** 3 * (blackjack_ev(up) if total == 21 else self.value(total, soft, up))
+        return ev
+
+
+def load_tables(path=STRATEGY_CACHE):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached["rules"] == RULES:
+            return Tables(cached["hit"], cached["stand"])
+    except (OSError, ValueError, KeyError):
+        pass
+    tables = build()
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"rules": RULES, "hit": tables.hit, "stand": tables.stand}, f)
+    os.replace(tmp, path)
+    return tables
+
+
+def simulate(tables, hands, state=None, seed=None):
+    # Monte Carlo check of the tables, vectorized over hands (needs numpy);
+    # state=(total, soft, up) starts every hand there instead of a fresh deal
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    draw = lambda: rng.integers(1, 14, hands)
+
+    def add(total, soft, card, mask):
+        ace = card == 1
+        total = np.where(mask, total + np.where(ace, 11, np.minimum(card, 10)), total)
+        soft = np.where(mask, soft | ace, soft)
+        knock = mask & (total > 21) & soft
+        return total - 10 * knock, soft & ~knock
+
+    hit = np.array(tables.hit)
+    stand = np.array(tables.stand)
+    if state is None:
+        up = draw()
+        total, soft = np.zeros(hands, dtype=np.int64), np.zeros(hands, dtype=bool)
+        everyone = np.ones(hands, dtype=bool)
+        total, soft = add(total, soft, draw(), everyone)
+        total, soft = add(total, soft, draw(), everyone)
+    else:
+        up = np.full(hands, state[2])
+        total, soft = np.full(hands, state[0], dtype=np.int64), np.full(hands, state[1], dtype=bool)
+
+    active = total < 21
+    while active.any():
+        index = np.minimum(up, 10), soft.astype(int), np.minimum(total, 20)
+        hitting = active & (hit[index] > stand[index[0], index[2]])
+        total, soft = add(total, soft, draw(), hitting)
+        active = hitting & (total < 21)
+
+    dealer_total, dealer_soft = add(np.zeros(hands, dtype=np.int64), np.zeros(hands, dtype=bool), up, np.ones(hands, dtype=bool))
+    dealer_cards = np.ones(hands, dtype=np.int64)
+    drawing = dealer_total < 17
+    while drawing.any():
+        dealer_total, dealer_soft = add(dealer_total, dealer_soft, draw(), drawing)
+        dealer_cards += drawing
+        drawing = dealer_total < 17
+
+    dealer_bj = (dealer_total == 21) & (dealer_cards == 2)
+    result = np.where(dealer_total > 21, 1.0, np.sign(total - dealer_total).astype(float))
+    result = np.where(dealer_bj, -1.0, result)
+    result = np.where(total == 21, np.where(dealer_bj, 0.0, 1.5), result)
+    result = np.where(total > 21, -1.0, result)
+    return result.mean(), result.std() / np.sqrt(hands)
+
+
+def validate(tables, hands):
+    failed = 0
+    checks = [(None, tables.deal_ev())] + [
+        ((total, soft, up), tables.value(total, soft, up))
+        for up in UP_CARDS for soft in (False, True) for total in range(12 if soft else 4, 21)
+    ]
+    for state, expected in checks:
+        mean, err = simulate(tables, hands, state)
+        if abs(mean - expected) > 4 * err:
+            failed += 1
+            print(f"state {state or 'deal'}: table {expected:+.4f}, simulated {mean:+.4f} +- {err:.4f}")
+    print(f"{len(checks) - failed}/{len(checks)} states match, fresh deal EV {tables.deal_ev():+.4f}")
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build and check the hit/stand tables")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--validate", type=int, metavar="HANDS", help="simulate this many hands per state")
+    args = parser.parse_args()
+    if args.rebuild and os.path.exists(STRATEGY_CACHE):
+        os.remove(STRATEGY_CACHE)
+    tables = load_tables()
+    for up in UP_CARDS:
+        row = " ".join(tables.action(total, False, up)[0].upper() for total in range(4, 21))
+        print(f"dealer {up:>2}: {row}")
+    if args.validate:
+        validate(tables, args.validate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+from web3 import Web3
+from web3.middleware import SignAndSendRawMiddlewareBuilder
+from setup import setupExec
+from game import gameExec, random_action
+from common.watcher import get_watcher
+from common.txpipe import install
+from common.bundle import load_bundle, contracts
+from strategy import load_tables
+from common.transport import RPC_URL
+from common import transport
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+# Client swarm: many player accounts in one process. All clients share one
+# HTTP provider, so one watcher thread follows phases, turns and receipts for
+# every one of them; each client is a thread that mostly sleeps on it. Every
+# client runs the normal setupExec -> crr -> gameExec flow with its own
+# signing pipeline, and the run reports join success rate, reveal2 turn
+# latency and confirmation latency per action.
+#
+#   python swarm.py --clients 200 --rounds 3 --strategy hit17 --bet 2
+
+CONTROLLER = os.environ.get("CONTROLLER", "0x5FbDB2315678afecb367f032d93F642f64180aa3")
+# anvil account #1; #0 is the house
+FUNDER_PK = os.environ.get("FUNDER_PK", "0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603b6b78690d")
+CLIENT_FUNDS = 10
+
+
+def stand(game):
+    return "stand"
+
+
+def hit_below(limit):
+    def strategy(game):
+        cards, total, soft = game.functions.getPlayerCards().call()
+        return "hit" if total < limit else "stand"
+    return strategy
+
+
+STRATEGIES = {
+    "random": random_action,
+    "stand": stand,
+    "hit17": hit_below(17),
+    "hit12": hit_below(12),
+}
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    at = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"n": len(values), "p50": round(at(0.5), 3), "p90": round(at(0.9), 3), "max": round(values[-1], 3)}
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attempts = 0
+        self.joins = 0
+        self.errors = 0
+        self.rounds = 0
+        self.reveal2_open = None
+        self.turns = []
+        self.confirms = {}
+
+    def receipt(self, name, receipt, sent):
+        now = time.monotonic()
+        with self.lock:
+            self.confirms.setdefault(name, []).append(now - sent)
+            # from Reveal2 opening to this client's reveal going out
+            if name == "reveal2" and self.reveal2_open is not None:
+                self.turns.append(sent - self.reveal2_open)
+
+    def report(self, clients):
+        with self.lock:
+            return {
+                "clients": clients,
+                "rounds": self.rounds,
+                "join_attempts": self.attempts,
+                "joins": self.joins,
+                "join_rate": round(self.joins / self.attempts, 3) if self.attempts else None,
+                "errors": self.errors,
+                "reveal2_turn": percentiles(self.turns),
+                "confirm": {name: percentiles(values) for name, values in sorted(self.confirms.items())},
+            }
+
+
+def fund(w3, funder, accounts):
+    w3.middleware_onion.inject(SignAndSendRawMiddlewareBuilder.build(funder), layer=0)
+    hashes = [
+        w3.eth.send_transaction({"from": funder.address, "to": account.address, "value": w3.to_wei(CLIENT_FUNDS, "ether")})
+        for account in accounts
+    ]
+    get_watcher(w3).wait_receipts(hashes, timeout=120)
+
+
+def client(provider, bundle, tables, account, args, stats, stop):
+    # own Web3 (default account, pipeline) over the shared provider
+    w3 = Web3(provider)
+    w3.eth.default_account = account.address
+    install(w3, account).listeners.append(stats.receipt)
+    controller, setup, cr2, game, verify = contracts(w3, bundle)
+    strategy = tables.strategy if args.strategy == "table" else STRATEGIES[args.strategy]
+    watcher = get_watcher(w3)
+
+    while not stop.is_set():
+        try:
+            id, phase = controller.functions.roundId().call(), controller.functions.getPhase().call()
+            if phase == 0 and random.random() < args.join:
+                with stats.lock:
+                    stats.attempts += 1
+                if setupExec(setup, cr2, w3, account, controller, args.bet):
+                    with stats.lock:
+                        stats.joins += 1
+                    watcher.wait_phase(controller, 1)
+                    gameExec(game, controller, w3, strategy)
+            # one try per round; a full table waits for the next one
+            watcher.wait(controller, "roundId", lambda r: r != id)
+        except Exception as e:
+            print(f"client {account.address[:8]} failed:", e)
+            with stats.lock:
+                stats.errors += 1
+            watcher.wait_block(timeout=1)
+
+
+def monitor(w3, bundle, stats, rounds, stop):
+    controller, setup, cr2, game, verify = contracts(w3, bundle)
+    watcher = get_watcher(w3)
+    id = controller.functions.roundId().call()
+    while stats.rounds < rounds:
+        watcher.wait_phase(cr2, 3)
+        with stats.lock:
+            stats.reveal2_open = time.monotonic()
+        id = watcher.wait(controller, "roundId", lambda r: r != id)
+        with stats.lock:
+            stats.rounds += 1
+    stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="client swarm load generator")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES) + ["table"], default="random")
+    parser.add_argument("--bet", type=float, default=1, help="bet in ether")
+    parser.add_argument("--join", type=float, default=1.0, help="chance to try joining a round")
+    parser.add_argument("--out", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    provider = transport.provider(RPC_URL)
+    w3 = Web3(provider)
+    assert w3.is_connected(), "Node is not running!"
+    bundle = load_bundle(w3, CONTROLLER)
+
+    accounts = [w3.eth.account.create() for _ in range(args.clients)]
+    funder = w3.eth.account.from_key(FUNDER_PK)
+    fund(Web3(provider), funder, accounts)
+    print(f"funded {len(accounts)} clients")
+
+    tables = load_tables() if args.strategy == "table" else None
+    stats = Stats()
+    stop = threading.Event()
+    for account in accounts:
+        threading.Thread(target=client, args=(provider, bundle, tables, account, args, stats, stop), daemon=True).start()
+    monitor(w3, bundle, stats, args.rounds, stop)
+
+    report = stats.report(args.clients)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from strategy import RULES, UP_CARDS, add_card, build, dealer_from, load_tables, stand_ev
+import json
+import pytest
+
+
+@pytest.fixture(scope="module")
+def tables():
+    return build()
+
+
+@pytest.mark.parametrize("cards, total, soft", [
+    ([1, 1], 12, False),
+    ([1, 13], 21, True),
+    ([1, 5, 9], 15, False),
+    ([12, 13], 20, False),
+    ([9, 1, 1], 21, False),
+])
+def test_add_card_follows_helper(cards, total, soft):
+    hand = (0, False)
+    for card in cards:
+        hand = add_card(*hand, card)
+    assert hand == (total, soft)
+
+
+@pytest.mark.parametrize("up", UP_CARDS)
+def test_dealer_outcomes_are_a_distribution(up):
+    outcomes = dealer_from(up)
+    assert set(outcomes) <= {17, 18, 19, 20, 21, "bust", "bj"}
+    assert sum(outcomes.values()) == pytest.approx(1.0)
+    # a two-card 21 needs a ten-valued up card and an ace or the other way round
+    if up not in (1, 10):
+        assert "bj" not in outcomes
+
+
+@pytest.mark.parametrize("up", UP_CARDS)
+def test_stand_ev_grows_with_the_total(up):
+    evs = [stand_ev(total, up) for total in range(4, 21)]
+    assert evs == sorted(evs)
+
+
+def test_table_decisions(tables):
+    for up in UP_CARDS:
+        # one more card can't bust a hard 11 or less
+        for total in range(4, 12):
+            assert tables.action(total, False, up) == "hit"
+        # only an ace helps a hard 20
+        assert tables.action(20, False, up) == "stand"
+        for soft in (False, True):
+            for total in range(12 if soft else 4, 21):
+                assert tables.value(total, soft, up) == max(tables.hit[up][soft][total], tables.stand[up][total])
+    # J/Q/K up cards use the ten column
+    assert tables.action(16, False, 13) == tables.action(16, False, 10)
+
+
+def test_deal_ev_is_bounded(tables):
+    assert -1 < tables.deal_ev() < 1.5
+
+
+def test_load_tables_caches_and_rebuilds(tmp_path, tables):
+    path = str(tmp_path / "strategy.json")
+    built = load_tables(path)
+    assert built.hit == tables.hit and built.stand == tables.stand
+    with open(path) as f:
+        assert json.load(f)["rules"] == RULES
+
+    cached = load_tables(path)
+    assert cached.hit == built.hit
+
+    # tables of other rules are thrown away
+    with open(path, "w") as f:
+        json.dump({"rules": RULES - 1, "hit": [], "stand": []}, f)
+    assert load_tables(path).stand == tables.stand
+
+
+def test_simulation_agrees_with_the_tables(tables):
+    pytest.importorskip("numpy")
+    from strategy import simulate
+
+    for state in [(16, False, 10), (13, True, 6)]:
+        mean, err = simulate(tables, 100_000, state, seed=3)
+        assert abs(mean - tables.value(*state)) < 5 * err
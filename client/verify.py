@@ -1,31 +1,24 @@
-import time
+from common.watcher import get_watcher
+from common.schedule import RECHECK
+from common.txpipe import send, confirm
 
-def waitForPhase(contract,_phase, id,name,wait=5,debug=False):
-    while True:
-        phase = contract.functions.getPhase(id).call()
-        if debug:
-            print(phase)
-        if phase >= _phase:
-            print(f"✅ Now in {name}!{_phase}<=id:{phase}")
-            break
-
-        print(f"⏳ Still waiting for {name}...")
-        # time.sleep(wait)
+def waitForPhase(contract,_phase, id,name,debug=False):
+    phase = get_watcher(contract.w3).wait_phase(contract, _phase, args=(id,), recheck=RECHECK)
+    if debug:
+        print(phase)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
 
 def verifyExec(verify,ctl,w3, id):
     print("calling verify game")
-    tx= ctl.functions.verifyGame().transact({
+    tx= send(w3, ctl.functions.verifyGame(), {
     "gas": 1_000_000, # Force a high gas limit
     })
-    receipt = w3.eth.wait_for_transaction_receipt(tx)
+    receipt = confirm(w3, tx)
     print(f"Transaction status: {receipt['status']} (1=Success, 0=Fail)")
 
     print("calling resolve game")
-    tx= verify.functions.resolveGame(id).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+    confirm(w3, send(w3, verify.functions.resolveGame(id)))
 
 
 def waitForRound(game):
-    while not game.functions.playerRoundOver().call():
-        pass
-        time.sleep(1)
+    get_watcher(game.w3).wait(game, "playerRoundOver", lambda over: over, recheck=RECHECK)
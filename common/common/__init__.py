@@ -0,0 +1,7 @@
+# Modules the house (server/) and the players (client/) both run: node
+# connection (transport), block/log watcher, batched reads, transaction
+# pipeline, phase scheduling, reveal order and turn skipping, contract bundle,
+# RPC tracing and the round trace. Installed into both projects as an editable
+# path dependency.
+#
+#   from common.watcher import get_watcher
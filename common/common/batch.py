@@ -0,0 +1,51 @@
+# Batched view calls: several contract reads go out as one JSON-RPC batch
+# request and come back decoded, in the order they were passed in.
+#
+#   id, phase = read(w3, controller.functions.roundId(), controller.functions.getPhase())
+
+
+def read(w3, *calls):
+    results = read_each(w3, *calls)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+# like read() but a failing call (e.g. a revert) is returned as its exception
+# instead of failing the whole batch
+def read_each(w3, *calls):
+    if not calls:
+        return []
+    if len(calls) > 1:
+        try:
+            with w3.batch_requests() as batch:
+                for call in calls:
+                    batch.add(call)
+                return batch.execute()
+        except Exception:
+            # one reverting call fails the whole batch, and some providers
+            # can't batch at all; fall through to one request per call
+            pass
+
+    results = []
+    for call in calls:
+        try:
+            results.append(call.call())
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+# receipts of transactions known to be mined (e.g. taken from a block's
+# transaction list), in one batch request
+def read_receipts(w3, hashes):
+    if len(hashes) > 1:
+        try:
+            with w3.batch_requests() as batch:
+                for tx_hash in hashes:
+                    batch.add(w3.eth.get_transaction_receipt(tx_hash))
+                return batch.execute()
+        except Exception:
+            pass
+    return [w3.eth.get_transaction_receipt(tx_hash) for tx_hash in hashes]
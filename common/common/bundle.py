@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+# Compact contract bundle: just the five ABIs plus the resolved setup/cr/game/
+# verify addresses of one controller, cached as a small JSON file keyed by
+# chain id and controller address. It is rebuilt only when the Forge
+# artifacts in out/ change (sha256 over their raw bytes, no JSON parsing), so a
+# warm start skips parsing the full artifacts and the serial address lookups.
+# That is all it saves: every entry point imports web3 (about 1.3s) to
+# connect before it gets here.
+#
+#   controller, setup, cr2, game, verify = load_contracts(w3, CONTROLLER)
+
+OUT = os.environ.get("FORGE_OUT", "./../out")
+BUNDLE_DIR = os.environ.get("BUNDLE_DIR", os.path.join(OUT, "bundles"))
+
+ARTIFACTS = {
+    "controller": "Controller.sol/BlackjackController.json",
+    "setup": "Setup.sol/Setup.json",
+    "cr2": "CRR2.sol/CommitReveal2.json",
+    "game": "Game.sol/Blackjack.json",
+    "verify": "Verify.sol/Verify.json",
+}
+
+
+def artifact_hash(out=OUT):
+    h = hashlib.sha256()
+    for name in sorted(ARTIFACTS):
+        with open(os.path.join(out, ARTIFACTS[name]), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def bundle_path(chain_id, controller):
+    return os.path.join(BUNDLE_DIR, f"{chain_id}-{controller.lower()}.json")
+
+
+def cached_bundle(chain_id, controller):
+    # the stored bundle, or None if there is none or out/ changed since
+    try:
+        with open(bundle_path(chain_id, controller)) as f:
+            bundle = json.load(f)
+        if bundle["artifacts"] == artifact_hash():
+            return bundle
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def read_abis():
+    abis = {}
+    for name, artifact in ARTIFACTS.items():
+        with open(os.path.join(OUT, artifact)) as f:
+            abis[name] = json.load(f)["abi"]
+    return abis
+
+
+def save_bundle(chain_id, addresses, abis):
+    bundle = {
+        "artifacts": artifact_hash(),
+        "chain_id": chain_id,
+        "addresses": addresses,
+        "abis": abis,
+    }
+    path = bundle_path(chain_id, addresses["controller"])
+    os.makedirs(BUNDLE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(bundle, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return bundle
+
+
+def load_bundle(w3, controller, chain_id=None):
+    chain_id = chain_id or w3.eth.chain_id
+    bundle = cached_bundle(chain_id, controller)
+    if bundle is not None:
+        return bundle
+
+    from web3 import Web3
+    from common.batch import read
+
+    abis = read_abis()
+    controller = Web3.to_checksum_address(controller)
+    ctl = w3.eth.contract(address=controller, abi=abis["controller"])
+    setup, game, verify = read(w3, ctl.functions.setup(), ctl.functions.game(), ctl.functions.verify())
+    cr2 = w3.eth.contract(address=setup, abi=abis["setup"]).functions.cr().call()
+    addresses = {"controller": controller, "setup": setup, "cr2": cr2, "game": game, "verify": verify}
+    return save_bundle(chain_id, addresses, abis)
+
+
+def contracts(w3, bundle):
+    return tuple(
+        w3.eth.contract(address=bundle["addresses"][name], abi=bundle["abis"][name])
+        for name in ("controller", "setup", "cr2", "game", "verify")
+    )
+
+
+def load_contracts(w3, controller, chain_id=None):
+    return contracts(w3, load_bundle(w3, controller, chain_id))
@@ -0,0 +1,311 @@
+from common.bundle import ARTIFACTS
+import argparse
+import atexit
+import glob
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Round trace. Every event (phase change, RPC call, mined
+# transaction, hash chain link consumed, exception) becomes one compact JSON
+# line with a monotonic timestamp, the process and the current round id. The
+# calling thread only puts a tuple on a bounded queue; a writer thread appends
+# to a size-rotated file, and when it falls behind events are dropped and
+# counted instead of piling up in memory. Watcher poll ticks are sampled.
+# CLOCK_MONOTONIC is shared by the processes of one box, so the files of the
+# house and the clients merge into one timeline. On by default, writing
+# rounds.jsonl; ROUND_TRACE_FILE=off (or empty) turns it off.
+#
+#   from common.recorder import recorder
+#   recorder.attach(w3, tracer, "house")       # RPC calls, mined transactions, uncaught exceptions
+#   recorder.label(setup=setup, cr2=cr2, game=game, verify=verify)
+#   recorder.round(id)
+#   recorder.event("pop", index=len(chain))
+#
+#   python -m common.recorder ../server/rounds.jsonl ../client/rounds.jsonl --round 12 --events
+
+# "off" or empty: nothing is recorded and attach() leaves the process alone
+ROUND_TRACE_FILE = os.environ.get("ROUND_TRACE_FILE", "rounds.jsonl")
+if ROUND_TRACE_FILE.lower() == "off":
+    ROUND_TRACE_FILE = ""
+ROUND_TRACE_BYTES = int(os.environ.get("ROUND_TRACE_BYTES", 16 * 1024 * 1024))
+ROUND_TRACE_FILES = int(os.environ.get("ROUND_TRACE_FILES", 4))
+ROUND_TRACE_SAMPLE = float(os.environ.get("ROUND_TRACE_SAMPLE", 0.01))
+ROUND_TRACE_BUFFER = int(os.environ.get("ROUND_TRACE_BUFFER", 10_000))
+
+PHASES = {
+    "BlackjackController": ["Setup", "Game", "Verification"],
+    "Setup": ["BETTING", "RNG", "CHAIN", "CUT", "CUTCHAIN"],
+    "CommitReveal2": ["Commit", "Reveal1", "OrderCalculation", "Reveal2", "Finished"],
+    "Blackjack": ["DEAL_CARDS", "PLAYER_ROUND", "DEALER_ROUND", "FINISHED"],
+}
+
+
+class Recorder:
+    def __init__(self, path=ROUND_TRACE_FILE, max_bytes=ROUND_TRACE_BYTES, files=ROUND_TRACE_FILES,
+                 sample=ROUND_TRACE_SAMPLE, buffer=ROUND_TRACE_BUFFER):
+        # an empty path turns recording off
+        self.path = path
+        self.max_bytes = max_bytes
+        self.files = files
+        self.sample = sample
+        self.queue = queue.Queue(maxsize=buffer)
+        self.process = f"{os.path.basename(sys.argv[0] or 'python')}:{os.getpid()}"
+        self.round_id = None
+        self.names = {}
+        self.phases = {}
+        self.dropped = 0
+        self.thread = None
+        self.lock = threading.Lock()
+        self.hooked = False
+
+    def round(self, id):
+        if id != self.round_id:
+            self.round_id = id
+            self.event("round")
+
+    def event(self, kind, **fields):
+        if not self.path:
+            return
+        try:
+            self.queue.put_nowait((time.monotonic(), self.round_id, kind, fields))
+        except queue.Full:
+            self.dropped += 1
+        if self.thread is None:
+            self._start()
+
+    def tick(self, kind, **fields):
+        if self.sample and random.random() < self.sample:
+            self.event(kind, sample=self.sample, **fields)
+
+    def label(self, **contracts):
+        # keys as in bundle.ARTIFACTS; phases are reported under the Solidity contract name
+        for key, contract in contracts.items():
+            self.names[contract.address] = os.path.basename(ARTIFACTS[key])[:-len(".json")]
+
+    def phase(self, address, phase, args=()):
+        # every observer reports what it read; only changes are recorded
+        key = (address, tuple(args))
+        if self.phases.get(key) == phase:
+            return
+        self.phases[key] = phase
+        fields = {"contract": self.names.get(address, address), "phase": phase}
+        if args:
+            fields["args"] = list(args)
+        self.event("phase", **fields)
+
+    def error(self, step, e):
+        self.event("error", step=step, error=f"{type(e).__name__}: {e}")
+
+    def attach(self, w3, tracer=None, process=None):
+        from common.txpipe import get_pipeline
+
+        if not self.path:
+            return
+        if process:
+            self.process = process
+        pipe = get_pipeline(w3)
+        if pipe is not None:
+            pipe.listeners.append(self._mined)
+        if tracer is not None:
+            tracer.listeners.append(self._rpc)
+        self._hooks()
+
+    def _mined(self, name, receipt, sent):
+        self.event(
+            "tx", fn=name, status=receipt["status"], gas=receipt["gasUsed"],
+            block=receipt["blockNumber"], wait=round(time.monotonic() - sent, 4),
+        )
+
+    def _rpc(self, record):
+        # tracing.Tracer record: (time, span, method, function, seconds, sent, received, outcome)
+        _, span, method, function, seconds, _, _, result = record
+        # the watcher's requests are its poll ticks
+        log = self.tick if span == "phase-watcher" else self.event
+        log("rpc", method=method, fn=function, s=round(seconds, 5), span=span, ok=result == "ok")
+
+    def _hooks(self):
+        # wraps whatever hooks are installed, which still run after the event
+        if self.hooked:
+            return
+        self.hooked = True
+        excepthook, thread_excepthook = sys.excepthook, threading.excepthook
+
+        def on_exception(kind, value, tb):
+            self.error("uncaught", value)
+            self.flush()
+            excepthook(kind, value, tb)
+
+        def on_thread_exception(args):
+            self.error(f"thread {args.thread.name if args.thread else ''}", args.exc_value)
+            thread_excepthook(args)
+
+        sys.excepthook = on_exception
+        threading.excepthook = on_thread_exception
+
+    # ---------------------------------------------------------
+    # writer
+    # ---------------------------------------------------------
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._write, name="round-trace", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def flush(self, timeout=2):
+        deadline = time.monotonic() + timeout
+        while self.thread is not None and self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _write(self):
+        f = open(self.path, "a")
+        while True:
+            item = self.queue.get()
+            lines = [item]
+            # everything queued meanwhile goes out in the same write
+            while len(lines) < 1024:
+                try:
+                    lines.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                f.write("".join(self._line(*line) for line in lines))
+                if self.dropped:
+                    f.write(self._line(time.monotonic(), self.round_id, "dropped", {"events": self.dropped}))
+                    self.dropped = 0
+                f.flush()
+                if f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a")
+            except Exception as e:
+                print("round trace error:", e)
+            finally:
+                for _ in lines:
+                    self.queue.task_done()
+
+    def _line(self, t, round_id, kind, fields):
+        return json.dumps({"t": round(t, 6), "p": self.process, "r": round_id, "k": kind, **fields},
+                          separators=(",", ":"), default=str) + "\n"
+
+    def _rotate(self):
+        # rounds.jsonl -> rounds.jsonl.1 -> ... -> rounds.jsonl.<files - 1>, the oldest is dropped
+        for i in range(self.files - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                if i == self.files - 1:
+                    os.remove(older)
+                else:
+                    os.replace(older, f"{self.path}.{i + 1}")
+        if self.files > 1:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+recorder = Recorder()
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+
+def load(paths):
+    events = []
+    for path in paths:
+        # rotated files too
+        for name in sorted(set(glob.glob(path) + glob.glob(path + ".[0-9]*"))):
+            with open(name) as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        continue
+    events.sort(key=lambda e: e["t"])
+    return events
+
+
+def phase_name(contract, phase):
+    names = PHASES.get(contract, [])
+    return f"{contract}.{names[phase] if phase < len(names) else phase}"
+
+
+def timeline(events):
+    # splits one round's events into stages, a stage being "contract.phase" of
+    # the latest phase change seen by any process
+    stages = []
+    seen = set()
+    stage = {"name": "(before first phase)", "start": events[0]["t"], "rpc": 0, "rpc_s": 0.0, "tx": 0, "tx_wait": 0.0, "gas": 0, "errors": 0}
+    for e in events:
+        if e["k"] == "phase":
+            # every process reports the changes it sees; the first one counts
+            key = (e["contract"], e["phase"], tuple(e.get("args", ())))
+            if key in seen:
+                continue
+            seen.add(key)
+            stage["end"] = e["t"]
+            stages.append(stage)
+            stage = {"name": phase_name(e["contract"], e["phase"]), "start": e["t"], "rpc": 0, "rpc_s": 0.0, "tx": 0, "tx_wait": 0.0, "gas": 0, "errors": 0}
+        elif e["k"] == "rpc":
+            # a sampled request stands for 1/sample of them
+            weight = 1 / e.get("sample", 1)
+            stage["rpc"] += weight
+            stage["rpc_s"] += e["s"] * weight
+        elif e["k"] == "tx":
+            stage["tx"] += 1
+            stage["tx_wait"] += e["wait"]
+            stage["gas"] += e["gas"]
+        elif e["k"] == "error":
+            stage["errors"] += 1
+    stage["end"] = events[-1]["t"]
+    stages.append(stage)
+    if not (stages[0]["rpc"] or stages[0]["tx"] or stages[0]["errors"]):
+        stages = stages[1:]
+    return stages
+
+
+def report(round_id, events, show_events):
+    t0 = events[0]["t"]
+    processes = sorted({e["p"] for e in events})
+    print(f"round {round_id}: {events[-1]['t'] - t0:.2f}s, {len(events)} events from {', '.join(processes)}")
+    print(f"{'at s':>8} {'took s':>8} {'rpc':>5} {'rpc s':>7} {'tx':>4} {'tx wait s':>9} {'gas':>9} {'err':>4}  stage")
+    for s in timeline(events):
+        print(
+            f"{s['start'] - t0:>8.2f} {s['end'] - s['start']:>8.2f} {s['rpc']:>5.0f} {s['rpc_s']:>7.2f} "
+            f"{s['tx']:>4} {s['tx_wait']:>9.2f} {s['gas']:>9} {s['errors']:>4}  {s['name']}"
+        )
+    if show_events:
+        for e in events:
+            fields = {k: v for k, v in e.items() if k not in ("t", "p", "r", "k")}
+            print(f"  {e['t'] - t0:>8.3f} {e['p']:<16} {e['k']:<6} {json.dumps(fields, separators=(',', ':'))}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-round timelines from round trace files")
+    parser.add_argument("traces", nargs="*", default=[ROUND_TRACE_FILE or "rounds.jsonl"])
+    parser.add_argument("--round", type=int, help="only this round")
+    parser.add_argument("--last", type=int, default=5, help="the last N rounds (default 5)")
+    parser.add_argument("--events", action="store_true", help="list every event too")
+    args = parser.parse_args()
+
+    rounds = {}
+    for e in load(args.traces):
+        if e.get("r") is not None:
+            rounds.setdefault(e["r"], []).append(e)
+    ids = [args.round] if args.round is not None else sorted(rounds)[-args.last:]
+    for round_id in ids:
+        if round_id in rounds:
+            report(round_id, rounds[round_id], args.events)
+        else:
+            print(f"round {round_id}: no events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from eth_hash.auto import keccak
+from eth_utils import event_abi_to_log_topic
+import heapq
+
+# Reveal order computed locally, the way CRR2.calculateIntermediateValues does:
+# omega_v = keccak(co of every Reveal1 participant, in commit order) and
+# dVal = keccak(|omega_v - cv|) per participant; the order is dVal descending.
+# Commits and reveals come from the CommitSubmitted/Reveal1Submitted logs:
+# one eth_getLogs while Reveal1 is still open, then one more over the blocks
+# since, up to the current one, once OrderCalculation starts. Both ranges are
+# bounded block numbers, so no log in between is missed, and
+# submitRevealOrder (which runs calculateIntermediateValues itself) goes out
+# without another transaction in front of it.
+#
+#   tracker = RevealOrder(cr2, start_block)
+#   tracker.load()                      # during Reveal1
+#   order = tracker.order()             # once OrderCalculation opens
+#   order = tracker.loaded_order()      # after add(logs, end) of query(end) on AsyncWeb3
+
+
+def dvals(commits, reveals):
+    # commits: [(participant, cv)] in commit order; reveals: {participant: co}
+    revealed = [(participant, cv) for participant, cv in commits if participant in reveals]
+    if not revealed:
+        return None, {}
+    omega_v = keccak(b"".join(reveals[participant] for participant, _ in revealed))
+    omega = int.from_bytes(omega_v, "big")
+    return omega_v, {
+        participant: int.from_bytes(keccak(abs(omega - int.from_bytes(cv, "big")).to_bytes(32, "big")), "big")
+        for participant, cv in revealed
+    }
+
+
+def reveal_order(values):
+    # dVal descending; submitRevealOrder accepts equal dVals in any order
+    heap = [(-dval, participant) for participant, dval in values.items()]
+    heapq.heapify(heap)
+    return [heapq.heappop(heap)[1] for _ in range(len(heap))]
+
+
+class RevealOrder:
+    def __init__(self, cr2, from_block):
+        # from_block: at or before this round's cr2.reset, after the last round's commits
+        self.cr2 = cr2
+        self.w3 = cr2.w3
+        self.from_block = from_block
+        self.events = {
+            bytes(event_abi_to_log_topic(event.abi)): event
+            for event in (cr2.events.CommitSubmitted(), cr2.events.Reveal1Submitted())
+        }
+        self.seen = set()
+        self.commits = []
+        self.cvs = {}
+        self.reveals = {}
+        self.omega_v = None
+        # last block whose logs were fetched
+        self.loaded = None
+
+    def load(self):
+        # the logs of the blocks not fetched yet, up to the current one
+        end = self.w3.eth.block_number
+        params = self.query(end)
+        if params is not None:
+            self.add(self.w3.eth.get_logs(params), end)
+
+    def query(self, end):
+        # eth_getLogs params for the blocks not fetched yet up to end, None if there are none
+        start = self.from_block if self.loaded is None else self.loaded + 1
+        if end < start:
+            return None
+        return {"address": self.cr2.address, "fromBlock": start, "toBlock": end, "topics": [list(self.events)]}
+
+    def add(self, logs, loaded=None):
+        # loaded: the last block these logs cover, once they are all of its range
+        for log in sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"])):
+            key = (log["blockNumber"], log["logIndex"])
+            event = self.events.get(bytes(log["topics"][0])) if log["topics"] else None
+            if key in self.seen or event is None:
+                continue
+            self.seen.add(key)
+            args = event.process_log(log)["args"]
+            if "cv" in args:
+                if args["participant"] not in self.cvs:
+                    self.commits.append(args["participant"])
+                self.cvs[args["participant"]] = bytes(args["cv"])
+            # reveal1 only succeeds when keccak(co) == cv
+            elif keccak(bytes(args["co"])) == self.cvs.get(args["participant"]):
+                self.reveals[args["participant"]] = bytes(args["co"])
+        if loaded is not None:
+            self.loaded = loaded
+
+    def order(self):
+        self.load()
+        return self.loaded_order()
+
+    def loaded_order(self):
+        # from the logs loaded so far, e.g. with query()/add() on AsyncWeb3
+        self.omega_v, values = dvals([(participant, self.cvs[participant]) for participant in self.commits], self.reveals)
+        return reveal_order(values)
@@ -0,0 +1,131 @@
+import time
+from common.batch import read
+from common.watcher import get_watcher
+
+# Deadline-based waiting for the time-driven phases. Setup and CommitReveal2
+# phases and the Blackjack player round end at fixed offsets from on-chain
+# timestamps (Setup.games(id).startTime, commitEndTime, reveal1EndTime,
+# phaseStartTime) plus compile-time durations. The durations are read once at
+# install(), the timestamps once per wait in a single batch; the caller then
+# sleeps until the deadline without any RPC traffic and only confirms the
+# transition through the watcher. Phases that depend on transactions
+# (Reveal2, Finished, the controller) go straight to the watcher.
+#
+#   install(w3, setup, cr2, game)             # clock=chain for backend.py
+#   wait_phase(setup, 2)            # sleeps until CHAIN opens, then confirms it
+#   wait_round_over(game)
+
+# once a deadline has passed by our clock the view is re-read this often until
+# the node agrees: its clock may lag ours, and an automining node mines no
+# block for a change that only depends on block.timestamp
+RECHECK = 1.0
+
+schedulers = {}
+
+
+def install(w3, setup, cr2, game, clock=None):
+    scheduler = Scheduler(w3, setup, cr2, game, clock)
+    schedulers[id(w3.provider)] = scheduler
+    return scheduler
+
+
+def get_scheduler(w3):
+    return schedulers.get(id(w3.provider))
+
+
+def wait_phase(contract, phase, args=(), timeout=None):
+    scheduler = get_scheduler(contract.w3)
+    deadline = None
+    if scheduler is not None and not args:
+        deadline = scheduler.phase_deadline(contract, phase)
+        timeout = scheduler.sleep_until(deadline, timeout)
+    if deadline is None:
+        return get_watcher(contract.w3).wait_phase(contract, phase, args, timeout)
+    return get_watcher(contract.w3).wait_phase(contract, phase, args, timeout, fresh=True, recheck=RECHECK)
+
+
+def wait_round_over(game, timeout=None):
+    scheduler = get_scheduler(game.w3)
+    deadline = None
+    if scheduler is not None:
+        deadline = scheduler.round_deadline()
+        timeout = scheduler.sleep_until(deadline, timeout)
+    if deadline is None:
+        return get_watcher(game.w3).wait(game, "playerRoundOver", lambda over: over, timeout=timeout)
+    return get_watcher(game.w3).wait(game, "playerRoundOver", lambda over: over, timeout=timeout, fresh=True, recheck=RECHECK)
+
+
+class Scheduler:
+    def __init__(self, w3, setup, cr2, game, clock=None):
+        self.w3 = w3
+        self.setup = setup
+        self.cr2 = cr2
+        self.game = game
+        (self.betting, self.crr, self.chain, self.cut, self.turn_timeout, self.round_duration) = read(
+            w3,
+            setup.functions.BETTING_DURATION(), setup.functions.CRR_DURATION(),
+            setup.functions.CHAIN_DURATION(), setup.functions.CUT_DURATION(),
+            cr2.functions.TURN_TIMEOUT(), game.functions.ROUND_DURATION(),
+        )
+        self.clock = clock or WallClock(w3)
+        self.round_id = None
+        self.start_time = None
+
+    def phase_deadline(self, contract, phase):
+        # chain timestamp at which `phase` starts, None if it is not time based
+        if contract.address == self.setup.address and 1 <= phase:
+            round_id, players = read(self.w3, self.setup.functions.id(), self.setup.functions.playerCount())
+            if round_id != self.round_id:
+                # (playerCount, startTime, anchor, cut, cutApplied, random)
+                self.start_time = self.setup.functions.games(round_id).call()[1]
+                self.round_id = round_id
+            # Setup.getPhase: the RNG window grows by TURN_TIMEOUT per player
+            starts = [
+                self.start_time + self.betting,
+                self.start_time + self.betting + self.crr + self.turn_timeout * players,
+                self.start_time + self.betting + self.crr + self.chain + self.turn_timeout * players,
+                self.start_time + self.betting + self.crr + self.chain + self.cut + self.turn_timeout * players,
+            ]
+            return starts[min(phase, len(starts)) - 1]
+        if contract.address == self.cr2.address and phase in (1, 2):
+            fn = self.cr2.functions.commitEndTime if phase == 1 else self.cr2.functions.reveal1EndTime
+            return fn().call()
+        return None
+
+    def round_deadline(self):
+        # (phaseStartTime, playerCount, roundId, cardCount, phase, ...)
+        game = self.game.functions.games(self.game.functions.gameId().call()).call()
+        return game[0] + self.round_duration if game[4] == 1 else None
+
+    def turn_deadline(self):
+        # skipStalledUser needs block.timestamp > lastTurnActionTime + TURN_TIMEOUT
+        return self.cr2.functions.lastTurnActionTime().call() + self.turn_timeout + 1
+
+    def remaining(self, deadline):
+        return deadline - self.clock.now()
+
+    def sleep_until(self, deadline, timeout=None):
+        # returns what is left of timeout for the confirming wait
+        if deadline is None:
+            return timeout
+        return self.clock.sleep_until(deadline, timeout)
+
+
+class WallClock:
+    def __init__(self, w3):
+        # local clock -> chain time; the node's clock may be skewed or
+        # warped (anvil), so it is measured instead of assumed
+        self.offset = w3.eth.get_block("latest")["timestamp"] - time.time()
+
+    def now(self):
+        return time.time() + self.offset
+
+    def sleep_until(self, deadline, timeout=None):
+        delay = deadline - self.now()
+        if timeout is not None:
+            delay = min(delay, timeout)
+        if delay > 0:
+            time.sleep(delay)
+            if timeout is not None:
+                timeout -= delay
+        return timeout
@@ -0,0 +1,79 @@
+from web3.logs import DISCARD
+from common.batch import read_each
+from common.schedule import get_scheduler
+from common.watcher import get_watcher
+from common.txpipe import send, confirm
+import os
+
+# Waiting for the own Reveal2 turn without a skipStalledUser storm. A turn is
+# stalled once block.timestamp > lastTurnActionTime + TURN_TIMEOUT; instead of
+# every waiting participant sending a skip, the waiting ones line up in
+# reveal order (dVal descending) behind the stalled revealer and each gets a
+# slot SKIP_BACKOFF seconds after the one before. Only the first whose slot
+# comes while the turn is still stuck sends the skip; it is confirmed through
+# the TurnSkipped event in its receipt, and a skip that found nothing to skip
+# doubles the wait before the next try. One stall costs one transaction.
+#
+#   skips = wait_turn(cr2, w3, me, order)    # returns once getCurrentRevealer() == me
+
+SKIP_BACKOFF = int(os.environ.get("SKIP_BACKOFF", 2))
+
+
+def chain_order(cr2):
+    # the order submitRevealOrder had to match, read back from the contract
+    addresses, dvals = cr2.functions.getParticipantsAndDVals().call()
+    return [a for a, d in sorted(zip(addresses, dvals), key=lambda p: p[1], reverse=True) if d > 0]
+
+
+def skip_rank(order, index, me):
+    # 0 for the next revealer; someone outside the order (e.g. the house when
+    # it is not revealing) queues up behind all of them
+    waiting = order[index + 1:]
+    return waiting.index(me) if me in waiting else len(waiting)
+
+
+def remaining(w3, scheduler, deadline):
+    # chain seconds until deadline, by the scheduler's clock or the latest block
+    if scheduler is not None:
+        return scheduler.remaining(deadline)
+    return deadline - w3.eth.get_block("latest")["timestamp"]
+
+
+def wait_turn(cr2, w3, me, order=None):
+    order = order or chain_order(cr2)
+    watcher = get_watcher(w3)
+    scheduler = get_scheduler(w3)
+    turn_timeout = cr2.functions.TURN_TIMEOUT().call()
+    skips = 0
+    stall, backoff = None, 0
+    while True:
+        current, index, last = read_each(
+            w3, cr2.functions.getCurrentRevealer(), cr2.functions.currentRevealIndex(), cr2.functions.lastTurnActionTime()
+        )
+        if isinstance(current, Exception):
+            # revealOrder is exhausted: our turn was skipped
+            raise Exception("reveal2 finished without our turn")
+        if current == me:
+            return skips
+        if (index, last) != stall:
+            stall, backoff = (index, last), 0
+
+        slot = last + turn_timeout + 1 + skip_rank(order, index, me) * SKIP_BACKOFF + backoff
+        try:
+            # a reveal or somebody else's skip moves the index first
+            watcher.wait(cr2, "currentRevealIndex", lambda i: i != index, timeout=max(0, remaining(w3, scheduler, slot)))
+            continue
+        except TimeoutError:
+            pass
+        if remaining(w3, scheduler, slot) > 0:
+            continue
+
+        receipt = confirm(w3, send(w3, cr2.functions.skipStalledUser()))
+        skipped = cr2.events.TurnSkipped().process_receipt(receipt, errors=DISCARD)
+        if skipped:
+            skips += 1
+            print("skipped stalled revealer", skipped[0]["args"]["participant"])
+        else:
+            # beaten to it in the same block, or the chain's clock was behind ours
+            backoff = max(SKIP_BACKOFF, backoff * 2)
+            print(f"skip reverted, backing off {backoff}s")
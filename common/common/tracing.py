@@ -0,0 +1,321 @@
+from web3.middleware import Web3Middleware
+from eth_utils import function_abi_to_4byte_selector
+from contextlib import contextmanager
+from collections import deque
+from common.bundle import ARTIFACTS
+import argparse
+import atexit
+import json
+import os
+import signal
+import threading
+import time
+import rlp
+
+# JSON-RPC tracing middleware. Every request that goes through the Web3 object
+# is kept in a ring buffer as (time, span, method, contract function, latency,
+# request/response bytes, outcome). The byte counts are the lengths the
+# provider encoded and received, nothing is serialized again for them (0 for
+# providers without a wire, like eth-tester). The span is whatever span()
+# block the calling thread is in, so requests can be broken down per round
+# phase. The buffer is written out as JSONL on exit and on SIGUSR1, and this
+# file's CLI turns a dump into a hot-call report or folded stacks for
+# flamegraph.pl.
+#
+#   tracer = Tracer()
+#   w3.middleware_onion.inject(TraceMiddlewareBuilder.build(tracer), layer=0)
+#   tracer.label(setup=setup, cr2=cr2)      # Setup.getPhase, CommitReveal2.getCurrentRevealer, ...
+#   tracer.dump_to(TRACE_FILE)
+#   with span("setup"): ...
+#
+#   python -m common.tracing rpc-trace.jsonl --top 20
+#   python -m common.tracing rpc-trace.jsonl --folded | flamegraph.pl > rpc.svg
+
+# empty: the house and the client don't trace
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+TRACE_SIZE = int(os.environ.get("TRACE_SIZE", 50_000))
+
+FIELDS = ("time", "span", "method", "function", "seconds", "sent", "received", "outcome")
+
+spans = threading.local()
+# byte counts of the request being traced on this thread
+wire = threading.local()
+
+
+@contextmanager
+def span(name):
+    stack = getattr(spans, "stack", None)
+    if stack is None:
+        stack = spans.stack = []
+    stack.append(name)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def current_span():
+    stack = getattr(spans, "stack", None)
+    # requests outside any span (e.g. the watcher thread) go under the thread's name
+    return ";".join(stack) if stack else threading.current_thread().name
+
+
+def selectors(**contracts):
+    # (address, 4-byte selector) -> "name.function" for the given contracts
+    names = {}
+    for name, contract in contracts.items():
+        for abi in contract.abi:
+            if abi.get("type") == "function":
+                names[(contract.address.lower(), bytes(function_abi_to_4byte_selector(abi)))] = f"{name}.{abi['name']}"
+    return names
+
+
+def to_bytes(value):
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+    return bytes(value or b"")
+
+
+def raw_target(raw):
+    # (to, data) of a signed transaction: legacy, EIP-2930 or EIP-1559
+    raw = to_bytes(raw)
+    if raw[0] >= 0xc0:
+        fields = rlp.decode(raw)
+        return fields[3], fields[5]
+    fields = rlp.decode(raw[1:])
+    if raw[0] == 1:
+        return fields[4], fields[6]
+    return fields[5], fields[7]
+
+
+def function_name(names, method, params):
+    try:
+        if method in ("eth_call", "eth_estimateGas", "eth_sendTransaction"):
+            call = params[0]
+            to, data = call.get("to"), call.get("data") or call.get("input")
+        elif method == "eth_sendRawTransaction":
+            to, data = raw_target(params[0])
+        else:
+            return ""
+        to = "0x" + to_bytes(to).hex() if not isinstance(to, str) else to
+        return names.get((to.lower(), to_bytes(data)[:4]), "")
+    except Exception:
+        return ""
+
+
+def count_bytes(provider):
+    # encode_batch_rpc_request encodes each request through encode_rpc_request,
+    # so a batch gets one length per request and one for the whole response
+    if getattr(provider, "count_bytes", False) or not hasattr(provider, "encode_rpc_request"):
+        return
+    encode, decode = provider.encode_rpc_request, provider.decode_rpc_response
+
+    def encode_rpc_request(method, params):
+        data = encode(method, params)
+        if getattr(wire, "sent", None) is not None:
+            wire.sent.append(len(data))
+        return data
+
+    def decode_rpc_response(raw_response):
+        response = decode(raw_response)
+        if getattr(wire, "received", None) is not None:
+            wire.received.append(len(raw_response))
+        return response
+
+    provider.encode_rpc_request = encode_rpc_request
+    provider.decode_rpc_response = decode_rpc_response
+    provider.count_bytes = True
+
+
+@contextmanager
+def counting():
+    # nested requests (e.g. a signing middleware asking for the nonce) count their own bytes
+    outer = getattr(wire, "sent", None), getattr(wire, "received", None)
+    wire.sent, wire.received = counts = [], []
+    try:
+        yield counts
+    finally:
+        wire.sent, wire.received = outer
+
+
+def outcome(response):
+    if not isinstance(response, dict):
+        return "ok"
+    error = response.get("error")
+    if error is None:
+        return "ok"
+    return f"error:{error.get('code', '')}" if isinstance(error, dict) else "error"
+
+
+class Tracer:
+    def __init__(self, size=TRACE_SIZE):
+        # deque.append is atomic, so the hot path takes no lock
+        self.records = deque(maxlen=size)
+        self.names = {}
+        # called with every record (e.g. recorder.py)
+        self.listeners = []
+
+    def label(self, **contracts):
+        # keys as in bundle.ARTIFACTS; labelled with the Solidity contract name
+        self.names.update(selectors(**{
+            os.path.basename(ARTIFACTS[key])[:-len(".json")]: contract for key, contract in contracts.items()
+        }))
+
+    def record(self, method, params, seconds, response, result=None, sent=0, received=0):
+        record = (
+            time.time(), current_span(), method, function_name(self.names, method, params),
+            seconds, sent, received, result or outcome(response),
+        )
+        self.records.append(record)
+        for listener in self.listeners:
+            listener(record)
+
+    def dump(self, path):
+        records = list(self.records)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            for record in records:
+                f.write(json.dumps(dict(zip(FIELDS, record))) + "\n")
+        os.replace(tmp, path)
+        return len(records)
+
+    def dump_to(self, path):
+        # on exit, and on `kill -USR1 <pid>` while running
+        atexit.register(self.dump, path)
+        if threading.current_thread() is threading.main_thread() and hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: print("rpc trace:", self.dump(path), "requests ->", path))
+
+
+class TraceMiddlewareBuilder(Web3Middleware):
+    tracer = None
+
+    @staticmethod
+    def build(tracer):
+        def builder(w3):
+            count_bytes(w3.provider)
+            middleware = TraceMiddlewareBuilder(w3)
+            middleware.tracer = tracer
+            return middleware
+        return builder
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            start = time.perf_counter()
+            with counting() as (sent, received):
+                try:
+                    response = make_request(method, params)
+                except Exception as e:
+                    self.tracer.record(
+                        method, params, time.perf_counter() - start, None, f"raise:{type(e).__name__}", sum(sent), sum(received)
+                    )
+                    raise
+            self.tracer.record(method, params, time.perf_counter() - start, response, None, sum(sent), sum(received))
+            return response
+
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests):
+            start = time.perf_counter()
+            error = None
+            with counting() as (sent, received):
+                try:
+                    responses = make_batch_request(requests)
+                except Exception as e:
+                    responses, error = None, e
+            # one round trip for all of them; each request gets an equal share
+            # of the time and of the response
+            seconds = (time.perf_counter() - start) / max(1, len(requests))
+            share = sum(received) // max(1, len(requests))
+            for i, (method, params) in enumerate(requests):
+                length = sent[i] if i < len(sent) else 0
+                if isinstance(responses, list) and i < len(responses):
+                    self.tracer.record(method, params, seconds, responses[i], None, length, share)
+                else:
+                    # a failed batch comes back as a single error object
+                    self.tracer.record(
+                        method, params, seconds, responses, error and f"raise:{type(error).__name__}", length, share
+                    )
+            if error is not None:
+                raise error
+            return responses
+
+        return middleware
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0
+
+
+def hot_calls(records, top):
+    calls = {}
+    for r in records:
+        calls.setdefault((r["method"], r["function"]), []).append(r)
+    total = sum(r["seconds"] for r in records) or 1
+    rows = sorted(calls.items(), key=lambda item: -sum(r["seconds"] for r in item[1]))[:top]
+    print(f"{'calls':>7} {'total s':>8} {'share':>6} {'p50 ms':>7} {'p99 ms':>7} {'KB out':>7} {'KB in':>7} {'errors':>6}  call")
+    for (method, function), rs in rows:
+        seconds = [r["seconds"] for r in rs]
+        errors = sum(r["outcome"] != "ok" for r in rs)
+        print(
+            f"{len(rs):>7} {sum(seconds):>8.2f} {sum(seconds) / total:>6.1%} "
+            f"{percentile(seconds, 0.5) * 1000:>7.1f} {percentile(seconds, 0.99) * 1000:>7.1f} "
+            f"{sum(r['sent'] for r in rs) / 1024:>7.1f} {sum(r['received'] for r in rs) / 1024:>7.1f} "
+            f"{errors:>6}  {method} {function}".rstrip()
+        )
+
+
+def by_span(records):
+    spans = {}
+    for r in records:
+        entry = spans.setdefault(r["span"], [0, 0.0])
+        entry[0] += 1
+        entry[1] += r["seconds"]
+    print(f"\n{'calls':>7} {'total s':>8}  span")
+    for name, (count, seconds) in sorted(spans.items(), key=lambda item: -item[1][1]):
+        print(f"{count:>7} {seconds:>8.2f}  {name}")
+
+
+def folded(records):
+    # flamegraph.pl / speedscope input, weighted by microseconds
+    stacks = {}
+    for r in records:
+        stack = ";".join([r["span"], r["method"]] + ([r["function"]] if r["function"] else []))
+        stacks[stack] = stacks.get(stack, 0) + r["seconds"]
+    for stack, seconds in sorted(stacks.items()):
+        print(f"{stack} {max(1, round(seconds * 1e6))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="summarize an RPC trace dump")
+    parser.add_argument("trace", nargs="?", default=TRACE_FILE or "rpc-trace.jsonl")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--span", help="only requests under this span prefix")
+    parser.add_argument("--folded", action="store_true", help="print folded stacks instead of the report")
+    args = parser.parse_args()
+
+    records = load(args.trace)
+    if args.span:
+        records = [r for r in records if r["span"].startswith(args.span)]
+    if args.folded:
+        folded(records)
+        return
+    if records:
+        duration = records[-1]["time"] - records[0]["time"]
+        print(f"{len(records)} requests over {duration:.0f}s ({len(records) / max(duration, 1):.1f}/s)\n")
+    hot_calls(records, args.top)
+    by_span(records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+# Node connection chosen by config instead of a hard-coded HTTPProvider.
+# RPC_URL picks the transport by its scheme:
+#   http(s)://...  HTTPProvider on a keep-alive requests.Session whose pool is
+#                  sized for the watcher, pipeline and reader threads
+#   ws(s)://...    one persistent WebSocket (WebSocketProvider below); requests
+#                  are multiplexed by id and eth_subscribe is supported, the
+#                  watcher wakes on newHeads instead of sleeping a poll interval
+#   a path         IPCProvider on a co-located node's socket (anvil --ipc, geth.ipc)
+# connect_async() picks web3's async provider for the same schemes
+# (AsyncHTTPProvider, the persistent WebSocketProvider and AsyncIPCProvider)
+# for the AsyncWeb3 house in tables.py.
+#
+#   w3 = connect()                       # RPC_URL, default http://127.0.0.1:8545
+#   w3 = connect("/tmp/anvil.ipc")
+#   w3 = await connect_async()           # AsyncWeb3
+#   python -m common.transport --calls 2000 http://127.0.0.1:8545 ws://127.0.0.1:8545 /tmp/anvil.ipc
+
+RPC_URL = os.environ.get("RPC_URL", "http://127.0.0.1:8545")
+RPC_POOL = int(os.environ.get("RPC_POOL", 16))
+RPC_TIMEOUT = float(os.environ.get("RPC_TIMEOUT", 10))
+
+
+def connect(url=RPC_URL):
+    return Web3(provider(url))
+
+
+def provider(url=RPC_URL):
+    if url.startswith(("http://", "https://")):
+        return http_provider(url)
+    if url.startswith(("ws://", "wss://")):
+        return WebSocketProvider(url)
+    return Web3.IPCProvider(url, timeout=RPC_TIMEOUT)
+
+
+def http_provider(url, pool=RPC_POOL, timeout=RPC_TIMEOUT):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    # one host, so one pool; its size bounds the parallel requests in flight
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return Web3.HTTPProvider(url, session=session, request_kwargs={"timeout": timeout})
+
+
+async def connect_async(url=RPC_URL):
+    from web3 import AsyncWeb3
+    from web3.providers.persistent import PersistentConnectionProvider
+
+    w3 = AsyncWeb3(async_provider(url))
+    # WebSocket and IPC hold one connection, opened here
+    if isinstance(w3.provider, PersistentConnectionProvider):
+        await w3.provider.connect()
+    return w3
+
+
+def async_provider(url=RPC_URL, timeout=RPC_TIMEOUT):
+    from web3 import AsyncWeb3, AsyncIPCProvider, WebSocketProvider as AsyncWebSocketProvider
+
+    if url.startswith(("http://", "https://")):
+        from aiohttp import ClientTimeout
+
+        return AsyncWeb3.AsyncHTTPProvider(url, request_kwargs={"timeout": ClientTimeout(total=timeout)})
+    if url.startswith(("ws://", "wss://")):
+        return AsyncWebSocketProvider(url, request_timeout=timeout)
+    return AsyncIPCProvider(url, request_timeout=timeout)
+
+
+def subscribe(w3, kind, callback, *params):
+    # eth_subscribe where the transport has it; returns False otherwise
+    fn = getattr(w3.provider, "subscribe", None)
+    if fn is None:
+        return False
+    fn(kind, callback, *params)
+    return True
+
+
+class WebSocketProvider(JSONBaseProvider):
+    # synchronous provider over a single WebSocket; a reader thread hands each
+    # response to the thread waiting on its id and subscription pushes to
+    # their callbacks. The connection is reopened (and the subscriptions
+    # renewed) on the next request after it drops.
+    def __init__(self, url, timeout=RPC_TIMEOUT):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.conn = None
+        # request id (first id for a batch) -> [event, response]
+        self.pending = {}
+        self.subscriptions = {}
+        self.wanted = []
+
+    def make_request(self, method, params):
+        request = self.encode_rpc_request(method, params)
+        return self._request(request, json.loads(request)["id"])
+
+    def make_batch_request(self, requests):
+        request = self.encode_batch_rpc_request(requests)
+        response = self._request(request, min(r["id"] for r in json.loads(request)))
+        if isinstance(response, list):
+            response.sort(key=lambda r: r.get("id", 0))
+        return response
+
+    def subscribe(self, kind, callback, *params):
+        response = self.make_request("eth_subscribe", [kind, *params])
+        if "error" in response:
+            raise Exception(f"eth_subscribe {kind}: {response['error']}")
+        self.subscriptions[response["result"]] = callback
+        if (kind, params, callback) not in self.wanted:
+            self.wanted.append((kind, params, callback))
+        return response["result"]
+
+    def is_connected(self, show_traceback=False):
+        try:
+            return "result" in self.make_request("web3_clientVersion", [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+
+    def _request(self, request, key):
+        conn, fresh = self._connect()
+        if fresh and self.wanted:
+            for kind, params, callback in self.wanted:
+                self.subscribe(kind, callback, *params)
+        slot = [threading.Event(), None]
+        with self.lock:
+            self.pending[key] = slot
+        try:
+            with self.send_lock:
+                conn.send(request.decode())
+            if not slot[0].wait(self.timeout):
+                raise TimeoutError(f"no response from {self.url} in {self.timeout}s")
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        if slot[1] is None:
+            raise ConnectionError(f"connection to {self.url} closed")
+        return slot[1]
+
+    def _connect(self):
+        from websockets.sync.client import connect
+
+        with self.lock:
+            if self.conn is not None:
+                return self.conn, False
+            self.conn = connect(self.url, open_timeout=self.timeout, max_size=None)
+            self.subscriptions = {}
+            threading.Thread(target=self._read, args=(self.conn,), name="ws-reader", daemon=True).start()
+            return self.conn, True
+
+    def _read(self, conn):
+        try:
+            for message in conn:
+                response = json.loads(message)
+                if isinstance(response, dict) and response.get("method") == "eth_subscription":
+                    callback = self.subscriptions.get(response["params"]["subscription"])
+                    if callback is not None:
+                        callback(response["params"]["result"])
+                    continue
+                key = min(r.get("id", 0) for r in response) if isinstance(response, list) else response.get("id")
+                with self.lock:
+                    slot = self.pending.get(key)
+                if slot is not None:
+                    slot[1] = response
+                    slot[0].set()
+        except Exception as e:
+            print("websocket closed:", e)
+        finally:
+            with self.lock:
+                if self.conn is conn:
+                    self.conn = None
+                # the waiters see a None response
+                for slot in self.pending.values():
+                    slot[0].set()
+
+
+# ---------------------------------------------------------
+# micro-benchmark
+# ---------------------------------------------------------
+
+def measure(url, calls, threads):
+    w3 = connect(url)
+    assert w3.is_connected(), f"{url} is not reachable"
+    samples = []
+    errors = []
+    samples_lock = threading.Lock()
+
+    def run(n):
+        mine = []
+        try:
+            for i in range(n):
+                start = time.perf_counter()
+                # the two calls the polling loops make most
+                if i % 2:
+                    w3.eth.block_number
+                else:
+                    w3.eth.get_balance("0x0000000000000000000000000000000000000000", "latest")
+                mine.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(e)
+        with samples_lock:
+            samples.extend(mine)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=run, args=(calls // threads,)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    samples.sort()
+    return {
+        "transport": type(w3.provider).__name__,
+        "calls": len(samples),
+        "threads": threads,
+        "p50_us": round(statistics.median(samples) * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99) - 1] * 1e6, 1),
+        "calls_per_s": round(len(samples) / wall, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-call latency of the RPC transports")
+    parser.add_argument("urls", nargs="*", default=[RPC_URL])
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    for url in args.urls:
+        try:
+            results[url] = measure(url, args.calls, args.threads)
+        except Exception as e:
+            results[url] = {"error": str(e)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import threading
+import time
+from common.watcher import get_watcher
+
+# Transaction pipeline with a locally tracked nonce. send() signs and
+# broadcasts right away and returns the hash without waiting for a receipt, so
+# back-to-back transactions (e.g. calculateIntermediateValues ->
+# submitRevealOrder) go out in the same block. confirm()/flush() resolve the
+# in-flight transactions together. A rejected broadcast resyncs the nonce from
+# the node, and a transaction that is not mined in time is replaced
+# (same nonce, bumped gas price).
+#
+#   pipe = install(w3, account)
+#   a = send(w3, cr2.functions.calculateIntermediateValues())
+#   b = send(w3, cr2.functions.submitRevealOrder(order))
+#   confirm(w3, a, b)
+
+DEFAULT_GAS = 3_000_000
+GAS_MARGIN = 1.5
+# their cost grows with players, cards, dealer draws or the remaining chain,
+# none of which shows in the arguments; estimated on every send
+ALWAYS_ESTIMATE = {"deal", "dealActions", "verifyAnchor"}
+PRICE_BUMP = 1.125  # nodes want >= +10% to replace a pending transaction
+PRICE_TTL = 5.0
+
+pipelines = {}
+
+
+def install(w3, account):
+    pipe = TxPipeline(w3, account)
+    pipelines[id(w3)] = pipe
+    return pipe
+
+
+def get_pipeline(w3):
+    return pipelines.get(id(w3))
+
+
+def send(w3, fn, tx=None):
+    pipe = get_pipeline(w3)
+    if pipe is None:
+        return fn.transact(tx or {})
+    return pipe.send(fn, tx)
+
+
+def confirm(w3, *hashes):
+    pipe = get_pipeline(w3)
+    if pipe is None:
+        found = get_watcher(w3).wait_receipts(hashes, timeout=120)
+        if len(found) < len(hashes):
+            raise TimeoutError(f"{len(hashes) - len(found)} transaction(s) not mined")
+        receipts = [found[h] for h in hashes]
+    else:
+        receipts = pipe.wait(*hashes)
+    return receipts[0] if len(receipts) == 1 else receipts
+
+
+def flush(w3):
+    # wait for everything still in flight; raises if any of it reverted
+    pipe = get_pipeline(w3)
+    if pipe is None:
+        return []
+    receipts = pipe.wait(*list(pipe.inflight))
+    failed = [r for r in receipts if r["status"] == 0]
+    if failed:
+        raise Exception(f"{len(failed)} pipelined transaction(s) reverted")
+    return receipts
+
+
+class TxPipeline:
+    def __init__(self, w3, account, timeout=120, replace_after=30):
+        self.w3 = w3
+        self.account = account
+        self.timeout = timeout
+        self.replace_after = replace_after
+        self.lock = threading.Lock()
+        self.nonce = None
+        self.chain_id = None
+        self.price = None
+        self.price_time = 0.0
+        self.gas = {}
+        self.inflight = {}
+        # called as listener(name, receipt, sent) for every mined transaction
+        self.listeners = []
+
+    def sync(self):
+        self.nonce = self.w3.eth.get_transaction_count(self.account.address, "pending")
+
+    def gas_price(self):
+        if self.price is None or time.monotonic() - self.price_time > PRICE_TTL:
+            self.price = self.w3.eth.gas_price
+            self.price_time = time.monotonic()
+        return self.price
+
+    def send(self, fn, tx=None):
+        tx = dict(tx or {})
+        name = fn.fn_name
+        with self.lock:
+            if self.nonce is None:
+                self.sync()
+                self.chain_id = self.w3.eth.chain_id
+            if "gas" not in tx:
+                tx["gas"] = self.gas.get(gas_key(fn)) or self._estimate(fn, tx)
+            params = fn.build_transaction({
+                **tx,
+                "from": self.account.address,
+                "nonce": self.nonce,
+                "chainId": self.chain_id,
+                "gasPrice": tx.get("gasPrice", self.gas_price()),
+            })
+            tx_hash = self._broadcast(params)
+            self.inflight[tx_hash] = {"params": params, "name": name, "key": gas_key(fn), "sent": time.monotonic()}
+            self.nonce += 1
+            return tx_hash
+
+    def _estimate(self, fn, tx):
+        try:
+            return int(fn.estimate_gas({**tx, "from": self.account.address}) * GAS_MARGIN)
+        except Exception:
+            # depends on a transaction that is still in flight
+            return DEFAULT_GAS
+
+    def _broadcast(self, params, resync=True):
+        signed = self.account.sign_transaction(params)
+        try:
+            return self.w3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            message = str(e).lower()
+            if resync and "nonce" in message:
+                # someone else used this account; take the node's view and retry once
+                self.sync()
+                params["nonce"] = self.nonce
+                signed = self.account.sign_transaction(params)
+                return self.w3.eth.send_raw_transaction(signed.raw_transaction)
+            if "already known" in message:
+                return signed.hash
+            # nothing was broadcast, so the nonce is still free
+            raise
+
+    def replace(self, tx_hash):
+        # same nonce, bumped price: the node keeps whichever gets mined
+        with self.lock:
+            entry = self.inflight[tx_hash]
+            params = dict(entry["params"])
+            params["gasPrice"] = int(params["gasPrice"] * PRICE_BUMP) + 1
+            try:
+                new_hash = self._broadcast(params, resync=False)
+            except Exception as e:
+                # most likely the original got mined in the meantime
+                print("replacing", entry["name"], "failed:", e)
+                entry["sent"] = time.monotonic()
+                return tx_hash
+            del self.inflight[tx_hash]
+            # either of the two can end up mined
+            previous = entry.get("previous", []) + [tx_hash]
+            self.inflight[new_hash] = {**entry, "params": params, "sent": time.monotonic(), "previous": previous}
+            print("replaced", entry["name"], "tx", tx_hash.hex(), "->", new_hash.hex())
+            return new_hash
+
+    def wait(self, *hashes):
+        # receipts come from the shared block tracker (watcher.py), one
+        # request per block for all in-flight transactions together
+        watcher = get_watcher(self.w3)
+        receipts = {}
+        current = {h: h for h in hashes}
+        deadline = time.monotonic() + self.timeout
+        while len(receipts) < len(current):
+            pending = [h for h in current.values() if h not in receipts]
+            # a replaced transaction may still be the one that gets mined
+            candidates = {}
+            for tx_hash in pending:
+                candidates[tx_hash] = tx_hash
+                for previous in self.inflight.get(tx_hash, {}).get("previous", []):
+                    candidates[previous] = tx_hash
+            now = time.monotonic()
+            if now > deadline:
+                raise TimeoutError(f"{len(pending)} transaction(s) not mined")
+            sent = [self.inflight[h]["sent"] for h in pending if h in self.inflight]
+            timeout = max(0.1, min(deadline, min(sent, default=now) + self.replace_after) - now)
+            found = watcher.wait_receipts(
+                list(candidates), timeout=timeout,
+                until=lambda found: {candidates[h] for h in found} >= set(pending),
+            )
+            for mined, receipt in found.items():
+                tx_hash = candidates[mined]
+                if tx_hash not in receipts:
+                    receipts[tx_hash] = receipt
+                    self._done(tx_hash, receipt)
+            for tx_hash in pending:
+                entry = self.inflight.get(tx_hash)
+                if tx_hash not in receipts and entry and time.monotonic() - entry["sent"] > self.replace_after:
+                    new_hash = self.replace(tx_hash)
+                    for h, c in current.items():
+                        if c == tx_hash:
+                            current[h] = new_hash
+        return [receipts[current[h]] for h in hashes]
+
+    def _done(self, tx_hash, receipt):
+        with self.lock:
+            entry = self.inflight.pop(tx_hash, None)
+        if entry is None:
+            return
+        for listener in self.listeners:
+            listener(entry["name"], receipt, entry["sent"])
+        key = entry["key"]
+        if key is None:
+            return
+        if receipt["status"] == 1:
+            # remember what this call shape needs so the next send skips eth_estimateGas
+            self.gas[key] = max(self.gas.get(key, 0), int(receipt["gasUsed"] * GAS_MARGIN))
+        else:
+            # reverted or ran out of gas; estimate again next time
+            self.gas.pop(key, None)
+
+
+def gas_key(fn):
+    # function name plus the length of every dynamic argument (e.g. the reveal
+    # order), None for the calls that are always estimated
+    if fn.fn_name in ALWAYS_ESTIMATE:
+        return None
+    return fn.fn_name, tuple(len(arg) if isinstance(arg, (list, tuple)) else None for arg in fn.args)
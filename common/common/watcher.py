@@ -0,0 +1,322 @@
+import threading
+import time
+from collections import Counter
+from common.batch import read_each, read_receipts
+from common.transport import subscribe
+from common.recorder import recorder
+
+# One PhaseWatcher per node connection. While anybody waits on it, a
+# background thread follows the chain head (one eth_blockNumber per poll, or
+# newHeads pushes where the transport has them) and, on every new block only,
+# drains the log filter of the watched contracts and re-reads all watched
+# views in a single batch request. Every waiter on a contract is woken from
+# that single upstream request instead of polling getPhase() on its own, and
+# with nobody waiting the thread sends nothing at all.
+#
+# The same thread tracks pending transactions: on every new block it fetches
+# the block's receipts in one call (eth_getBlockReceipts, or the block's
+# transaction list plus a batch of the matching receipts) and resolves every
+# waiter, so waiting costs O(blocks) requests instead of polling each hash.
+#
+# Views that move with block.timestamp alone (the time based phases) can
+# change on an idle node without a block; schedule.py sleeps until their
+# deadline and then asks for a fresh read, other waiters pass recheck.
+
+MISSING = object()
+
+watchers = {}
+watchers_lock = threading.Lock()
+
+
+def get_watcher(w3):
+    # keyed by provider so several Web3 objects sharing a connection share a watcher
+    key = id(w3.provider)
+    with watchers_lock:
+        if key not in watchers:
+            watchers[key] = PhaseWatcher(w3)
+        return watchers[key]
+
+
+class PhaseWatcher:
+    def __init__(self, w3, poll=0.5, max_logs=1024, push_timeout=5.0):
+        self.w3 = w3
+        self.poll = poll
+        self.max_logs = max_logs
+        # with newHeads pushed, the head is still checked this often in case
+        # the subscription was lost
+        self.push_timeout = push_timeout
+
+        self.cond = threading.Condition()
+        self.views = {}
+        self.contracts = {}
+        self.logs = []
+        self.block = None
+        # threads blocked in one of the wait methods; the loop idles at 0
+        self.waiting = 0
+
+        # tx hash -> receipt, None while pending; kept while any waiter holds it
+        self.receipts = {}
+        self.receipt_waiters = Counter()
+        self.receipt_block = None
+        self.block_receipts = True
+
+        self.log_filter = None
+        self.log_addresses = set()
+        self.thread = None
+        self.wake = threading.Event()
+        self.pushed = False
+
+    # ---------------------------------------------------------
+    # waiting
+    # ---------------------------------------------------------
+
+    def wait(self, contract, fn, done, args=(), timeout=None, fresh=False, recheck=None):
+        # fresh: read the view now even if another waiter already holds a value;
+        # recheck: seconds between own re-reads of a view that changes without blocks
+        key = (contract.address, fn, tuple(args))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            entry = self.views.get(key)
+            if entry is None:
+                entry = {"call": getattr(contract.functions, fn)(*args), "value": MISSING, "waiters": 0, "key": key, "read": 0.0}
+                self.views[key] = entry
+                # first waiter reads right away instead of waiting for the next block
+                fresh = True
+            entry["waiters"] += 1
+            self.contracts[contract.address] = contract
+            self._enter()
+        try:
+            if fresh:
+                self._refresh(entry)
+            while True:
+                with self.cond:
+                    while True:
+                        value = entry["value"]
+                        if value is not MISSING and done(value):
+                            return value
+                        now = time.monotonic()
+                        remaining = None if deadline is None else deadline - now
+                        if remaining is not None and remaining <= 0:
+                            raise TimeoutError(f"{fn} did not reach the expected value")
+                        if recheck is not None:
+                            due = entry["read"] + recheck - now
+                            if due <= 0:
+                                break
+                            remaining = due if remaining is None else min(remaining, due)
+                        self.cond.wait(remaining)
+                self._refresh(entry)
+        finally:
+            with self.cond:
+                entry["waiters"] -= 1
+                if entry["waiters"] == 0:
+                    del self.views[key]
+                self._leave()
+
+    def wait_phase(self, contract, phase, args=(), timeout=None, fresh=False, recheck=None):
+        return self.wait(contract, "getPhase", lambda p: p >= phase, args, timeout, fresh, recheck)
+
+    def wait_event(self, contract, name, from_block=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        event = getattr(contract.events, name)()
+        with self.cond:
+            self.contracts[contract.address] = contract
+            self._enter()
+            try:
+                while True:
+                    for log in self.logs:
+                        if log["address"] == contract.address and log["blockNumber"] >= from_block:
+                            try:
+                                return event.process_log(log)
+                            except Exception:
+                                continue
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"no {name} event")
+                    self.cond.wait(remaining)
+            finally:
+                self._leave()
+
+    def wait_block(self, timeout=None):
+        with self.cond:
+            self._enter()
+            try:
+                self.cond.wait_for(lambda: self.block is not None, timeout)
+                block = self.block
+                self.cond.wait_for(lambda: self.block != block, timeout)
+                return self.block
+            finally:
+                self._leave()
+
+    def wait_receipts(self, hashes, timeout=None, until=None):
+        # returns {hash: receipt} once all are mined (or until(found) holds),
+        # or whatever was found by the timeout
+        keys = [bytes(h) for h in hashes]
+        with self.cond:
+            new = [key for key in dict.fromkeys(keys) if key not in self.receipts]
+            for key in new:
+                self.receipts[key] = None
+            # several threads may wait on the same hash (e.g. confirm and flush)
+            self.receipt_waiters.update(keys)
+            self._enter()
+        try:
+            # mined before the tracker saw them; checked once, blocks take over after
+            for key in new:
+                try:
+                    receipt = self.w3.eth.get_transaction_receipt(key)
+                except Exception:
+                    continue
+                with self.cond:
+                    if key in self.receipts:
+                        self.receipts[key] = receipt
+            def found():
+                return {h: self.receipts[key] for h, key in zip(hashes, keys) if self.receipts[key] is not None}
+            until = until or (lambda receipts: len(receipts) == len(hashes))
+            with self.cond:
+                self.cond.wait_for(lambda: until(found()), timeout)
+                return found()
+        finally:
+            with self.cond:
+                self.receipt_waiters.subtract(keys)
+                for key in keys:
+                    if self.receipt_waiters[key] <= 0:
+                        self.receipt_waiters.pop(key, None)
+                        self.receipts.pop(key, None)
+                self._leave()
+
+    def _enter(self):
+        # called holding cond; wakes the loop if it was idle
+        self.waiting += 1
+        self._start()
+        self.cond.notify_all()
+
+    def _leave(self):
+        self.waiting -= 1
+
+    # ---------------------------------------------------------
+    # background loop
+    # ---------------------------------------------------------
+
+    def _start(self):
+        if self.thread is None:
+            try:
+                self.pushed = subscribe(self.w3, "newHeads", lambda head: self.wake.set())
+            except Exception as e:
+                print("newHeads subscription failed:", e)
+            self.thread = threading.Thread(target=self._run, name="phase-watcher", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                # nothing to follow while nobody waits; not a single request
+                self.cond.wait_for(lambda: self.waiting > 0)
+            self.wake.clear()
+            try:
+                self._watch_contracts()
+                changed = self._poll_head()
+                entries = []
+                if changed:
+                    self._poll_logs()
+                    self._poll_receipts()
+                    with self.cond:
+                        entries = list(self.views.values())
+                    started = time.monotonic()
+                    values = read_each(self.w3, *[entry["call"] for entry in entries])
+                    with self.cond:
+                        for entry, value in zip(entries, values):
+                            self._store(entry, value, started)
+                        self.cond.notify_all()
+                recorder.tick("poll", block=self.block, changed=changed, views=len(entries))
+            except Exception as e:
+                print("watcher error:", e)
+                # recreated on the next new block
+                self.log_filter = None
+                self.log_addresses = set()
+            self.wake.wait(self.push_timeout if self.pushed else self.poll)
+
+    def _refresh(self, entry):
+        # called without cond: the request must not hold up the other waiters,
+        # the block loop or the receipt tracking
+        started = time.monotonic()
+        value = self._call(entry)
+        with self.cond:
+            self._store(entry, value, started)
+            self.cond.notify_all()
+
+    def _store(self, entry, value, started):
+        # called holding cond; a read that started before the stored one is older
+        if started < entry["read"]:
+            return
+        # e.g. getCurrentRevealer reverts until the order is submitted
+        entry["value"] = MISSING if value is MISSING or isinstance(value, Exception) else value
+        entry["read"] = started
+        self._report(entry)
+
+    def _report(self, entry):
+        # phase changes into the round trace (see recorder.py)
+        address, fn, args = entry["key"]
+        if fn == "getPhase" and entry["value"] is not MISSING:
+            recorder.phase(address, entry["value"], args)
+
+    def _poll_head(self):
+        # True once per new block (or a different head after a node reset)
+        block = self.w3.eth.block_number
+        with self.cond:
+            changed = block != self.block
+            self.block = block
+        return changed
+
+    def _poll_logs(self):
+        # logs only ever come with a new block
+        if self.log_filter is not None:
+            logs = self.log_filter.get_new_entries()
+            if logs:
+                with self.cond:
+                    self.logs = (self.logs + list(logs))[-self.max_logs:]
+
+    def _watch_contracts(self):
+        # a request only when a contract was added; the old filter is drained first
+        with self.cond:
+            addresses = set(self.contracts)
+        if addresses and addresses != self.log_addresses:
+            self._poll_logs()
+            self.log_filter = self.w3.eth.filter({"address": sorted(addresses), "fromBlock": "latest"})
+            self.log_addresses = addresses
+
+    def _poll_receipts(self):
+        with self.cond:
+            pending = {key for key, receipt in self.receipts.items() if receipt is None}
+            start = self.block if self.receipt_block is None else self.receipt_block + 1
+            end = self.block
+        if not pending:
+            self.receipt_block = end
+            return
+        found = {}
+        # after a long stall only the recent blocks are scanned; anything older
+        # was mined before it was waited on and is looked up by wait_receipts
+        for number in range(max(start, end - 63), end + 1):
+            for receipt in self._block_receipts(number, pending):
+                key = bytes(receipt["transactionHash"])
+                if key in pending:
+                    found[key] = receipt
+        with self.cond:
+            for key, receipt in found.items():
+                if key in self.receipts:
+                    self.receipts[key] = receipt
+        self.receipt_block = end
+
+    def _block_receipts(self, number, pending):
+        if self.block_receipts:
+            try:
+                return self.w3.eth.get_block_receipts(number)
+            except Exception:
+                # not every node serves eth_getBlockReceipts
+                self.block_receipts = False
+        hashes = [h for h in self.w3.eth.get_block(number)["transactions"] if bytes(h) in pending]
+        return read_receipts(self.w3, hashes) if hashes else []
+
+    def _call(self, entry):
+        try:
+            return entry["call"].call()
+        except Exception:
+            return MISSING
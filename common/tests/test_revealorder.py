@@ -0,0 +1,113 @@
+from eth_hash.auto import keccak
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+from common.revealorder import RevealOrder, dvals, reveal_order
+import random
+
+CR2 = Web3.to_checksum_address("0x00000000000000000000000000000000000000c2")
+EVENTS = [
+    {"type": "event", "name": "CommitSubmitted", "anonymous": False, "inputs": [
+        {"name": "participant", "type": "address", "indexed": True},
+        {"name": "cv", "type": "bytes32", "indexed": False},
+    ]},
+    {"type": "event", "name": "Reveal1Submitted", "anonymous": False, "inputs": [
+        {"name": "participant", "type": "address", "indexed": True},
+        {"name": "co", "type": "bytes32", "indexed": False},
+    ]},
+]
+
+
+# CommitReveal2.calculateIntermediateValues
+def contract_dvals(participants):
+    # participants: [(address, cv, co or None)] in commit order
+    omega = int.from_bytes(keccak(b"".join(co for _, _, co in participants if co is not None)), "big")
+    values = {}
+    for address, cv, co in participants:
+        if co is not None:
+            diff = abs(omega - int.from_bytes(cv, "big"))
+            values[address] = int.from_bytes(keccak(diff.to_bytes(32, "big")), "big")
+    return values
+
+
+def participants(count, seed):
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        co = keccak(rng.randbytes(32))
+        address = Web3.to_checksum_address(rng.randbytes(20).hex())
+        # some never reveal
+        result.append((address, keccak(co), co if i % 4 != 3 else None))
+    return result
+
+
+def test_dvals_match_the_contract():
+    people = participants(12, 1)
+    commits = [(address, cv) for address, cv, _ in people]
+    reveals = {address: co for address, _, co in people if co is not None}
+    omega_v, values = dvals(commits, reveals)
+    assert omega_v == keccak(b"".join(co for _, _, co in people if co is not None))
+    assert values == contract_dvals(people)
+
+
+def test_nobody_revealed():
+    assert dvals([("0xA", keccak(b"a"))], {}) == (None, {})
+
+
+def test_reveal_order_is_dval_descending():
+    values = {f"0x{i:040x}": random.Random(i).getrandbits(256) for i in range(50)}
+    order = reveal_order(values)
+    assert sorted(order) == sorted(values)
+    # what submitRevealOrder checks: p.dVal <= lastDVal
+    assert all(values[a] >= values[b] for a, b in zip(order, order[1:]))
+
+
+class Eth:
+    def __init__(self, logs, block_number):
+        self.logs = logs
+        self.block_number = block_number
+        self.requests = []
+
+    def get_logs(self, params):
+        self.requests.append((params["fromBlock"], params["toBlock"]))
+        return [log for log in self.logs if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"]]
+
+
+def log(name, address, value, block, index):
+    topic = event_abi_to_log_topic(next(event for event in EVENTS if event["name"] == name))
+    return {
+        "address": CR2,
+        "topics": [topic, bytes(12) + bytes.fromhex(address[2:])],
+        "data": value,
+        "blockNumber": block,
+        "logIndex": index,
+        "transactionHash": keccak(bytes([block, index])),
+        "transactionIndex": 0,
+        "blockHash": keccak(bytes([block])),
+        "removed": False,
+    }
+
+
+def test_tracker_orders_from_bounded_log_requests():
+    people = participants(8, 2)
+    logs = []
+    for i, (address, cv, _) in enumerate(people):
+        logs.append(log("CommitSubmitted", address, cv, 10 + i, 0))
+    for i, (address, _, co) in enumerate(people):
+        if co is not None:
+            logs.append(log("Reveal1Submitted", address, co, 20 + i, 0))
+    # a reveal that doesn't open the commitment is rejected on-chain
+    logs.append(log("Reveal1Submitted", people[3][0], keccak(b"wrong"), 30, 0))
+
+    cr2 = Web3().eth.contract(address=CR2, abi=EVENTS)
+    tracker = RevealOrder(cr2, 10)
+    eth = Eth(logs, 24)
+    tracker.w3 = type("W3", (), {"eth": eth})()
+
+    tracker.load()
+    # the rest of the reveals arrive after load(); order() fetches only the new blocks
+    eth.block_number = 40
+    order = tracker.order()
+
+    assert eth.requests == [(10, 24), (25, 40)]
+    assert order == reveal_order(contract_dvals(people))
+    assert people[3][0] not in order
@@ -0,0 +1,139 @@
+from common import schedule
+from common.schedule import Scheduler, WallClock
+import pytest
+
+BETTING, CRR, CHAIN, CUT = 10, 10, 10, 10
+TURN_TIMEOUT = 5
+ROUND_DURATION = 40
+
+
+# Setup.getPhase at a given block.timestamp
+def setup_phase(timestamp, start, players):
+    turns = TURN_TIMEOUT * players
+    if timestamp < start + BETTING:
+        return 0
+    if timestamp < start + BETTING + CRR + turns:
+        return 1
+    if timestamp < start + BETTING + CRR + CHAIN + turns:
+        return 2
+    if timestamp < start + BETTING + CRR + CHAIN + CUT + turns:
+        return 3
+    return 4
+
+
+class Call:
+    def __init__(self, value):
+        self.value = value
+
+    def call(self, **kwargs):
+        return self.value
+
+
+class Functions:
+    def __init__(self, views):
+        self.views = views
+
+    def __getattr__(self, name):
+        value = self.views[name]
+        return lambda *args: Call(value(*args) if callable(value) else value)
+
+
+class Contract:
+    def __init__(self, address, **views):
+        self.address = address
+        self.functions = Functions(views)
+
+
+class Clock:
+    def __init__(self, now):
+        self.time = now
+
+    def now(self):
+        return self.time
+
+    def sleep_until(self, deadline, timeout=None):
+        self.time = max(self.time, deadline)
+        return timeout
+
+
+def scheduler(start=1_000, players=3, game_phase=1, phase_start=2_000):
+    setup = Contract(
+        "setup", BETTING_DURATION=BETTING, CRR_DURATION=CRR, CHAIN_DURATION=CHAIN, CUT_DURATION=CUT,
+        id=7, playerCount=players,
+        # (playerCount, startTime, anchor, cut, cutApplied, random)
+        games=lambda id: (players, start, b"", 0, False, b""),
+    )
+    cr2 = Contract("cr2", TURN_TIMEOUT=TURN_TIMEOUT, commitEndTime=start + 15, reveal1EndTime=start + 20)
+    game = Contract(
+        "game", ROUND_DURATION=ROUND_DURATION, gameId=7,
+        # (phaseStartTime, playerCount, roundId, cardCount, phase, ...)
+        games=lambda id: (phase_start, players, id, 0, game_phase),
+    )
+    # no batch_requests: read() falls back to one call per view
+    return Scheduler(object(), setup, cr2, game, clock=Clock(0)), setup, cr2, game
+
+
+@pytest.mark.parametrize("players", [0, 1, 4])
+@pytest.mark.parametrize("start", [1_000, 1_700_000_123])
+def test_setup_deadlines_match_get_phase(players, start):
+    sched, setup, _, _ = scheduler(start, players)
+    for phase in range(1, 5):
+        deadline = sched.phase_deadline(setup, phase)
+        assert setup_phase(deadline - 1, start, players) == phase - 1
+        assert setup_phase(deadline, start, players) == phase
+
+
+def test_betting_and_untimed_phases_have_no_deadline():
+    sched, setup, cr2, _ = scheduler()
+    assert sched.phase_deadline(setup, 0) is None
+    assert sched.phase_deadline(cr2, 3) is None
+    assert sched.phase_deadline(Contract("controller"), 1) is None
+
+
+def test_commit_reveal_deadlines():
+    sched, _, cr2, _ = scheduler(start=1_000)
+    assert sched.phase_deadline(cr2, 1) == 1_015
+    assert sched.phase_deadline(cr2, 2) == 1_020
+
+
+def test_round_deadline_only_in_the_player_round():
+    sched, _, _, _ = scheduler(game_phase=1, phase_start=2_000)
+    assert sched.round_deadline() == 2_000 + ROUND_DURATION
+    sched, _, _, _ = scheduler(game_phase=2)
+    assert sched.round_deadline() is None
+
+
+def test_wait_phase_sleeps_to_the_deadline_then_asks_fresh(monkeypatch):
+    sched, setup, _, _ = scheduler(start=1_000, players=2)
+    setup.w3 = type("W3", (), {"provider": object()})()
+    monkeypatch.setitem(schedule.schedulers, id(setup.w3.provider), sched)
+    asked = []
+
+    class Watcher:
+        def wait_phase(self, contract, phase, args=(), timeout=None, fresh=False, recheck=None):
+            asked.append((phase, fresh, recheck, sched.clock.now()))
+            return phase
+
+    monkeypatch.setattr(schedule, "get_watcher", lambda w3: Watcher())
+    assert schedule.wait_phase(setup, 2) == 2
+    assert asked == [(2, True, schedule.RECHECK, 1_000 + BETTING + CRR + TURN_TIMEOUT * 2)]
+
+
+def test_wall_clock_sleep_keeps_the_rest_of_the_timeout(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(schedule.time, "time", lambda: now[0])
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(schedule.time, "sleep", sleep)
+    w3 = type("W3", (), {"eth": type("Eth", (), {"get_block": lambda self, block: {"timestamp": 1_100}})()})()
+    clock = WallClock(w3)
+    assert clock.now() == 1_100
+    assert clock.sleep_until(1_104, timeout=10) == 6
+    assert clock.now() == 1_104
+    # the timeout caps the sleep
+    assert clock.sleep_until(1_200, timeout=3) == 0
+    assert clock.now() == 1_107
+    # a deadline in the past doesn't sleep
+    assert clock.sleep_until(1_000) is None
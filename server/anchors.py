@@ -0,0 +1,147 @@
+from eth_hash.auto import keccak
+from eth_utils import function_abi_to_4byte_selector
+from web3 import Web3
+from common.batch import read
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+
+# Offline check of Verify.verifyAnchor: keccak(initialRandom, salt) hashed
+# `length` more times has to equal the game's final anchor. Historical rounds
+# are checked in a process pool, and the house runs preflight() before
+# sending verifyAnchor so a transaction that would revert is never paid for.
+#
+# Verify logs nothing, so the verifyAnchor transactions are looked up in
+# the few blocks after each game's last CardPlayed (one eth_getLogs for the
+# range) until the verify period opened by verifyGame is over, instead of
+# reading every block of the range. Helper declares DealerResult but never
+# emits it, so a game ends at its last card before the next GameCreated.
+#
+#   python anchors.py --from-block 0          # every verifyAnchor sent so far
+#   python anchors.py --rounds rounds.jsonl   # {"round", "random", "salt", "length", "anchor"} per line
+
+CONTROLLER = os.environ.get("CONTROLLER", "0x5FbDB2315678afecb367f032d93F642f64180aa3")
+# Verify.VERIFY_DURATION, private in the contract
+VERIFY_DURATION = 30
+CARD_PLAYED = bytes(Web3.keccak(text="CardPlayed(bytes32,(uint8,uint8),address,uint256)"))
+GAME_CREATED = bytes(Web3.keccak(text="GameCreated(uint256)"))
+
+
+def walk(random, salt, length):
+    link = keccak(random + salt)
+    for _ in range(length):
+        link = keccak(link)
+    return link
+
+
+def check(round):
+    # runs in the worker processes; takes and returns plain data
+    computed = walk(bytes.fromhex(round["random"]), bytes.fromhex(round["salt"]), round["length"])
+    return round["round"], computed.hex() == round["anchor"], computed.hex()
+
+
+def verify_all(rounds, workers=None):
+    rounds = list(rounds)
+    if len(rounds) < 64:
+        return [check(round) for round in rounds]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(check, rounds, chunksize=max(1, len(rounds) // (4 * (workers or os.cpu_count() or 1)))))
+
+
+def preflight_check(random, anchor, open, salt, length):
+    if not open:
+        return "verify period is over"
+    if walk(random, salt, length) != anchor:
+        return "final anchor does not match the chain"
+    return None
+
+
+def preflight(verify, setup, game, w3, id, salt, length):
+    # None if verifyAnchor(id, salt, length) would pass, else the reason it wouldn't
+    random, anchor, phase = read(
+        w3, setup.functions.getFinalRandom(), game.functions.getAnchor(), verify.functions.getPhase(id)
+    )
+    return preflight_check(random, anchor, phase == 0, salt, length)
+
+
+def game_ends(w3, game, from_block, to_block):
+    # (block of the last CardPlayed, block of the next GameCreated) per game;
+    # a game's logs are the CardPlayed logs after its GameCreated
+    logs = w3.eth.get_logs({
+        "address": game.address, "fromBlock": from_block, "toBlock": to_block,
+        "topics": [[CARD_PLAYED, GAME_CREATED]],
+    })
+    games = []
+    last = None
+    for log in sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"])):
+        if bytes(log["topics"][0]) == GAME_CREATED:
+            if last is not None:
+                games.append((last, log["blockNumber"]))
+            last = None
+        else:
+            last = log["blockNumber"]
+    if last is not None:
+        games.append((last, to_block + 1))
+    return games
+
+
+def history(w3, controller, verify, setup, game, from_block, to_block):
+    # rounds from the verifyAnchor transactions in a block range; random and
+    # anchor are read at the transaction's block (needs an archive node)
+    selectors = {
+        (controller.address, bytes(function_abi_to_4byte_selector(controller.get_function_by_name("verifyGame").abi))): "verifyGame",
+        (verify.address, bytes(function_abi_to_4byte_selector(verify.get_function_by_name("verifyAnchor").abi))): "verifyAnchor",
+    }
+    for end, next_game in game_ends(w3, game, from_block, to_block):
+        deadline = None
+        for number in range(end, min(next_game, to_block + 1)):
+            block = w3.eth.get_block(number, full_transactions=True)
+            if deadline is not None and block["timestamp"] > deadline:
+                break
+            for tx in block["transactions"]:
+                name = selectors.get((tx["to"], bytes(tx["input"][:4])))
+                if name == "verifyGame" and deadline is None:
+                    deadline = block["timestamp"] + VERIFY_DURATION
+                if name != "verifyAnchor":
+                    continue
+                fn, args = verify.decode_function_input(tx["input"])
+                yield {
+                    "round": args["_id"],
+                    "random": bytes(setup.functions.getFinalRandom().call(block_identifier=number)).hex(),
+                    "salt": bytes(args["salt"]).hex(),
+                    "length": args["length"],
+                    "anchor": bytes(game.functions.getAnchor().call(block_identifier=number)).hex(),
+                    "tx": tx["hash"].hex(),
+                }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="verify round anchors offline")
+    parser.add_argument("--rounds", help="JSONL file of rounds instead of reading the chain")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--to-block", type=int)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    if args.rounds:
+        with open(args.rounds) as f:
+            rounds = [json.loads(line) for line in f if line.strip()]
+    else:
+        from common.transport import RPC_URL, connect
+        from common.bundle import load_contracts
+        w3 = connect(RPC_URL)
+        assert w3.is_connected(), "Node is not running!"
+        controller, setup, cr2, game, verify = load_contracts(w3, CONTROLLER)
+        to_block = w3.eth.block_number if args.to_block is None else args.to_block
+        rounds = list(history(w3, controller, verify, setup, game, args.from_block, to_block))
+
+    results = verify_all(rounds, args.workers)
+    failed = [(round, computed) for (round, ok, computed) in results if not ok]
+    for round, computed in failed:
+        print(f"round {round}: verifyAnchor would fail (computed {computed})")
+    print(f"{len(results)} rounds checked, {len(failed)} failing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+import asyncio
+import time
+from web3.logs import DISCARD
+from cr2 import generate, new_commit
+from anchors import preflight_check
+from journal import NULL_LOG
+from metrics import SKIPS
+from common.revealorder import RevealOrder, reveal_order
+from common.schedule import RECHECK
+from common.skipper import SKIP_BACKOFF, skip_rank
+from common.txpipe import DEFAULT_GAS, GAS_MARGIN, gas_key
+
+# asyncio versions of setupExec / crr / gameExec / verifyExec for AsyncWeb3.
+# The phase logic is the same as in cr2.py, game.py and verify.py; waiting on
+# phases, reveal turns and receipts only suspends the coroutine, so several of
+# them can run in one process without threads.
+
+
+class AsyncPhaseWatcher:
+    # common/watcher.py on AsyncWeb3: while anybody waits, the block filter is
+    # polled and the watched views are re-read on every new block only; with
+    # nobody waiting nothing is sent. Views that move with block.timestamp
+    # alone are re-read by their own waiters, every `recheck` seconds.
+    def __init__(self, w3, poll=0.25):
+        self.w3 = w3
+        self.poll = poll
+        self.cond = asyncio.Condition()
+        self.views = {}
+        self.block = None
+        self.block_filter = None
+        self.task = None
+        self.waiting = 0
+        # tx hash -> receipt, None while pending; resolved per block (see common/watcher.py)
+        self.receipts = {}
+        self.receipt_block = None
+        self.block_receipts = True
+
+    async def wait(self, contract, fn, done, args=(), timeout=None, recheck=None):
+        key = (contract.address, fn, tuple(args))
+        entry = self.views.get(key)
+        if entry is None:
+            entry = {"call": getattr(contract.functions, fn)(*args), "value": None, "ok": False, "waiters": 0}
+            self.views[key] = entry
+            await self._read([entry])
+        entry["waiters"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        try:
+            await self._enter()
+            while True:
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError(f"{fn} did not reach the expected value")
+                if recheck is not None:
+                    remaining = recheck if remaining is None else min(remaining, recheck)
+                try:
+                    async with self.cond:
+                        await asyncio.wait_for(
+                            self.cond.wait_for(lambda: entry["ok"] and done(entry["value"])), remaining
+                        )
+                    return entry["value"]
+                except asyncio.TimeoutError:
+                    if recheck is None:
+                        raise
+                # re-read outside the condition, like the block loop
+                await self._read([entry])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0:
+                del self.views[key]
+            self.waiting -= 1
+
+    async def wait_phase(self, contract, phase, args=(), timeout=None, recheck=None):
+        return await self.wait(contract, "getPhase", lambda p: p >= phase, args, timeout, recheck)
+
+    async def wait_block(self, timeout=None):
+        try:
+            await self._enter()
+            async with self.cond:
+                await asyncio.wait_for(self.cond.wait_for(lambda: self.block is not None), timeout)
+                block = self.block
+                await asyncio.wait_for(self.cond.wait_for(lambda: self.block > block), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.waiting -= 1
+        return self.block
+
+    async def wait_receipt(self, tx_hash, timeout=None):
+        key = bytes(tx_hash)
+        if key not in self.receipts:
+            self.receipts[key] = None
+            # mined before the tracker saw it
+            try:
+                self.receipts[key] = await self.w3.eth.get_transaction_receipt(tx_hash)
+            except Exception:
+                pass
+        try:
+            await self._enter()
+            async with self.cond:
+                await asyncio.wait_for(self.cond.wait_for(lambda: self.receipts[key] is not None), timeout)
+            return self.receipts[key]
+        finally:
+            self.receipts.pop(key, None)
+            self.waiting -= 1
+
+    async def _enter(self):
+        # counted before the first await, so the caller's finally always undoes it;
+        # wakes the loop if it was idle
+        self.waiting += 1
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        async with self.cond:
+            self.cond.notify_all()
+
+    async def _run(self):
+        while True:
+            async with self.cond:
+                # nothing to follow while nobody waits; not a single request
+                await self.cond.wait_for(lambda: self.waiting > 0)
+            try:
+                if self.block_filter is None:
+                    self.block_filter = await self.w3.eth.filter("latest")
+                    self.block = await self.w3.eth.block_number
+                if await self.block_filter.get_new_entries():
+                    self.block = await self.w3.eth.block_number
+                    await self._poll_receipts()
+                    await self._read(list(self.views.values()))
+                    async with self.cond:
+                        self.cond.notify_all()
+            except Exception as e:
+                print("watcher error:", e)
+                # recreated on the next poll
+                self.block_filter = None
+            await asyncio.sleep(self.poll)
+
+    async def _poll_receipts(self):
+        pending = {key for key, receipt in self.receipts.items() if receipt is None}
+        start = self.block if self.receipt_block is None else self.receipt_block + 1
+        if pending:
+            for number in range(max(start, self.block - 63), self.block + 1):
+                for receipt in await self._block_receipts(number, pending):
+                    key = bytes(receipt["transactionHash"])
+                    if key in pending and key in self.receipts:
+                        self.receipts[key] = receipt
+        self.receipt_block = self.block
+
+    async def _block_receipts(self, number, pending):
+        if self.block_receipts:
+            try:
+                return await self.w3.eth.get_block_receipts(number)
+            except Exception:
+                self.block_receipts = False
+        block = await self.w3.eth.get_block(number)
+        hashes = [h for h in block["transactions"] if bytes(h) in pending]
+        if len(hashes) > 1:
+            try:
+                async with self.w3.batch_requests() as batch:
+                    for tx_hash in hashes:
+                        batch.add(self.w3.eth.get_transaction_receipt(tx_hash))
+                    return await batch.async_execute()
+            except Exception:
+                pass
+        return await asyncio.gather(*[self.w3.eth.get_transaction_receipt(h) for h in hashes])
+
+    async def _read(self, entries):
+        if not entries:
+            return
+        values = await read_each(self.w3, *[entry["call"] for entry in entries])
+        for entry, value in zip(entries, values):
+            entry["ok"] = not isinstance(value, Exception)
+            entry["value"] = value
+
+
+watchers = {}
+
+
+def get_watcher(w3):
+    key = id(w3.provider)
+    if key not in watchers:
+        watchers[key] = AsyncPhaseWatcher(w3)
+    return watchers[key]
+
+
+async def read(w3, *calls):
+    results = await read_each(w3, *calls)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+async def read_each(w3, *calls):
+    if len(calls) > 1:
+        try:
+            async with w3.batch_requests() as batch:
+                for call in calls:
+                    batch.add(call)
+                return await batch.async_execute()
+        except Exception:
+            pass
+
+    async def one(call):
+        try:
+            return await call.call()
+        except Exception as e:
+            return e
+
+    return await asyncio.gather(*[one(call) for call in calls])
+
+
+# called as listener(name, receipt, sent) for every transaction transact()
+# saw mined, like TxPipeline.listeners (e.g. metrics.record_tx)
+listeners = []
+pipelines = {}
+send_locks = {}
+
+
+def install(w3, account):
+    pipe = AsyncTxPipeline(w3, account)
+    pipelines[id(w3)] = pipe
+    return pipe
+
+
+class AsyncTxPipeline:
+    # the nonce and gas handling of common/txpipe.py on AsyncWeb3: the nonce is
+    # counted locally instead of asked for on every send, gas limits are cached
+    # per call shape once a transaction with that shape succeeded
+    def __init__(self, w3, account):
+        self.w3 = w3
+        self.account = account
+        self.lock = asyncio.Lock()
+        self.nonce = None
+        self.chain_id = None
+        self.gas = {}
+
+    async def sync(self):
+        self.nonce = await self.w3.eth.get_transaction_count(self.account.address, "pending")
+
+    async def send(self, fn, tx=None):
+        tx = dict(tx or {})
+        async with self.lock:
+            if self.nonce is None:
+                await self.sync()
+                self.chain_id = await self.w3.eth.chain_id
+            if "gas" not in tx:
+                tx["gas"] = self.gas.get(gas_key(fn)) or await self._estimate(fn, tx)
+            params = await fn.build_transaction({
+                **tx,
+                "from": self.account.address,
+                "nonce": self.nonce,
+                "chainId": self.chain_id,
+            })
+            tx_hash = await self._broadcast(params)
+            self.nonce += 1
+            return tx_hash
+
+    async def _estimate(self, fn, tx):
+        try:
+            return int(await fn.estimate_gas({**tx, "from": self.account.address}) * GAS_MARGIN)
+        except Exception:
+            return DEFAULT_GAS
+
+    async def _broadcast(self, params):
+        signed = self.account.sign_transaction(params)
+        try:
+            return await self.w3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            message = str(e).lower()
+            if "nonce" in message:
+                # someone else used this account; take the node's view and retry once
+                await self.sync()
+                params["nonce"] = self.nonce
+                signed = self.account.sign_transaction(params)
+                return await self.w3.eth.send_raw_transaction(signed.raw_transaction)
+            if "already known" in message:
+                return signed.hash
+            raise
+
+    def done(self, fn, receipt):
+        key = gas_key(fn)
+        if key is not None and receipt["status"] == 1:
+            self.gas[key] = max(self.gas.get(key, 0), int(receipt["gasUsed"] * GAS_MARGIN))
+
+
+async def send(w3, fn, tx=None):
+    pipe = pipelines.get(id(w3))
+    if pipe is not None:
+        return await pipe.send(fn, tx)
+    # the signing middleware picks the "pending" nonce, so sends from the same
+    # account (e.g. several tables) are serialized; receipts are awaited in parallel
+    lock = send_locks.setdefault(id(w3), asyncio.Lock())
+    async with lock:
+        return await fn.transact(tx or {})
+
+
+async def transact(w3, fn, tx=None):
+    sent = time.monotonic()
+    tx_hash = await send(w3, fn, tx)
+    receipt = await get_watcher(w3).wait_receipt(tx_hash, timeout=120)
+    pipe = pipelines.get(id(w3))
+    if pipe is not None:
+        pipe.done(fn, receipt)
+    for listener in listeners:
+        listener(fn.fn_name, receipt, sent)
+    return receipt
+
+
+async def waitForStage(contract,_phase, name, recheck=None):
+    phase = await get_watcher(contract.w3).wait_phase(contract, _phase, recheck=recheck)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
+
+
+# ---------------------------------------------------------
+# Setup (cr2.py)
+# ---------------------------------------------------------
+
+async def setupExec(setup,cr2,ctl,w3,user,registrar, salt, log=NULL_LOG, start_block=None):
+    if log.get("salt"):
+        salt = int(log.get("salt")["salt"], 16)
+    else:
+        log.record("salt", salt=hex(salt))
+
+    await waitForStage(setup,1,"rng",RECHECK)
+
+    count = await setup.functions.playerCount().call()
+    if count == 0:
+        print("no players joined :(")
+        return
+
+    if log.get("start"):
+        start_block = log.get("start")["block"]
+    random = await crr(cr2,w3,user,registrar,log,start_block)
+
+    await waitForStage(setup,2,"chain",RECHECK)
+
+    # long chains take a while to hash; keep the event loop free meanwhile
+    chain = await asyncio.to_thread(generate, random, salt)
+    log.record("chain", length=len(chain) - 1)
+    print("submitting",chain[len(chain)-1])
+    await transact(w3, setup.functions.submitChain(chain[len(chain)-1]))
+
+    await waitForStage(setup,4,"cut chain",RECHECK)
+
+    cut, blkchain = await read(w3, setup.functions.getCut(), setup.functions.anchor())
+    if blkchain != chain[len(chain)-1]:
+        raise Exception("on-chain anchor does not match the submitted chain")
+    chain = chain[:len(chain)-cut]
+    print("new chain",chain[len(chain)-1])
+    log.record("cut", length=len(chain))
+
+    await transact(w3, setup.functions.revealCutChain(chain[len(chain)-1]))
+    return chain, salt, random
+
+
+async def crr(cr2,w3,user,registrar, log=NULL_LOG, start_block=None):
+    commit = log.get("commit")
+    if commit:
+        s, co, cv = (bytes.fromhex(commit[k]) for k in ("s", "co", "cv"))
+    else:
+        s, co, cv = new_commit()
+        # written before the commit goes out: without s we could never reveal2
+        log.record("commit", s=s.hex(), co=co.hex(), cv=cv.hex())
+
+    # (registered, cv, co, s, dVal, revealed1, revealed2, deposit); only
+    # differs from the empty participant when resuming a journaled round
+    me = await cr2.functions.getParticipant().call()
+
+    await waitForStage(cr2,0,"commit")
+    if not me[0]:
+        print("Submitting commit...")
+        await transact(w3, cr2.functions.commit(cv), {"value": w3.to_wei(0.1, "ether")})
+
+    await waitForStage(cr2,1,"reveal1",RECHECK)
+    if not me[5]:
+        print("Submitting Reveal1...")
+        await transact(w3, cr2.functions.reveal1(co))
+
+    # commits and reveals so far, while there is time (see common/revealorder.py)
+    tracker = None
+    order = None
+    if start_block is not None:
+        try:
+            tracker = RevealOrder(cr2, start_block)
+            await load_order(w3, tracker)
+        except Exception as e:
+            print("can't compute the reveal order locally:", e)
+            tracker = None
+
+    phase = await get_watcher(w3).wait_phase(cr2, 2, recheck=RECHECK)
+    print(f"✅ Now in order OrderCalculation!2<=id:{phase}")
+
+    if phase == 2 and tracker is not None:
+        # submitRevealOrder runs calculateIntermediateValues itself
+        await load_order(w3, tracker)
+        order = tracker.loaded_order()
+        print(f"Sorted {len(order)} addresses locally.")
+        if order and (await transact(w3, cr2.functions.submitRevealOrder(order)))["status"] == 1:
+            phase = 3
+        else:
+            # someone else submitted first
+            print("local reveal order rejected")
+            order = None
+            phase = await cr2.functions.getPhase().call()
+
+    if phase == 2:
+        await transact(w3, cr2.functions.calculateIntermediateValues())
+        order = await chain_order(cr2)
+        print(f"Sorted {len(order)} addresses for submission.")
+        await transact(w3, cr2.functions.submitRevealOrder(order))
+
+    phase = await get_watcher(w3).wait_phase(cr2, 3)
+    print(f"✅ Now in Reveal2!3<=id:{phase}")
+
+    if phase == 3 and not me[6]:
+        # stalled revealers ahead of us are skipped by one elected waiter (see common/skipper.py)
+        SKIPS.inc(amount=await wait_turn(cr2, w3, user.address, order))
+        print("your turn!")
+        print("Submitting Reveal2...")
+        await transact(w3, cr2.functions.reveal2(s))
+
+    final_randomness = await cr2.functions.omega_o().call()
+    print(final_randomness)
+    log.record("random", random=final_randomness.hex())
+    return final_randomness
+
+
+async def load_order(w3, tracker):
+    # RevealOrder.load on AsyncWeb3
+    end = await w3.eth.block_number
+    params = tracker.query(end)
+    if params is not None:
+        tracker.add(await w3.eth.get_logs(params), end)
+
+
+async def chain_order(cr2):
+    # the order submitRevealOrder had to match, read back from the contract
+    addresses, dvals = await cr2.functions.getParticipantsAndDVals().call()
+    return reveal_order({address: dval for address, dval in zip(addresses, dvals) if dval > 0})
+
+
+async def wait_turn(cr2, w3, me, order=None):
+    # common/skipper.wait_turn: returns the skips sent once getCurrentRevealer()
+    # is me, raises once our turn can't come anymore
+    order = order or await chain_order(cr2)
+    if me not in order:
+        raise Exception("not in the reveal order")
+    watcher = get_watcher(w3)
+    turn_timeout = await cr2.functions.TURN_TIMEOUT().call()
+    # chain time by the local clock, as common/schedule.WallClock
+    offset = (await w3.eth.get_block("latest"))["timestamp"] - time.time()
+    skips = 0
+    stall, backoff = None, 0
+    while True:
+        current, index, last = await read_each(
+            w3, cr2.functions.getCurrentRevealer(), cr2.functions.currentRevealIndex(), cr2.functions.lastTurnActionTime()
+        )
+        if isinstance(current, Exception):
+            # revealOrder is exhausted: Reveal2 is over
+            raise Exception("reveal2 finished without our turn")
+        if current == me:
+            return skips
+        if order.index(me) < index:
+            raise Exception("our reveal2 turn was skipped")
+        if (index, last) != stall:
+            stall, backoff = (index, last), 0
+
+        slot = last + turn_timeout + 1 + skip_rank(order, index, me) * SKIP_BACKOFF + backoff
+        try:
+            # a reveal or somebody else's skip moves the index first
+            await watcher.wait(cr2, "currentRevealIndex", lambda i: i != index,
+                               timeout=max(0, slot - time.time() - offset))
+            continue
+        except asyncio.TimeoutError:
+            pass
+        if slot - time.time() - offset > 0:
+            continue
+
+        receipt = await transact(w3, cr2.functions.skipStalledUser())
+        skipped = cr2.events.TurnSkipped().process_receipt(receipt, errors=DISCARD)
+        if skipped:
+            skips += 1
+            print("skipped stalled revealer", skipped[0]["args"]["participant"])
+        else:
+            # beaten to it in the same block, or the chain's clock was behind ours
+            backoff = max(SKIP_BACKOFF, backoff * 2)
+            print(f"skip reverted, backing off {backoff}s")
+
+
+# ---------------------------------------------------------
+# Game (game.py)
+# ---------------------------------------------------------
+
+async def gameExec(game,ctl,w3, chain,salt,random, log=NULL_LOG):
+    # the top link is the current on-chain anchor, the next one down reveals it
+    if await get_watcher(w3).wait_phase(game, 0) == 0:
+        await reveal(w3, game.functions.deal, chain, log)
+        print("dealt cards")
+
+    while await game.functions.getPhase().call() < 3:
+        await get_watcher(w3).wait(game, "playerRoundOver", lambda over: over, recheck=RECHECK)
+        print("dealing actions")
+        await reveal(w3, game.functions.dealActions, chain, log)
+    # len(chain) is the index of the final anchor from here on (verifyAnchor)
+    chain.pop()
+
+    await transact(w3, ctl.functions.verifyGame())
+
+
+async def reveal(w3, fn, chain, log=NULL_LOG):
+    # like game.reveal: the chain is only popped once fn(next link) went through
+    index = len(chain) - 2
+    log.record("reveal", index=index)
+    receipt = await transact(w3, fn(chain[index]))
+    if receipt["status"] != 1:
+        raise Exception(f"{fn.fn_name} reverted, anchor still at link {index + 1}")
+    chain.pop()
+
+
+# ---------------------------------------------------------
+# Verify (verify.py)
+# ---------------------------------------------------------
+
+async def verifyExec(verify,w3, chain,salt, id, setup=None, game=None):
+    print("submitting anchor")
+    try:
+        if setup and game:
+            random, anchor, phase = await read(
+                w3, setup.functions.getFinalRandom(), game.functions.getAnchor(), verify.functions.getPhase(id)
+            )
+            # the hash walk is CPU bound; keep it off the event loop
+            reason = await asyncio.to_thread(
+                preflight_check, random, anchor, phase == 0, salt.to_bytes(32, byteorder='big'), len(chain)
+            )
+            if reason:
+                print(f"not submitting anchor: {reason}")
+                return
+        receipt = await transact(w3, verify.functions.verifyAnchor(id, salt.to_bytes(32, byteorder='big'), len(chain)))
+        print(f"Transaction status: {receipt['status']} (1=Success, 0=Fail)")
+    except Exception:
+        print("failed verifying")
+
+
+async def resolveExec(verify,w3, id):
+    try:
+        await get_watcher(w3).wait_phase(verify, 1, args=(id,), recheck=RECHECK)
+        print("resolveing game anchor", id)
+        receipt = await transact(w3, verify.functions.resolveGame(id))
+        print(f"Transaction status: {receipt['status']} (1=Success, 0=Fail)")
+    except Exception as e:
+        print("resolve failed :(", id, e)
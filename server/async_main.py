@@ -0,0 +1,15 @@
+from tables import run_tables
+import asyncio
+import os
+
+# asyncio house: same loop as main.py on AsyncWeb3, for a single table. See
+# tables.py for the per-table loop and for running many tables at once.
+# Resolving a finished round waits out VERIFY_DURATION in a background task
+# while the next round's setup already runs.
+
+HOUSE_PRIVATE_KEY = os.environ["HOUSE_PK"]
+CONTROLLER = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+
+
+if __name__ == "__main__":
+    asyncio.run(run_tables(HOUSE_PRIVATE_KEY, [CONTROLLER]))
@@ -0,0 +1,120 @@
+from eth_tester import EthereumTester, PyEVMBackend
+from web3 import Web3, EthereumTesterProvider
+from web3.middleware import SignAndSendRawMiddlewareBuilder
+from collections import Counter
+from common.watcher import get_watcher
+import threading
+import time
+
+# In-process EVM backend: the compiled out/ artifacts deployed into py-evm
+# (eth-tester), no node and no sockets. Every actor gets its own provider on
+# the shared chain, so watchers, pipelines and schedulers stay per connection
+# like with HTTP. Transactions are mined on arrival; time only moves through
+# the warp thread: once no transaction was sent for `idle` seconds, the chain
+# jumps to the earliest deadline somebody sleeps on (common/schedule.py) or `step`
+# seconds ahead, so the 10s/40s phase windows take milliseconds.
+#
+#   chain = Chain()
+#   w3 = chain.connect(house)                 # funded, signing as house
+#   schedule.install(w3, setup, cr2, game, clock=chain)
+
+GAS_LIMIT = 60_000_000
+FUNDS = 1_000
+
+
+class Chain:
+    def __init__(self, idle=0.05, step=1, poll=0.005):
+        self.tester = EthereumTester(PyEVMBackend(PyEVMBackend.generate_genesis_params({"gas_limit": GAS_LIMIT})))
+        # py-evm isn't thread safe; providers, warps and funding share this lock
+        self.lock = threading.RLock()
+        self.idle = idle
+        self.step = step
+        self.poll = poll
+        self.last_tx = time.monotonic()
+        self.cond = threading.Condition()
+        self.deadlines = Counter()
+        self.warps = 0
+        self.thread = threading.Thread(target=self._run, name="evm-warp", daemon=True)
+        self.thread.start()
+
+    def provider(self):
+        provider = EthereumTesterProvider(self.tester)
+        make_request = provider.make_request
+
+        def locked(method, params):
+            with self.lock:
+                if method in ("eth_sendRawTransaction", "eth_sendTransaction"):
+                    self.last_tx = time.monotonic()
+                return make_request(method, params)
+
+        # before the first request, web3 binds make_request when it builds the middleware chain
+        provider.make_request = locked
+        return provider
+
+    def connect(self, account, provider=None):
+        w3 = Web3(provider or self.provider())
+        self.fund(account.address)
+        w3.middleware_onion.inject(SignAndSendRawMiddlewareBuilder.build(account), layer=0)
+        w3.eth.default_account = account.address
+        # blocks only come from our own transactions and warps; no need to wait long
+        get_watcher(w3).poll = self.poll
+        return w3
+
+    def fund(self, address, amount=FUNDS):
+        with self.lock:
+            self.tester.send_transaction({
+                "from": self.tester.get_accounts()[0],
+                "to": address,
+                "value": amount * 10**18,
+                "gas": 21000,
+            })
+
+    # ---------------------------------------------------------
+    # clock (common/schedule.py)
+    # ---------------------------------------------------------
+
+    def now(self):
+        with self.lock:
+            return self.tester.get_block_by_number("latest")["timestamp"]
+
+    def sleep_until(self, deadline, timeout=None):
+        # blocks until the chain reaches deadline; timeout is in wall seconds
+        # and what is left of it is returned, like the wall clock's
+        start = time.monotonic()
+        with self.cond:
+            self.deadlines[deadline] += 1
+            try:
+                self.cond.wait_for(lambda: self.now() >= deadline, timeout)
+            finally:
+                self.deadlines[deadline] -= 1
+                if self.deadlines[deadline] <= 0:
+                    del self.deadlines[deadline]
+        if timeout is not None:
+            timeout = max(0, timeout - (time.monotonic() - start))
+        return timeout
+
+    def warp(self, timestamp=None):
+        # latest block at timestamp (or the next second); time_travel alone
+        # only moves the pending block, views read the latest one
+        with self.lock:
+            if timestamp is not None and timestamp > self.now() + 1:
+                self.tester.time_travel(timestamp - 1)
+            self.tester.mine_blocks(1)
+            self.warps += 1
+        with self.cond:
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            time.sleep(self.idle / 4)
+            if time.monotonic() - self.last_tx < self.idle:
+                continue
+            now = self.now()
+            with self.cond:
+                ahead = [deadline for deadline in self.deadlines if deadline > now]
+            try:
+                self.warp(min(ahead) if ahead else now + self.step)
+            except Exception as e:
+                print("warp failed:", e)
+            # everyone gets a full idle period to react to the new block
+            self.last_tx = time.monotonic()
@@ -0,0 +1,364 @@
+from web3 import Web3
+from web3.middleware import SignAndSendRawMiddlewareBuilder
+from collections import Counter
+from common.bundle import OUT, ARTIFACTS, load_contracts
+from cr2 import setupExec
+from journal import NULL_LOG
+from game import gameExec
+from verify import verifyExec
+from common.txpipe import install, send, confirm, flush
+from common.watcher import get_watcher
+from common.transport import RPC_URL, provider
+import cr2
+from common import schedule
+import argparse
+import importlib.util
+import json
+import os
+import secrets
+import shutil
+import statistics
+import subprocess
+import threading
+import time
+
+# End-to-end round benchmark against a local anvil. Deploys a fresh
+# BlackjackController from out/ (forge build first), funds N client accounts,
+# runs them as scripted clients on threads (client/setup.py + client/game.py)
+# and drives the real house path (setupExec -> startGame -> gameExec ->
+# verifyExec) for a number of rounds. Per round it reports wall time per phase,
+# JSON-RPC requests of house and clients, and transactions and gas per
+# contract function, as JSON so runs can be diffed. With --backend evm the
+# whole thing runs against an in-process py-evm chain instead (backend.py):
+# no node, and the phase windows are warped through instead of waited out.
+#
+#   python bench.py --anvil --players 3 --rounds 2 --out bench.json
+#   CHAIN_LENGTH=20 python bench.py --backend evm --rounds 500
+#   python bench.py --anvil --gas-db gas.db --gas-check 0.05   # gas per function, fails on regressions
+
+# anvil account #0, the deployer in script/Casino.s.sol
+DEPLOYER_KEY = 0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+CLIENT_FUNDS = 10
+
+
+class RpcCounter:
+    # counts HTTP round trips and the JSON-RPC methods in them
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.methods = Counter()
+
+    def connect(self, url):
+        return Web3(self.wrap(provider(url)))
+
+    def wrap(self, provider):
+        make_request = provider.make_request
+        make_batch_request = getattr(provider, "make_batch_request", None)
+
+        def counted(method, params):
+            with self.lock:
+                self.requests += 1
+                self.methods[method] += 1
+            return make_request(method, params)
+
+        def counted_batch(requests):
+            with self.lock:
+                self.requests += 1
+                for method, _ in requests:
+                    self.methods[method] += 1
+            return make_batch_request(requests)
+
+        # before the first request, web3 binds make_request when it builds the middleware chain
+        provider.make_request = counted
+        if make_batch_request is not None:
+            provider.make_batch_request = counted_batch
+        return provider
+
+    def snapshot(self):
+        with self.lock:
+            return self.requests, Counter(self.methods)
+
+    def since(self, snapshot):
+        requests, methods = self.snapshot()
+        return {"requests": requests - snapshot[0], "methods": dict(methods - snapshot[1])}
+
+
+class Phases:
+    def __init__(self):
+        self.times = {}
+
+    def time(self, name, fn, *args):
+        start = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            self.times[name] = self.times.get(name, 0) + time.monotonic() - start
+
+    def wrap(self, module, name, phase):
+        # nested phases (crr, chain hashing) run inside setupExec; returns the undo
+        fn = getattr(module, name)
+        setattr(module, name, lambda *args, **kwargs: self.time(phase, lambda: fn(*args, **kwargs)))
+        return lambda: setattr(module, name, fn)
+
+
+def start_anvil(url, block_time):
+    if shutil.which("anvil") is None:
+        raise Exception("anvil not found; install foundry or start a node at " + url)
+    port = url.rsplit(":", 1)[1]
+    # phases are block.timestamp based, so blocks have to keep coming while idle
+    node = subprocess.Popen(
+        ["anvil", "--port", port, "--block-time", str(block_time), "--silent"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    w3 = Web3(Web3.HTTPProvider(url))
+    for _ in range(50):
+        if w3.is_connected():
+            return node
+        time.sleep(0.1)
+    node.kill()
+    raise Exception("anvil did not come up")
+
+
+def connect(counter, url, account, chain=None):
+    if chain is not None:
+        return chain.connect(account, counter.wrap(chain.provider()))
+    w3 = counter.connect(url)
+    w3.middleware_onion.inject(SignAndSendRawMiddlewareBuilder.build(account), layer=0)
+    w3.eth.default_account = account.address
+    return w3
+
+
+def deploy(w3):
+    with open(os.path.join(OUT, ARTIFACTS["controller"])) as f:
+        artifact = json.load(f)
+    Controller = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"]["object"])
+    receipt = w3.eth.wait_for_transaction_receipt(Controller.constructor().transact())
+    return receipt["contractAddress"]
+
+
+def fund(w3, accounts):
+    hashes = [
+        w3.eth.send_transaction({"to": account.address, "value": w3.to_wei(CLIENT_FUNDS, "ether")})
+        for account in accounts
+    ]
+    for tx_hash in hashes:
+        w3.eth.wait_for_transaction_receipt(tx_hash)
+
+
+def load_client(name):
+    # client/ has its own setup.py/game.py; load them under other names
+    spec = importlib.util.spec_from_file_location("client_" + name, os.path.join(CLIENT_DIR, name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def client_loop(counter, url, account, controller_address, stop, chain=None, book=None):
+    client_setup, client_game = load_client("setup"), load_client("game")
+    w3 = connect(counter, url, account, chain)
+    install(w3, account)
+    if book is not None:
+        book.attach(w3)
+    controller, setup, cr2, game, verify = load_contracts(w3, controller_address)
+    if chain is not None:
+        # sleeps on phase deadlines are what the chain warps to
+        schedule.install(w3, setup, cr2, game, clock=chain)
+
+    joined = False
+    while not stop.is_set():
+        try:
+            phase = controller.functions.getPhase().call()
+            if phase == 0 and not joined:
+                client_setup.setupExec(setup, cr2, w3, account, controller)
+                joined = True
+            elif phase == 1 and joined:
+                client_game.gameExec(game, controller, w3)
+                get_watcher(w3).wait_phase(controller, 2)
+            elif phase == 2:
+                joined = False
+        except Exception as e:
+            print(f"client {account.address[:8]} failed:", e)
+            joined = False
+        get_watcher(w3).wait_block(timeout=1)
+
+
+def round_stats(w3, deployment, house, first, last):
+    # transactions and gas from the blocks of one round, grouped by function
+    contracts = {contract.address: contract for contract in deployment}
+    functions = {}
+    totals = {"house": {"tx": 0, "gas": 0}, "clients": {"tx": 0, "gas": 0}}
+    for number in range(first, last + 1):
+        block = w3.eth.get_block(number, full_transactions=True)
+        if not block["transactions"]:
+            continue
+        try:
+            receipts = {r["transactionHash"]: r for r in w3.eth.get_block_receipts(number)}
+        except Exception:
+            # eth-tester has no eth_getBlockReceipts
+            receipts = {tx["hash"]: w3.eth.get_transaction_receipt(tx["hash"]) for tx in block["transactions"]}
+        for tx in block["transactions"]:
+            contract = contracts.get(tx["to"])
+            if contract is None:
+                continue
+            receipt = receipts[tx["hash"]]
+            try:
+                name = contract.get_function_by_selector(tx["input"][:4]).fn_name
+            except Exception:
+                name = tx["input"][:4].hex()
+            stats = functions.setdefault(name, {"tx": 0, "gas": 0, "reverted": 0})
+            stats["tx"] += 1
+            stats["gas"] += receipt["gasUsed"]
+            stats["reverted"] += receipt["status"] == 0
+            who = totals["house" if tx["from"] == house else "clients"]
+            who["tx"] += 1
+            who["gas"] += receipt["gasUsed"]
+    return {"functions": functions, **totals}
+
+
+def house_round(w3, house, deployment, counter, clients, book=None):
+    controller, setup, cr2_contract, game, verify = deployment
+    phases = Phases()
+    undo = [phases.wrap(cr2, "crr", "crr"), phases.wrap(cr2, "generate", "chain")]
+    house_rpc, client_rpc = counter["house"].snapshot(), counter["clients"].snapshot()
+    first = w3.eth.block_number + 1
+    start = time.monotonic()
+    id, error = None, None
+    try:
+        reset = phases.time("reset", lambda: confirm(w3, send(w3, controller.functions.reset())))
+        id = controller.functions.roundId().call()
+        if book is not None:
+            # players and the cut chain length are filled in by setupExec
+            book.context(round=id, players=None, chain_length=None)
+        salt = secrets.randbits(256)
+        result = phases.time(
+            "setup", setupExec, setup, cr2_contract, controller, w3, house, house, salt, NULL_LOG, reset["blockNumber"], book
+        )
+        if result is None:
+            raise Exception("no players joined")
+        chain, salt, random = result
+        phases.time("start", lambda: (send(w3, controller.functions.startGame()), flush(w3)))
+        phases.time("game", gameExec, game, controller, w3, chain, salt, random)
+        # gameExec popped the revealed links; the top left is the final anchor's index
+        phases.time("verify", verifyExec, verify, w3, chain, salt, id, setup, game)
+    except Exception as e:
+        error = str(e)
+    finally:
+        for restore in undo:
+            restore()
+    total = time.monotonic() - start
+    last = w3.eth.block_number
+    return {
+        "round": id,
+        "players": clients,
+        "ok": error is None,
+        "error": error,
+        "wall": round(total, 3),
+        "phases": {name: round(t, 3) for name, t in phases.times.items()},
+        "rpc": {"house": counter["house"].since(house_rpc), "clients": counter["clients"].since(client_rpc)},
+        "blocks": [first, last],
+        "tx": round_stats(w3, deployment, house.address, first, last),
+    }
+
+
+def summarize(rounds):
+    ok = [r for r in rounds if r["ok"]]
+    summary = {"rounds": len(rounds), "ok": len(ok)}
+    if ok:
+        summary["wall"] = statistics.median(r["wall"] for r in ok)
+        summary["phases"] = {
+            name: statistics.median(r["phases"].get(name, 0) for r in ok) for name in ok[0]["phases"]
+        }
+        summary["rpc_requests"] = {
+            who: statistics.median(r["rpc"][who]["requests"] for r in ok) for who in ("house", "clients")
+        }
+        summary["gas"] = {
+            who: statistics.median(r["tx"][who]["gas"] for r in ok) for who in ("house", "clients")
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end round benchmark")
+    parser.add_argument("--rpc", default=RPC_URL)
+    parser.add_argument("--anvil", action="store_true", help="start a local anvil for the run")
+    parser.add_argument("--backend", choices=("http", "evm"), default="http", help="evm: in-process py-evm chain, no node")
+    parser.add_argument("--block-time", type=int, default=1)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--out", help="write the results here instead of stdout")
+    parser.add_argument("--gas-db", help="record gas per function and build here (see gasbook.py)")
+    parser.add_argument("--gas-check", type=float, help="fail if a function got this much more expensive than in the previous build")
+    args = parser.parse_args()
+
+    chain = None
+    if args.backend == "evm":
+        from backend import Chain
+        chain = Chain()
+    node = start_anvil(args.rpc, args.block_time) if args.anvil and chain is None else None
+    try:
+        counter = {"house": RpcCounter(), "clients": RpcCounter()}
+        house = Web3().eth.account.from_key(DEPLOYER_KEY)
+        w3 = connect(counter["house"], args.rpc, house, chain)
+        assert w3.is_connected(), "Node is not running!"
+
+        controller_address = deploy(w3)
+        print("controller deployed at", controller_address)
+        accounts = [w3.eth.account.create() for _ in range(args.players)]
+        fund(w3, accounts)
+        install(w3, house)
+        deployment = load_contracts(w3, controller_address)
+        if chain is not None:
+            schedule.install(w3, *deployment[1:4], clock=chain)
+        book = None
+        if args.gas_db:
+            from gasbook import GasBook
+            book = GasBook(args.gas_db)
+            book.label(**dict(zip(("controller", "setup", "cr2", "game", "verify"), deployment)))
+            book.attach(w3)
+
+        stop = threading.Event()
+        for account in accounts:
+            threading.Thread(
+                target=client_loop,
+                args=(counter["clients"], args.rpc, account, controller_address, stop, chain, book),
+                daemon=True,
+            ).start()
+
+        rounds = []
+        start = time.monotonic()
+        for _ in range(args.rounds):
+            result = house_round(w3, house, deployment, counter, args.players, book)
+            print(f"round {result['round']}: {'ok' if result['ok'] else result['error']} in {result['wall']}s", result["phases"])
+            rounds.append(result)
+        stop.set()
+        elapsed = time.monotonic() - start
+
+        results = {
+            "config": {
+                "backend": args.backend, "players": args.players, "rounds": args.rounds,
+                "chain_length": cr2.CHAIN_LENGTH, "block_time": args.block_time,
+            },
+            "rounds": rounds,
+            "summary": {**summarize(rounds), "rounds_per_minute": round(60 * len(rounds) / elapsed, 1)},
+        }
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(results, f, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+        if book is not None:
+            import gasbook
+            gasbook.report(book.db, book.build)
+            known = gasbook.builds(book.db)
+            older = known[:known.index(book.build)]
+            if args.gas_check is not None and older:
+                if gasbook.check(book.db, older[-1], book.build, args.gas_check):
+                    raise SystemExit(1)
+    finally:
+        if node is not None:
+            node.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,95 +1,156 @@
 from web3 import Web3
+from eth_hash.auto import keccak
 import secrets
-import time
+from common.schedule import wait_phase
+from common.batch import read
+from hashchain import HashChain
+from journal import NULL_LOG
+from common.txpipe import send, confirm, flush
+from metrics import SKIPS
+from common.revealorder import RevealOrder
+from common.skipper import wait_turn
+from pregen import background
+import os
+
+# number of links after the seed; the on-chain verifyAnchor walks all of them
+CHAIN_LENGTH = int(os.environ.get("CHAIN_LENGTH", 200))
+
+def new_commit():
+    # s, co = keccak(s), cv = keccak(co)
+    s = secrets.token_bytes(32)
+    co = keccak(s)
+    return s, co, keccak(co)
+
+def waitForStage(contract,_phase, name,debug=False):
+    phase = wait_phase(contract, _phase)
+    if debug:
+        print(phase)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
+    return phase
+
+
+# start_block: a block at or before the round's reset (journaled as "start" by
+# main.py); without it the reveal order is read back from the contract.
+# gas: a GasBook (see gasbook.py) whose players and chain length follow the round
+def setupExec(setup,cr2,ctl,w3,user,registrar, salt, log=NULL_LOG, start_block=None, gas=None):
+    if log.get("salt"):
+        salt = int(log.get("salt")["salt"], 16)
+    else:
+        log.record("salt", salt=hex(salt))
 
-def waitForStage(constract,_phase, name,wait=1,debug=False):
-    while True:
-        phase = constract.functions.getPhase().call()
-        if debug:
-            print(phase)
-        if phase >= _phase:
-            print(f"✅ Now in {name}!{_phase}<=id:{phase}")
-            break
-
-        print(f"⏳ Still waiting for {name}...")
-        time.sleep(wait)
-
-
-def setupExec(setup,cr2,ctl,w3,user,registrar, salt):
     waitForStage(setup,0,"betting")
     waitForStage(setup,1,"rng")
 
     count = setup.functions.playerCount().call()
+    if gas is not None:
+        gas.context(players=count)
     if count == 0:
         print("no players joined :(")
         return
 
-    random = crr(cr2,w3,user,registrar)
+    if log.get("start"):
+        start_block = log.get("start")["block"]
+    random = crr(cr2,w3,user,registrar,log,start_block)
+    # hashed on the pregen worker while we wait for the window
+    pending = background(generate, random, salt)
 
     waitForStage(setup,2,"chain")
 
-    chain = generate(random, salt)
+    chain = pending.result()
     print("chain length", len(chain))
+    log.record("chain", length=len(chain) - 1)
 
-    print("submitting",chain[len(chain)-1])
-    tx_hash = setup.functions.submitChain(chain[len(chain)-1]).transact() #TODO: this fails
-    w3.eth.wait_for_transaction_receipt(tx_hash)
+    if setup.functions.anchor().call() != chain[len(chain)-1]:
+        print("submitting",chain[len(chain)-1])
+        # mined while the players cut; confirmed once the cut is known
+        send(w3, setup.functions.submitChain(chain[len(chain)-1])) #TODO: this fails
 
     # waitForStage(setup,3,"cut ")
 
 
     waitForStage(setup,4,"cut chain")
+    flush(w3)
 
-    cut = setup.functions.getCut().call()
-    print("chain length -cut",len(chain[-cut]))
+    cut, blkchain = read(w3, setup.functions.getCut(), setup.functions.anchor())
+    print("chain length -cut",len(chain)-cut)
 
-    val = setup.functions.evalHash(chain[len(chain)-1-cut]).call()
-
-    blkchain= setup.functions.anchor().call()
+    # evalHash(chain[-1-cut]) == anchor holds by construction of the chain, so
+    # only the submitted anchor is checked instead of another round trip
     print("chain",chain[len(chain)-1])
     print("blkchain",blkchain)
+    cut_chain = chain[:len(chain)-cut]
+    if blkchain not in (chain[len(chain)-1], cut_chain[len(cut_chain)-1]):
+        raise Exception("on-chain anchor does not match the submitted chain")
 
-    for el in chain:
-        print(el)
-    chain = chain[:len(chain)-cut]
+    chain = cut_chain
     print("new chain",chain[len(chain)-1])
+    log.record("cut", length=len(chain))
+    if gas is not None:
+        # links left after the cut, what deal/dealActions/verifyAnchor walk
+        gas.context(chain_length=len(chain) - 1)
 
-    tx = setup.functions.revealCutChain(chain[len(chain)-1]).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+    # already applied if the house restarted after sending it
+    # left in flight; the caller's startGame goes out right behind it
+    if blkchain != chain[len(chain)-1]:
+        send(w3, setup.functions.revealCutChain(chain[len(chain)-1]))
 
     return chain, salt,random 
 
 
 
-def generate(random,salt):
-    chain = []
-
+def generate(random,salt,length=CHAIN_LENGTH):
     salt_bytes = salt.to_bytes(32, "big")
-    temp = Web3.keccak(random+salt_bytes)
-    chain.append(temp)
-
-    for i in range(200):
-        temp = Web3.keccak(temp)
-        chain.append(temp)
-
-    return chain 
-
-
-def crr(cr2,w3,user,registrar):
-    s, co, cv = make_commit("MyLiveSecret")
+    return HashChain(Web3.keccak(random+salt_bytes), length + 1)
+
+
+# rebuild the cut chain of a journaled round and trim it so its top is the link
+# currently anchored on-chain; None if the round can't be rebuilt
+def resume_chain(log, anchor):
+    random, salt, chain, cut = log.get("random"), log.get("salt"), log.get("chain"), log.get("cut")
+    if random is None or salt is None or chain is None or cut is None:
+        return None
+    chain = generate(bytes.fromhex(random["random"]), int(salt["salt"], 16), chain["length"])
+    chain = chain[:cut["length"]]
+
+    # the last journaled reveal either landed or it didn't
+    reveal = log.get("reveal")
+    hints = [reveal["index"], reveal["index"] + 1] if reveal else []
+    for i in hints + [len(chain) - 1]:
+        if 0 <= i < len(chain) and chain[i] == anchor:
+            return chain[:i + 1]
+
+    walker = chain[:len(chain)]
+    while len(walker):
+        if walker.pop() == anchor:
+            return chain[:len(walker) + 1]
+    return None
+
+
+def crr(cr2,w3,user,registrar, log=NULL_LOG, start_block=None):
+    commit = log.get("commit")
+    if commit:
+        s, co, cv = (bytes.fromhex(commit[k]) for k in ("s", "co", "cv"))
+    else:
+        s, co, cv = new_commit()
+        # written before the commit goes out: without s we could never reveal2
+        log.record("commit", s=s.hex(), co=co.hex(), cv=cv.hex())
 
     # ---------------------------------------------------------
     assert Web3.keccak(co) == cv, "Local hash mismatch! cv != keccak(co)"
 
+    # (registered, cv, co, s, dVal, revealed1, revealed2, deposit); only
+    # differs from the empty participant when resuming a journaled round
+    me = cr2.functions.getParticipant().call()
+
     waitForStage(cr2,0,"commit")
 
-    phase = cr2.functions.getParticipant().call()
-    print("Submitting commit...")
+    if not me[0]:
+        print("Submitting commit...")
 
-    tx= cr2.functions.commit(cv).transact({
-        "value": w3.to_wei(0.1, "ether")
-    })
-    w3.eth.wait_for_transaction_receipt(tx)
+        tx= send(w3, cr2.functions.commit(cv), {
+            "value": w3.to_wei(0.1, "ether")
+        })
+        confirm(w3, tx)
  
     # ---------------------------------------------------------
     # 4. Wait for Reveal1 Phase (REAL TIME)
@@ -101,66 +162,78 @@ def crr(cr2,w3,user,registrar):
     # 5. Reveal1
     # ---------------------------------------------------------
 
-    print("Submitting Reveal1...")
-    tx = cr2.functions.reveal1(co).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+    if not me[5]:
+        print("Submitting Reveal1...")
+        send(w3, cr2.functions.reveal1(co))
+
+    # commits and reveals so far, while there is time; tracker.order() fetches
+    # the blocks since
+    tracker = None
+    order = None
+    if start_block is not None:
+        try:
+            tracker = RevealOrder(cr2, start_block)
+            tracker.load()
+        except Exception as e:
+            print("can't compute the reveal order locally:", e)
+            tracker = None
 
     # ---------------------------------------------------------
     # 6. Wait for OrderCalculation Phase
     # ---------------------------------------------------------
 
-    waitForStage(cr2,2,"order OrderCalculation")
+    phase = waitForStage(cr2,2,"order OrderCalculation")
+    flush(w3)
     # ---------------------------------------------------------
     # 7. Submit Reveal Order (single user)
     # ---------------------------------------------------------
 
-    tx_hash = cr2.functions.calculateIntermediateValues().transact()
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    print("Values calculated on-chain.")
+    if phase == 2 and tracker is not None:
+        # submitRevealOrder runs calculateIntermediateValues itself
+        order = tracker.order()
+        print(f"Sorted {len(order)} addresses locally.")
+        if order and confirm(w3, send(w3, cr2.functions.submitRevealOrder(order)))["status"] == 1:
+            phase = 3
+        else:
+            # someone else submitted first
+            print("local reveal order rejected")
+            order = None
+            phase = cr2.functions.getPhase().call()
+
+    if phase == 2:
+        # both go out back to back; the dVals are read from the pending state
+        calc = send(w3, cr2.functions.calculateIntermediateValues())
 
-    addresses, dvals = cr2.functions.getParticipantsAndDVals().call()
+        addresses, dvals = cr2.functions.getParticipantsAndDVals().call(block_identifier="pending")
 
-    participants = list(zip(addresses, dvals))
-    valid_participants = [p for p in participants if p[1] > 0]
+        participants = list(zip(addresses, dvals))
+        valid_participants = [p for p in participants if p[1] > 0]
 
-    sorted_participants = sorted(valid_participants, key=lambda x: x[1], reverse=True)
-    sorted_addresses_payload = [p[0] for p in sorted_participants]
-    print(f"Sorted {len(sorted_addresses_payload)} addresses for submission.")
-    tx = cr2.functions.submitRevealOrder(sorted_addresses_payload).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+        sorted_participants = sorted(valid_participants, key=lambda x: x[1], reverse=True)
+        sorted_addresses_payload = [p[0] for p in sorted_participants]
+        print(f"Sorted {len(sorted_addresses_payload)} addresses for submission.")
+        tx = send(w3, cr2.functions.submitRevealOrder(sorted_addresses_payload))
+        order = sorted_addresses_payload
+        confirm(w3, calc, tx)
+        print("Values calculated on-chain.")
 
     # ---------------------------------------------------------
     # 8. Wait for Reveal2 Phase
     # ---------------------------------------------------------
 
-    waitForStage(cr2,3,"Reveal2")
+    phase = waitForStage(cr2,3,"Reveal2")
 
     # ---------------------------------------------------------
     # 9. Reveal2
     # ---------------------------------------------------------
 
-    start_time = time.time()
-    timeout= cr2.functions.TURN_TIMEOUT().call()
-    while True:
-        current = cr2.functions.getCurrentRevealer().call()
-        print(current)
-        if user.address== current:  
-            print("your turn!")
-            break
-        elapsed = time.time() - start_time
-        if timeout < elapsed:
-            print("waiting too long")
-            try:
-                current = cr2.functions.skipStalledUser().transact()
-            except:
-                print("skip failed")
-
-        print(f"⏳ Still waiting for {current}...")
-        time.sleep(1)
+    if phase == 3 and not me[6]:
+        # stalled revealers ahead of us are skipped by one elected waiter (see common/skipper.py)
+        SKIPS.inc(amount=wait_turn(cr2, w3, user.address, order))
+        print("your turn!")
 
-    print("Submitting Reveal2...")
-    tx = cr2.functions.reveal2(s).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+        print("Submitting Reveal2...")
+        confirm(w3, send(w3, cr2.functions.reveal2(s)))
 
     # ---------------------------------------------------------
     # 10. Wait for Finished Phase
@@ -174,37 +247,5 @@ def crr(cr2,w3,user,registrar):
 
     final_randomness = cr2.functions.omega_o().call()
     print(final_randomness)
+    log.record("random", random=final_randomness.hex())
     return final_randomness 
-
-
-
-# Create secret, co = H(secret), cv = H(co)
-def make_commit(secret_str:str):
-    secret_int = secrets.randbits(256)
-    print("Random secret integer:", secret_int)
-    # 1) random 32-byte secret s
-    s = secrets.token_bytes(32)          # 256-bit secret
-
-    # 2) co = keccak256(abi.encodePacked(s))
-    co = Web3.keccak(s)
-
-    # 3) cv = keccak256(abi.encodePacked(co))
-    cv = Web3.keccak(co)
-    assert Web3.keccak(co) == cv, "Local hash mismatch! cv != keccak(co)"
-
-    # return s, co, cv
-    # s = Web3.solidity_keccak(
-    #     ['uint256'],
-    #     [secret_int]
-    # )
-    #
-    # co = Web3.solidity_keccak(
-    #     ['bytes32'],
-    #     [s]
-    # )
-    #
-    # cv = Web3.solidity_keccak(
-    #     ['bytes32'],
-    #     [co]
-    # )
-    return s, co, cv
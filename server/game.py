@@ -1,29 +1,25 @@
-import time
-def waitForPhase(contract,_phase, name,wait=1,debug=False):
-    while True:
-        phase = contract.functions.getPhase().call()
-        if debug:
-            print(phase)
-        if phase >= _phase:
-            print(f"✅ Now in {name}!{_phase}<=id:{phase}")
-            break
-
-        print(f"⏳ Still waiting for {name}...")
-        time.sleep(wait)
-
-def gameExec(game,ctl,w3, chain,salt,random):
+from common.schedule import wait_phase, wait_round_over
+from journal import NULL_LOG
+from common.txpipe import send, confirm
+from common.recorder import recorder
+def waitForPhase(contract,_phase, name,debug=False):
+    phase = wait_phase(contract, _phase)
+    if debug:
+        print(phase)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
+    return phase
+
+def gameExec(game,ctl,w3, chain,salt,random, log=NULL_LOG):
 
     phase = ctl.functions.getPhase.call()
     print("phase ctl: ", phase)
 
-    waitForPhase(game,0,"deal_cards")
+    game_phase = waitForPhase(game,0,"deal_cards")
     print("len ",len(chain))
-    anchor = chain.pop()
-    anchor = chain.pop()
-    print(anchor)
-    tx = game.functions.deal(anchor).transact()
-    w3.eth.wait_for_transaction_receipt(tx)
-    print("dealt cards")
+    # the top link is the current on-chain anchor, the next one down reveals it
+    if game_phase == 0:
+        reveal(w3, game.functions.deal, chain, log)
+        print("dealt cards")
 
     while  game.functions.getPhase().call() < 3:
         phase = ctl.functions.getPhase.call()
@@ -31,17 +27,28 @@ def gameExec(game,ctl,w3, chain,salt,random):
         print("wait")
         waitForRound(game)
         print("dealing actions")
-        anchor = chain.pop()
-        tx = game.functions.dealActions(anchor).transact()
-        w3.eth.wait_for_transaction_receipt(tx)
+        reveal(w3, game.functions.dealActions, chain, log)
+    # len(chain) is the index of the final anchor from here on (verifyAnchor)
+    chain.pop()
     
-    tx = ctl.functions.verifyGame().transact()
-    w3.eth.wait_for_transaction_receipt(tx)
+    confirm(w3, send(w3, ctl.functions.verifyGame()))
+
+
 
 
+# sends fn(next link) and only pops the chain once it went through; a revert
+# leaves the on-chain anchor, and so the top of the chain, where it was
+def reveal(w3, fn, chain, log=NULL_LOG):
+    index = len(chain) - 2
+    print(chain[index])
+    log.record("reveal", index=index)
+    recorder.event("pop", index=index)
+    receipt = confirm(w3, send(w3, fn(chain[index])))
+    if receipt["status"] != 1:
+        raise Exception(f"{fn.fn_name} reverted, anchor still at link {index + 1}")
+    chain.pop()
 
 
 def waitForRound(game):
-    while not game.functions.playerRoundOver().call():
-        print("wait to deal")
-        time.sleep(1)
+    print("wait to deal")
+    wait_round_over(game)
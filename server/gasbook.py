@@ -0,0 +1,187 @@
+from common.bundle import ARTIFACTS, artifact_hash
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+# Gas accounting per contract function. A TxPipeline listener stores gasUsed
+# of every mined transaction together with the round id, the player count and
+# the hash chain length after the cut it was sent under (setupExec fills both
+# in as soon as it knows them) and the build of the contracts (the hash of the
+# out/ artifacts, see common/bundle.py), in SQLite. The CLI reports the cost
+# per function and compares two builds: a function whose median gas grew by
+# more than the threshold under the same players/chain length fails the
+# check, so a scripted local round (bench.py --gas-db) can gate contract
+# changes. The house only keeps a book with GAS_DB set.
+#
+#   book = GasBook()
+#   book.label(setup=setup, cr2=cr2, game=game, verify=verify)
+#   book.attach(w3)                                   # every pipelined tx of w3
+#   book.context(round=id, players=3, chain_length=len(chain))
+#
+#   python gasbook.py report
+#   python gasbook.py check --threshold 0.05         # this build against the previous one
+
+# empty: the house records no gas
+GAS_DB = os.environ.get("GAS_DB", "")
+
+SCHEMA = """
+create table if not exists builds (
+    build text primary key,
+    first_seen real not null
+);
+create table if not exists gas (
+    tx text primary key,
+    build text not null,
+    round integer,
+    players integer,
+    chain_length integer,
+    contract text not null,
+    function text not null,
+    gas integer not null,
+    status integer not null,
+    block integer not null
+);
+create index if not exists gas_build_function on gas (build, contract, function);
+"""
+
+
+def current_build():
+    try:
+        return artifact_hash()
+    except OSError:
+        return "unknown"
+
+
+class GasBook:
+    def __init__(self, path=GAS_DB or "gas.db", build=None):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.build = build or current_build()
+        self.names = {}
+        self.round = None
+        self.players = None
+        self.chain_length = None
+        with self.lock, self.db:
+            self.db.execute("insert or ignore into builds values (?, ?)", (self.build, time.time()))
+
+    def label(self, **contracts):
+        # keys as in bundle.ARTIFACTS; stored under the Solidity contract name
+        for key, contract in contracts.items():
+            self.names[contract.address] = os.path.basename(ARTIFACTS[key])[:-len(".json")]
+
+    def attach(self, w3):
+        from common.txpipe import get_pipeline
+
+        pipe = get_pipeline(w3)
+        if pipe is not None:
+            pipe.listeners.append(self.record)
+
+    def context(self, **fields):
+        # round, players, chain_length of the transactions that follow
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def record(self, name, receipt, sent=None):
+        contract = self.names.get(receipt["to"], receipt["to"] or "")
+        with self.lock, self.db:
+            self.db.execute(
+                "insert or ignore into gas values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    receipt["transactionHash"].hex(), self.build, self.round, self.players, self.chain_length,
+                    contract, name, receipt["gasUsed"], receipt["status"], receipt["blockNumber"],
+                ),
+            )
+
+
+# ---------------------------------------------------------
+# report / check
+# ---------------------------------------------------------
+
+def costs(db, build):
+    # (contract, function, players, chain_length) -> gasUsed of the successful transactions
+    rows = db.execute(
+        "select contract, function, players, chain_length, gas from gas where build = ? and status = 1",
+        (build,),
+    )
+    groups = {}
+    for contract, function, players, chain_length, gas in rows:
+        groups.setdefault((contract, function, players, chain_length), []).append(gas)
+    return groups
+
+
+def builds(db):
+    return [row[0] for row in db.execute("select build from builds order by first_seen")]
+
+
+def report(db, build):
+    groups = costs(db, build)
+    reverted = dict(db.execute(
+        "select contract || '.' || function, count(*) from gas where build = ? and status = 0 group by 1", (build,)
+    ).fetchall())
+    print(f"build {build[:12]}")
+    print(f"{'tx':>6} {'median':>9} {'min':>9} {'max':>9} {'players':>7} {'chain':>6} {'reverts':>7}  function")
+    for (contract, function, players, chain_length), gas in sorted(groups.items(), key=lambda item: -statistics.median(item[1])):
+        print(
+            f"{len(gas):>6} {statistics.median(gas):>9.0f} {min(gas):>9} {max(gas):>9} "
+            f"{players if players is not None else '-':>7} {chain_length if chain_length is not None else '-':>6} "
+            f"{reverted.get(f'{contract}.{function}', 0):>7}  {contract}.{function}"
+        )
+
+
+def check(db, base, build, threshold):
+    # functions whose median gas grew by more than threshold; only groups
+    # measured in both builds are compared
+    before, after = costs(db, base), costs(db, build)
+    regressions = []
+    for key in sorted(set(before) & set(after), key=str):
+        old, new = statistics.median(before[key]), statistics.median(after[key])
+        if old and (new - old) / old > threshold:
+            regressions.append((key, old, new))
+    for (contract, function, players, chain_length), old, new in regressions:
+        print(f"REGRESSION {contract}.{function} (players={players}, chain={chain_length}): {old:.0f} -> {new:.0f} gas ({(new - old) / old:+.1%})")
+    compared = len(set(before) & set(after))
+    print(f"{compared} function(s) compared between {base[:12]} and {build[:12]}, {len(regressions)} regression(s) over {threshold:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gas per contract function and build")
+    parser.add_argument("command", choices=("report", "check"))
+    parser.add_argument("--db", default=GAS_DB or "gas.db")
+    parser.add_argument("--build", help="build hash (prefix); default: the current out/")
+    parser.add_argument("--base", help="build to compare against; default: the one before --build")
+    parser.add_argument("--threshold", type=float, default=0.05, help="allowed relative growth of the median")
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.db)
+    db.executescript(SCHEMA)
+    known = builds(db)
+
+    def resolve(prefix):
+        matches = [b for b in known if b.startswith(prefix)]
+        if len(matches) != 1:
+            sys.exit(f"build {prefix!r} matches {len(matches)} recorded builds")
+        return matches[0]
+
+    build = resolve(args.build or current_build())
+    if args.command == "report":
+        report(db, build)
+        return
+    if args.base:
+        base = resolve(args.base)
+    else:
+        older = known[:known.index(build)]
+        if not older:
+            sys.exit("no earlier build recorded to compare against")
+        base = older[-1]
+    if check(db, base, build, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
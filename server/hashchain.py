@@ -0,0 +1,108 @@
+import math
+from eth_hash.auto import keccak
+from hexbytes import HexBytes
+
+# Keccak hash chain e[0] = seed, e[i] = keccak(e[i-1]) kept in O(sqrt(n))
+# memory. Only every k-th link is stored (one contiguous bytearray with a
+# 32-byte stride); the segment currently being consumed by pop() is expanded
+# into a second k*32 buffer, so walking the chain backwards costs one hash per
+# pop amortized. Prefix slices (the cut) are O(1) views on the same
+# checkpoints.
+#
+# Behaves like the old list of HexBytes: len(), chain[i], chain[-1],
+# chain[:len(chain)-cut], chain.pop() and iteration.
+
+HASH = 32
+
+
+class HashChain:
+    def __init__(self, seed, length, stride=None, _checkpoints=None):
+        if length < 1:
+            raise ValueError("chain needs at least one link")
+        self.length = length
+        self.stride = stride or max(1, math.isqrt(length - 1) + 1)
+        if _checkpoints is None:
+            _checkpoints = self._build(bytes(seed), length, self.stride)
+        self.checkpoints = _checkpoints
+        self.segment = None
+        self.segment_index = -1
+        self.segment_count = 0
+
+    @staticmethod
+    def _build(seed, length, stride):
+        checkpoints = bytearray(((length - 1) // stride + 1) * HASH)
+        temp = seed
+        for i in range(length):
+            if i % stride == 0:
+                j = i // stride * HASH
+                checkpoints[j:j + HASH] = temp
+            if i + 1 < length:
+                temp = keccak(temp)
+        return checkpoints
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if start != 0 or step != 1:
+                raise IndexError("only prefix slices chain[:n] are supported")
+            return self.view(stop)
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("chain index out of range")
+        return HexBytes(self._link(i))
+
+    def __iter__(self):
+        temp = self._checkpoint(0)
+        for i in range(self.length):
+            yield HexBytes(temp)
+            temp = keccak(temp)
+
+    def view(self, length):
+        # the cut: a shorter chain sharing the checkpoints, no copy
+        if length < 1:
+            raise ValueError("chain needs at least one link")
+        return HashChain(None, min(length, self.length), self.stride, self.checkpoints)
+
+    def pop(self):
+        if self.length == 0:
+            raise IndexError("pop from empty chain")
+        self.length -= 1
+        return HexBytes(self._link(self.length))
+
+    def top(self):
+        return self[self.length - 1]
+
+    def memory(self):
+        return len(self.checkpoints) + (len(self.segment) if self.segment else 0)
+
+    def _checkpoint(self, index):
+        j = index * HASH
+        return bytes(self.checkpoints[j:j + HASH])
+
+    def _link(self, i):
+        index, offset = divmod(i, self.stride)
+        if index != self.segment_index or offset >= self.segment_count:
+            self._expand(index, offset + 1)
+        j = offset * HASH
+        return bytes(self.segment[j:j + HASH])
+
+    def _expand(self, index, count):
+        # recompute the links from checkpoint `index` up to the one asked for;
+        # pop() walks down from there, so later pops in this segment are free.
+        # Within the same segment it continues from the last link it has.
+        if self.segment is None:
+            self.segment = bytearray(self.stride * HASH)
+        start = 0
+        temp = self._checkpoint(index)
+        if index == self.segment_index and self.segment_count:
+            start = self.segment_count
+            temp = keccak(bytes(self.segment[(start - 1) * HASH:start * HASH]))
+        for offset in range(start, count):
+            self.segment[offset * HASH:(offset + 1) * HASH] = temp
+            temp = keccak(temp)
+        self.segment_index = index
+        self.segment_count = count
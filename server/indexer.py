@@ -0,0 +1,212 @@
+from eth_utils import event_abi_to_log_topic
+from common.bundle import OUT, load_bundle
+from common.watcher import get_watcher
+from common.transport import RPC_URL, connect
+import argparse
+import json
+import os
+import sqlite3
+
+# Incremental event indexer. Pulls the Blackjack and CommitReveal2 logs with
+# eth_getLogs over block windows whose size adapts to the node (halved when a
+# request fails or returns too much, doubled while results stay small),
+# decodes them with the ABIs from out/ and stores them in SQLite. The cursor
+# is committed together with each window's rows, so a restart continues where
+# it stopped without gaps or duplicates. Every row carries its round (the
+# `game` column): Blackjack events the last GameCreated, CommitReveal2 events
+# the controller's roundId() at their block.
+#
+#   python indexer.py              # catch up, then follow new blocks
+#   sqlite3 index.db "select * from cards where game = 3"
+#   sqlite3 index.db "select player, args from events where event = 'CommitSubmitted' and game = 3"
+
+INDEX_DB = os.environ.get("INDEX_DB", "index.db")
+CONTROLLER = os.environ.get("CONTROLLER", "0x5FbDB2315678afecb367f032d93F642f64180aa3")
+
+# CardPlayed is emitted by the Helper library; its DealerResult/PlayerResult
+# are declared but never emitted
+HELPER_ARTIFACT = "BlackjackHelper.sol/Helper.json"
+EVENTS = {
+    "game": ["CardPlayed", "GameCreated"],
+    "cr2": ["CommitSubmitted", "SecretRevealed", "TurnSkipped", "RandomnessGenerated"],
+}
+
+MIN_WINDOW = 1
+MAX_WINDOW = 100_000
+# shrink the window when a single request returns more logs than this
+TARGET_LOGS = 2_000
+
+SCHEMA = """
+create table if not exists cursor (
+    name text primary key,
+    value integer not null
+);
+create table if not exists events (
+    block integer not null,
+    log_index integer not null,
+    tx text not null,
+    contract text not null,
+    event text not null,
+    game integer,
+    player text,
+    args text not null,
+    primary key (block, log_index)
+);
+create index if not exists events_event_game on events (event, game);
+create index if not exists events_player on events (player, event);
+create index if not exists events_game on events (game);
+
+create view if not exists cards as
+    select game, block, log_index, player,
+        json_extract(args, '$.card.value') as value,
+        json_extract(args, '$.card.suit') as suit,
+        json_extract(args, '$.seed') as seed
+    from events where event = 'CardPlayed';
+drop view if exists games;
+create view games as
+    select game, min(block) as first_block, max(block) as last_block,
+        count(distinct case when event = 'CardPlayed' then nullif(player, '0x0000000000000000000000000000000000000000') end) as players,
+        sum(event = 'CardPlayed') as cards
+    from events where game is not null group by game;
+"""
+
+
+def event_abis(abi, names):
+    return {item["name"]: item for item in abi if item.get("type") == "event" and item["name"] in names}
+
+
+def load_events(bundle):
+    # name -> abi per contract, from the bundled ABIs plus the Helper artifact
+    abis = {name: event_abis(bundle["abis"][name], EVENTS[name]) for name in EVENTS}
+    try:
+        with open(os.path.join(OUT, HELPER_ARTIFACT)) as f:
+            helper = json.load(f)["abi"]
+        abis["game"].update(event_abis(helper, EVENTS["game"]))
+    except OSError:
+        # solc >= 0.8.20 also lists library events in the Game ABI
+        pass
+    return abis
+
+
+def encode(value):
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    if isinstance(value, dict):
+        return {k: encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(v) for v in value]
+    return value
+
+
+class Indexer:
+    def __init__(self, w3, bundle, path=INDEX_DB, window=2_000, confirmations=0):
+        self.w3 = w3
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.window = window
+        self.confirmations = confirmations
+
+        abis = load_events(bundle)
+        self.decoders = {}
+        for name, events in abis.items():
+            contract = w3.eth.contract(address=bundle["addresses"][name], abi=list(events.values()))
+            for event, abi in events.items():
+                self.decoders[bytes(event_abi_to_log_topic(abi))] = (event, getattr(contract.events, event)())
+        self.game = bundle["addresses"]["game"]
+        self.cr2 = bundle["addresses"]["cr2"]
+        self.controller = w3.eth.contract(address=bundle["addresses"]["controller"], abi=bundle["abis"]["controller"])
+        self.addresses = [bundle["addresses"][name] for name in EVENTS]
+
+    def get(self, name, default):
+        row = self.db.execute("select value from cursor where name = ?", (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def sync(self, from_block=0):
+        # index everything up to the head (minus confirmations); returns the new cursor
+        head = self.w3.eth.block_number - self.confirmations
+        start = self.get("block", from_block - 1) + 1
+        game = self.get("game", None)
+        while start <= head:
+            end = min(start + self.window - 1, head)
+            try:
+                logs = self.w3.eth.get_logs({
+                    "address": self.addresses,
+                    "fromBlock": start,
+                    "toBlock": end,
+                    "topics": [list(self.decoders)],
+                })
+            except Exception as e:
+                # range or result limits differ per node; retry smaller
+                if self.window == MIN_WINDOW:
+                    raise
+                self.window = max(MIN_WINDOW, self.window // 2)
+                print(f"getLogs {start}-{end} failed ({e}), window {self.window}")
+                continue
+            if len(logs) > TARGET_LOGS and self.window > MIN_WINDOW:
+                self.window = max(MIN_WINDOW, self.window // 2)
+            elif len(logs) < TARGET_LOGS // 4:
+                self.window = min(MAX_WINDOW, self.window * 2)
+
+            game = self.store(sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"])), game, end)
+            if logs:
+                print(f"indexed {start}-{end}: {len(logs)} logs")
+            start = end + 1
+        return start - 1
+
+    def round_at(self, block, game):
+        # commits and reveals happen in setup, before the round's GameCreated;
+        # without the state of that block (pruned node) it is the round after
+        # the last game
+        try:
+            return self.controller.functions.roundId().call(block_identifier=block)
+        except Exception:
+            return None if game is None else game + 1
+
+    def store(self, logs, game, end):
+        rows = []
+        rounds = {}
+        for log in logs:
+            event, decoder = self.decoders[bytes(log["topics"][0])]
+            args = dict(decoder.process_log(log)["args"])
+            # CardPlayed.gameId is never set on-chain; cards belong to the last GameCreated
+            if event == "GameCreated":
+                game = args["gameId"]
+            if log["address"] == self.cr2:
+                if log["blockNumber"] not in rounds:
+                    rounds[log["blockNumber"]] = self.round_at(log["blockNumber"], game)
+                round = rounds[log["blockNumber"]]
+            else:
+                round = game if log["address"] == self.game else None
+            player = args.get("player") or args.get("participant")
+            rows.append((
+                log["blockNumber"], log["logIndex"], "0x" + bytes(log["transactionHash"]).hex(),
+                log["address"], event, round, player, json.dumps(encode(args)),
+            ))
+        with self.db:
+            self.db.executemany("insert or replace into events values (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("insert or replace into cursor values ('block', ?)", (end,))
+            if game is not None:
+                self.db.execute("insert or replace into cursor values ('game', ?)", (game,))
+        return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="index contract events into SQLite")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--window", type=int, default=2_000, help="initial getLogs block window")
+    parser.add_argument("--confirmations", type=int, default=0)
+    parser.add_argument("--once", action="store_true", help="catch up and exit")
+    args = parser.parse_args()
+
+    w3 = connect(RPC_URL)
+    assert w3.is_connected(), "Node is not running!"
+    indexer = Indexer(w3, load_bundle(w3, CONTROLLER), window=args.window, confirmations=args.confirmations)
+    while True:
+        indexer.sync(args.from_block)
+        if args.once:
+            break
+        get_watcher(w3).wait_block(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import os
+
+# Crash-safe house journal. Every round transition appends one JSON line and
+# fsyncs it before the matching transaction goes out, so a restarted house can
+# rebuild the in-flight round (salt, CRR secret, random, cut chain, last
+# revealed link) instead of resetting it. Progress itself (committed? chain
+# submitted? cut applied?) is read back from the contracts; the journal only
+# has to hold what the chain can't tell us.
+#
+#   {"round": 7, "step": "commit", "s": "..", "co": "..", "cv": ".."}
+
+HOUSE_JOURNAL = os.environ.get("HOUSE_JOURNAL", "house.journal")
+
+
+class Journal:
+    def __init__(self, path=HOUSE_JOURNAL):
+        self.path = path
+        self.rounds = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        # a torn last line from a crash mid-write
+                        break
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self.file = os.fdopen(fd, "a")
+
+    def _apply(self, record):
+        self.rounds.setdefault(record["round"], {})[record["step"]] = record
+
+    def record(self, round, step, **data):
+        record = {"round": round, "step": step, **data}
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self._apply(record)
+
+    def round(self, round):
+        return RoundLog(self, round)
+
+    def prune(self, keep):
+        # drop finished rounds; write-then-rename so a crash leaves either file
+        records = [r for round, steps in sorted(self.rounds.items()) if round >= keep for r in steps.values()]
+        tmp = self.path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_TRUNC | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.rounds = {r: s for r, s in self.rounds.items() if r >= keep}
+        self.file = open(self.path, "a")
+
+
+class RoundLog:
+    def __init__(self, journal, round):
+        self.journal = journal
+        self.round = round
+
+    def get(self, step):
+        if self.journal is None:
+            return None
+        return self.journal.rounds.get(self.round, {}).get(step)
+
+    def record(self, step, **data):
+        if self.journal is not None:
+            self.journal.record(self.round, step, **data)
+
+
+# functions take log=NULL_LOG when no journal is kept
+NULL_LOG = RoundLog(None, None)
+
@@ -1,9 +1,18 @@
-from web3 import Web3
-from cr2 import setupExec
+from cr2 import setupExec, resume_chain
 from game import gameExec
 from verify import verifyExec
 from web3.middleware import SignAndSendRawMiddlewareBuilder
-import time
+from common.watcher import get_watcher
+from common.batch import read
+from journal import Journal
+from common.bundle import load_contracts
+from common.txpipe import install, send, confirm, flush
+import metrics
+from common import schedule
+from common.tracing import Tracer, TraceMiddlewareBuilder, TRACE_FILE, span
+from common.transport import connect
+from common.recorder import recorder
+from gasbook import GasBook, GAS_DB
 import os
 import secrets
 
@@ -13,7 +22,8 @@ import secrets
 
 HOUSE_PRIVATE_KEY = os.environ["HOUSE_PK"]
 
-w3 = Web3(Web3.HTTPProvider("http://127.0.0.1:8545"))
+# HTTP, WebSocket or IPC by RPC_URL (see common/transport.py)
+w3 = connect()
 assert w3.is_connected(), "Node is not running!"
 
 house_account = w3.eth.account.from_key(HOUSE_PRIVATE_KEY)
@@ -25,53 +35,41 @@ w3.middleware_onion.inject(
     SignAndSendRawMiddlewareBuilder.build(house_account),
     layer=0
 )
+# every RPC request into a ring buffer, dumped on exit / SIGUSR1 with TRACE_FILE
+# set (see common/tracing.py); the round trace takes its RPC calls from it too
+tracer = None
+if TRACE_FILE or recorder.path:
+    tracer = Tracer()
+    w3.middleware_onion.inject(TraceMiddlewareBuilder.build(tracer), layer=0)
+if TRACE_FILE:
+    tracer.dump_to(TRACE_FILE)
 w3.eth.default_account = house_account.address
-# Load contract ABI + address
-import json
-
-with open("./../out/Controller.sol/BlackjackController.json") as f:
-    artifact = json.load(f)
-abi = artifact["abi"]
-
-controllerAddr= Web3.to_checksum_address("0x5FbDB2315678afecb367f032d93F642f64180aa3")
-controller  = w3.eth.contract(address=controllerAddr, abi=abi)
-
-
-setup_address = controller.functions.setup().call()
-with open("./../out/Setup.sol/Setup.json") as f:
-    artifact = json.load(f)
-abi = artifact["abi"]
-
-setupAddr= Web3.to_checksum_address(setup_address)
-setup = w3.eth.contract(address=setupAddr, abi=abi)
-
-with open("./../out/CRR2.sol/CommitReveal2.json") as f:
-    artifact = json.load(f)
-abi = artifact["abi"]
-
-cr2_address = setup.functions.cr().call()
-cr2Addr= Web3.to_checksum_address(cr2_address)
-cr2 = w3.eth.contract(address=cr2Addr, abi=abi)
-
-
-
-game_address = controller.functions.game().call()
-with open("./../out/Game.sol/Blackjack.json") as f:
-    artifact = json.load(f)
-abi = artifact["abi"]
-
-gameAddr= Web3.to_checksum_address(game_address)
-game = w3.eth.contract(address=gameAddr, abi=abi)
-
-
-
-verify_address= controller.functions.verify().call()
-with open("./../out/Verify.sol/Verify.json") as f:
-    artifact = json.load(f)
-abi = artifact["abi"]
-
-verifyAddr= Web3.to_checksum_address(verify_address)
-verify= w3.eth.contract(address=verifyAddr, abi=abi)
+# house transactions are signed locally with a tracked nonce (see common/txpipe.py)
+install(w3, house_account)
+# Prometheus metrics, only with METRICS_PORT set (see metrics.py)
+if metrics.METRICS_PORT:
+    metrics.instrument(w3)
+# Load contract ABIs + addresses (cached bundle, see common/bundle.py)
+controllerAddr= "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+controller, setup, cr2, game, verify = load_contracts(w3, controllerAddr)
+# time based phases are slept through until their on-chain deadline (see common/schedule.py)
+schedule.install(w3, setup, cr2, game)
+if tracer is not None:
+    tracer.label(controller=controller, setup=setup, cr2=cr2, game=game, verify=verify)
+# phase changes, RPC calls, transactions and failures per round, with
+# unless ROUND_TRACE_FILE=off (see common/recorder.py)
+recorder.attach(w3, tracer, "house")
+recorder.label(controller=controller, setup=setup, cr2=cr2, game=game, verify=verify)
+# gasUsed per function, round and build, only with GAS_DB set (see gasbook.py)
+gas = None
+if GAS_DB:
+    gas = GasBook()
+    gas.label(controller=controller, setup=setup, cr2=cr2, game=game, verify=verify)
+    gas.attach(w3)
+if metrics.METRICS_PORT:
+    metrics.label(controller=controller, setup=setup, cr2=cr2, game=game, verify=verify)
+    metrics.track_phases(w3, controller=controller, setup=setup, cr2=cr2, game=game)
+    metrics.serve()
 
 
 
@@ -83,57 +81,103 @@ user      = w3.eth.account.from_key(PRIVATE_KEY_USER)
 
 print("Registrar:", registrar.address)
 print("User:", user.address) 
-tx_hash = controller.functions.reset().transact()
-receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-
-salt = secrets.randbits(256)
+journal = Journal()
+
+
+@span("reset")
+def reset():
+    # settle whatever the failed round left in flight first
+    try:
+        flush(w3)
+    except Exception as e:
+        print("dropping failed transactions:", e)
+    receipt = confirm(w3, send(w3, controller.functions.reset()))
+    metrics.RESETS.inc()
+    # the finished round can't be resumed anymore
+    id = controller.functions.roundId().call()
+    journal.prune(id)
+    # every commit of the new round comes after this block (see common/revealorder.py)
+    journal.round(id).record("start", block=receipt["blockNumber"])
+    return secrets.randbits(256), None
+
+
+# rebuild chain and random of a journaled round after a restart
+def resume(log, verifying=False):
+    chain = resume_chain(log, game.functions.getAnchor().call())
+    if chain is None:
+        raise Exception("round can't be rebuilt from the journal")
+    if gas is not None:
+        gas.context(players=setup.functions.playerCount().call(), chain_length=log.get("cut")["length"] - 1)
+    if verifying:
+        # verifyAnchor takes the index of the final anchor
+        chain = chain[:len(chain)-1]
+    return chain, bytes.fromhex(log.get("random")["random"])
+
+
+id, phase = read(w3, controller.functions.roundId(), controller.functions.getPhase())
+if journal.round(id).get("salt") is None:
+    salt, chain = reset()
+else:
+    print("resuming round", id, "in phase", phase)
+    salt, chain = int(journal.round(id).get("salt")["salt"], 16), None
 
-chain = []
 random=0
 while True:
-    id = controller.functions.roundId().call()
-    phase = controller.functions.getPhase().call()
+    id, phase = read(w3, controller.functions.roundId(), controller.functions.getPhase())
+    log = journal.round(id)
+    recorder.round(id)
+    if gas is not None and gas.round != id:
+        # players and the cut chain length follow once setupExec knows them
+        gas.context(round=id, players=None, chain_length=None)
     print("controler phase: ", phase)
     if phase == 0:
         print("--------------- in setup ")
         try:
-            chain, salt, random = setupExec(setup,cr2,controller,w3,user,registrar,salt)
+            with span("setup"):
+                chain, salt, random = setupExec(setup,cr2,controller,w3,user,registrar,salt,log,gas=gas)
             print("chain lent:",len(chain))
-            tx_hash = controller.functions.startGame().transact()
-            w3.eth.wait_for_transaction_receipt(tx_hash)
+            send(w3, controller.functions.startGame())
+            flush(w3)
         except  Exception as e:
             print("setup failed :(", e)
-            tx_hash = controller.functions.reset().transact()
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            metrics.FAILURES.inc("setup")
+            recorder.error("setup", e)
+            salt, chain = reset()
 
     elif phase == 1:
         print("--------------- in game")
         try:
             print("--------------- exec game")
-            gameExec(game,controller,w3,chain,salt,random)
+            if chain is None:
+                chain, random = resume(log)
+            with span("game"):
+                gameExec(game,controller,w3,chain,salt,random,log)
         except  Exception as e:
             print("setup failed :(", e)
-            tx_hash = controller.functions.reset().transact()
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            metrics.FAILURES.inc("game")
+            recorder.error("game", e)
+            salt, chain = reset()
         try:
             print("--------------- exec verify")
             print("verify exec")
-            tx= controller.functions.verifyGame().transact()
-            w3.eth.wait_for_transaction_receipt(tx)
+            confirm(w3, send(w3, controller.functions.verifyGame()))
         except  Exception as e:
             print("verifyGmae failed :(", e)
-            tx_hash = controller.functions.reset().transact()
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            metrics.FAILURES.inc("verifyGame")
+            recorder.error("verifyGame", e)
+            salt, chain = reset()
 
     elif phase == 2:
         print("--------------- in verify")
         try:
-            verifyExec(verify,w3,chain,salt,id)
+            if chain is None:
+                chain, random = resume(log, verifying=True)
+            with span("verify"):
+                verifyExec(verify,w3,chain,salt,id,setup,game)
+            metrics.ROUNDS.inc()
         except  Exception as e:
             print("verify failed :(", e)
-        tx_hash = controller.functions.reset().transact()
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    time.sleep(1)
-
-
-
+            metrics.FAILURES.inc("verify")
+            recorder.error("verify", e)
+        salt, chain = reset()
+    get_watcher(w3).wait_block(timeout=1)
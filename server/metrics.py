@@ -0,0 +1,308 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from common.batch import read_each
+from common.tracing import selectors
+import bisect
+import os
+import threading
+import time
+
+# Prometheus metrics for the house. Counters and histograms are plain objects
+# updated in-process (a lock and a few additions per sample); the text format
+# is only rendered when /metrics is scraped, from a daemon thread.
+#
+#   serve(METRICS_PORT)
+#   instrument(w3)                    # RPC calls and transactions, before the first request
+#   instrument_async(w3)              # the same for AsyncWeb3 (tables.py)
+#   label(setup=setup, game=game)     # name eth_calls after the contract function
+#   track_phases(w3, setup=setup)     # time spent per phase
+#   METRICS_PORT=9464 python main.py; curl localhost:9464/metrics
+
+# off by default; the house serves /metrics only when a port is given
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+
+RPC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+TX_BUCKETS = (0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+PHASE_BUCKETS = (1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 300, 600)
+
+# enum names from the contracts, indexed by getPhase()
+PHASES = {
+    "controller": ["Setup", "Game", "Verification"],
+    "setup": ["BETTING", "RNG", "CHAIN", "CUT", "CUTCHAIN"],
+    "cr2": ["Commit", "Reveal1", "OrderCalculation", "Reveal2", "Finished"],
+    "game": ["DEAL_CARDS", "PLAYER_ROUND", "DEALER_ROUND", "FINISHED"],
+}
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+            lines += self.samples(items)
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self, items):
+        return [f"{self.name}_total{format_labels(self.labels, key)} {value}" for key, value in items]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self, items):
+        return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=RPC_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # per label set: [count per bucket (not cumulative), sum, count]
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, *self.labels)
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+PHASE_SECONDS = register(Histogram(
+    "blackjack_phase_seconds", "Time spent in a contract phase", ("contract", "phase"), PHASE_BUCKETS))
+PHASE = register(Gauge("blackjack_phase", "Current getPhase() of a contract", ("contract",)))
+RPC_REQUESTS = register(Counter(
+    "blackjack_rpc_requests", "JSON-RPC requests by method and contract function", ("method", "function")))
+RPC_SECONDS = register(Histogram("blackjack_rpc_seconds", "JSON-RPC round trip time", ("method",)))
+TX_SECONDS = register(Histogram(
+    "blackjack_tx_confirm_seconds", "Time from broadcast to receipt", ("function",), TX_BUCKETS))
+TX_REVERTS = register(Counter("blackjack_tx_reverts", "Mined transactions that reverted", ("function",)))
+TX_GAS = register(Counter("blackjack_tx_gas", "Gas used by mined transactions", ("function",)))
+RESETS = register(Counter("blackjack_resets", "controller.reset() calls"))
+ROUNDS = register(Counter("blackjack_rounds", "Rounds the house finished verifying"))
+FAILURES = register(Counter("blackjack_failures", "Round steps that failed and led to a reset", ("step",)))
+SKIPS = register(Counter("blackjack_skipped_revealers", "Stalled revealers skipped with skipStalledUser"))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=METRICS_PORT, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"metrics on http://{host}:{port}/metrics")
+    return server
+
+
+# ---------------------------------------------------------
+# RPC calls and transactions
+# ---------------------------------------------------------
+
+def call_name(names, method, params):
+    # the contract function an eth_call/eth_estimateGas is for, "" otherwise
+    if method not in ("eth_call", "eth_estimateGas") or not params or not isinstance(params[0], dict):
+        return ""
+    call = params[0]
+    data = call.get("data") or call.get("input") or ""
+    if isinstance(data, str):
+        data = bytes.fromhex(data[2:10]) if data.startswith("0x") else b""
+    return names.get((str(call.get("to", "")).lower(), bytes(data[:4])), "")
+
+
+# (address, selector) -> "name.function" for the RPC labels, see label()
+NAMES = {}
+
+
+def instrument(w3):
+    # has to run before the first request through w3: web3 binds make_request
+    # when it builds the middleware chain
+    provider = w3.provider
+    make_request = provider.make_request
+    make_batch_request = getattr(provider, "make_batch_request", None)
+
+    def counted(method, params):
+        RPC_REQUESTS.inc(method, call_name(NAMES, method, params))
+        with RPC_SECONDS.time(method):
+            return make_request(method, params)
+
+    def counted_batch(requests):
+        for method, params in requests:
+            RPC_REQUESTS.inc(method, call_name(NAMES, method, params))
+        with RPC_SECONDS.time("batch"):
+            return make_batch_request(requests)
+
+    provider.make_request = counted
+    if make_batch_request is not None:
+        provider.make_batch_request = counted_batch
+
+    from common.txpipe import get_pipeline
+    pipe = get_pipeline(w3)
+    if pipe is not None:
+        pipe.listeners.append(record_tx)
+
+
+def instrument_async(w3):
+    # instrument() for AsyncWeb3 (tables.py); its transactions come in
+    # through async_house.listeners
+    provider = w3.provider
+    make_request = provider.make_request
+    make_batch_request = getattr(provider, "make_batch_request", None)
+
+    async def counted(method, params):
+        RPC_REQUESTS.inc(method, call_name(NAMES, method, params))
+        with RPC_SECONDS.time(method):
+            return await make_request(method, params)
+
+    async def counted_batch(requests):
+        for method, params in requests:
+            RPC_REQUESTS.inc(method, call_name(NAMES, method, params))
+        with RPC_SECONDS.time("batch"):
+            return await make_batch_request(requests)
+
+    provider.make_request = counted
+    if make_batch_request is not None:
+        provider.make_batch_request = counted_batch
+
+
+def label(**contracts):
+    NAMES.update(selectors(**contracts))
+
+
+def record_tx(name, receipt, sent):
+    # TxPipeline listener
+    TX_SECONDS.observe(time.monotonic() - sent, name)
+    TX_GAS.inc(name, amount=receipt["gasUsed"])
+    if receipt["status"] == 0:
+        TX_REVERTS.inc(name)
+
+
+# ---------------------------------------------------------
+# phases
+# ---------------------------------------------------------
+
+def track_phases(w3, **contracts):
+    # one batched getPhase() read per block for all contracts; a phase's time
+    # is observed when it is left, so a stalled phase shows up in
+    # blackjack_phase and as a missing _count increase
+    from common.watcher import get_watcher
+    from common.recorder import recorder
+
+    def run():
+        current = {}
+        watcher = get_watcher(w3)
+        while True:
+            try:
+                values = read_each(w3, *[contract.functions.getPhase() for contract in contracts.values()])
+                now = time.monotonic()
+                for (name, contract), value in zip(contracts.items(), values):
+                    if isinstance(value, Exception):
+                        continue
+                    PHASE.set(value, name)
+                    recorder.phase(contract.address, value)
+                    previous = current.get(name)
+                    if previous is not None and previous[0] != value:
+                        PHASE_SECONDS.observe(now - previous[1], name, phase_name(name, previous[0]))
+                    if previous is None or previous[0] != value:
+                        current[name] = (value, now)
+                # phases are block.timestamp based; re-read at least once a second
+                watcher.wait_block(timeout=1)
+            except Exception as e:
+                print("phase tracking error:", e)
+                time.sleep(1)
+
+    threading.Thread(target=run, name="phase-metrics", daemon=True).start()
+
+
+def phase_name(contract, phase):
+    names = PHASES.get(contract, [])
+    return names[phase] if phase < len(names) else str(phase)
@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+# The hash chain seed is keccak(omega_o, salt) and can't exist before CRR
+# finishes; background() hashes it on a worker as soon as omega_o is known,
+# while the house waits for the CHAIN window.
+#
+#   chain = background(generate, random, salt)   # Future; .result() in the window
+
+workers = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pregen")
+
+
+def forget():
+    # a forked child inherits the pool but not its thread
+    global workers
+    workers = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pregen")
+
+
+os.register_at_fork(after_in_child=forget)
+
+
+def background(fn, *args):
+    return workers.submit(fn, *args)
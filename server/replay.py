@@ -0,0 +1,188 @@
+from web3 import Web3
+from eth_abi import decode
+from eth_hash.auto import keccak
+from common.bundle import load_contracts
+from common.batch import read
+from common.transport import RPC_URL, connect
+import numpy as np
+import argparse
+import os
+import time
+
+# Off-chain replay of dealt cards and hand totals. Rebuilds every hand from the
+# CardPlayed events of the Blackjack contract, recomputes each card the way
+# Helper._drawCard does (keccak(seed, cardCount)) and every total the way
+# _updateHandTotal does, and compares the result with the events and with the
+# final on-chain player/dealer state. Hashing is the only per-card Python
+# work; card values, suits and totals are computed as NumPy arrays over all
+# rounds at once.
+#
+#   python replay.py --from-block 0 --to-block latest
+#
+# numpy is an optional dependency of the server: uv sync --extra replay
+
+CONTROLLER = os.environ.get("CONTROLLER", "0x5FbDB2315678afecb367f032d93F642f64180aa3")
+
+# emitted by the Helper library, so the Game ABI may not carry them
+CARD_PLAYED = Web3.keccak(text="CardPlayed(bytes32,(uint8,uint8),address,uint256)")
+GAME_CREATED = Web3.keccak(text="GameCreated(uint256)")
+DEALER = "0x0000000000000000000000000000000000000000"
+BUSTED = 3
+
+
+def draw(seeds, counts):
+    # rand % 13 and (rand / 13) % 4 both follow from rand % 52, which is
+    # folded byte by byte over all digests at once
+    digests = b"".join(keccak(seed + count.to_bytes(32, "big")) for seed, count in zip(seeds, counts))
+    digits = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 32).astype(np.uint32)
+    rand = np.zeros(len(digits), dtype=np.uint32)
+    for i in range(32):
+        rand = (rand * 256 + digits[:, i]) % 52
+    return (rand % 13 + 1).astype(np.uint8), (rand // 13).astype(np.uint8)
+
+
+def hand_totals(values):
+    # values: (hands, cards) in deal order, 0 past the end of a hand
+    total = np.zeros(len(values), dtype=np.int32)
+    soft = np.zeros(len(values), dtype=bool)
+    for j in range(values.shape[1]):
+        card = values[:, j].astype(np.int32)
+        ace = card == 1
+        total += np.where(ace, 11, np.minimum(card, 10))
+        soft |= ace
+        bust = (total > 21) & soft
+        total -= 10 * bust
+        soft &= ~bust
+    return total, soft
+
+
+def fetch(w3, game, from_block, to_block, step=10_000):
+    # CardPlayed.gameId is never set on-chain, so cards are assigned to the
+    # game of the last GameCreated before them
+    to_block = w3.eth.block_number if to_block == "latest" else to_block
+    logs = []
+    for start in range(from_block, to_block + 1, step):
+        logs += w3.eth.get_logs({
+            "address": game.address,
+            "fromBlock": start,
+            "toBlock": min(start + step - 1, to_block),
+            "topics": [[CARD_PLAYED, GAME_CREATED]],
+        })
+    logs.sort(key=lambda log: (log["blockNumber"], log["logIndex"]))
+
+    rounds = []
+    for log in logs:
+        if log["topics"][0] == GAME_CREATED:
+            (id,) = decode(["uint256"], log["data"])
+            rounds.append({"game": id, "cards": []})
+        elif rounds:
+            seed, (value, suit), player, _ = decode(["bytes32", "(uint8,uint8)", "address", "uint256"], log["data"])
+            rounds[-1]["cards"].append((seed, value, suit, Web3.to_checksum_address(player)))
+    return rounds
+
+
+def replay(rounds):
+    seeds, counts, values, suits, hands, positions = [], [], [], [], [], []
+    hand_index = {}
+    for r, round in enumerate(rounds):
+        for count, (seed, value, suit, player) in enumerate(round["cards"], start=1):
+            key = (r, player)
+            if key not in hand_index:
+                hand_index[key] = [len(hand_index), 0]
+            h = hand_index[key]
+            seeds.append(seed)
+            counts.append(count)
+            values.append(value)
+            suits.append(suit)
+            hands.append(h[0])
+            positions.append(h[1])
+            h[1] += 1
+
+    results = [{"game": round["game"], "hands": {}, "mismatches": []} for round in rounds]
+    if not seeds:
+        return results
+
+    drawn_values, drawn_suits = draw(seeds, counts)
+    wrong = np.nonzero((drawn_values != np.array(values)) | (drawn_suits != np.array(suits)))[0]
+
+    matrix = np.zeros((len(hand_index), max(h[1] for h in hand_index.values())), dtype=np.uint8)
+    matrix[np.array(hands), np.array(positions)] = drawn_values
+    totals, soft = hand_totals(matrix)
+
+    for (r, player), (h, n) in hand_index.items():
+        results[r]["hands"][player] = {
+            "cards": matrix[h, :n].tolist(),
+            "total": int(totals[h]),
+            "soft": bool(soft[h]),
+        }
+
+    # map card index back to its round
+    starts = np.cumsum([0] + [len(round["cards"]) for round in rounds])
+    for i in wrong:
+        r = int(np.searchsorted(starts, i, side="right")) - 1
+        results[r]["mismatches"].append(
+            f"card {counts[i]}: event {values[i]}/{suits[i]}, replay {drawn_values[i]}/{drawn_suits[i]}"
+        )
+
+    # every new seed must be the preimage of the previous one
+    for round, result in zip(rounds, results):
+        chain = [seed for i, (seed, *_) in enumerate(round["cards"]) if i == 0 or seed != round["cards"][i-1][0]]
+        for previous, seed in zip(chain, chain[1:]):
+            if keccak(seed) != previous:
+                result["mismatches"].append(f"seed {seed.hex()} does not hash to {previous.hex()}")
+    return results
+
+
+def check(w3, game, results):
+    # compare replayed totals with the final state of each game
+    for result in results:
+        id = result["game"]
+        (addrs, bets, totals, statuses), dealer = read(
+            w3, game.functions.getAllPlayerResolveViews(id), game.functions.getDealerTotal(id)
+        )
+        hands = result["hands"]
+        if DEALER in hands and hands[DEALER]["total"] != dealer:
+            result["mismatches"].append(f"dealer total: chain {dealer}, replay {hands[DEALER]['total']}")
+        for addr, total, status in zip(addrs, totals, statuses):
+            hand = hands.get(addr)
+            if hand is None:
+                result["mismatches"].append(f"{addr}: no cards replayed")
+                continue
+            if hand["total"] != total:
+                result["mismatches"].append(f"{addr} total: chain {total}, replay {hand['total']}")
+            if (status == BUSTED) != (hand["total"] > 21):
+                result["mismatches"].append(f"{addr} status {status} with replayed total {hand['total']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay dealt cards and hand totals off-chain")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--to-block", default="latest")
+    parser.add_argument("--no-check", action="store_true", help="don't compare with the on-chain state")
+    args = parser.parse_args()
+    to_block = args.to_block if args.to_block == "latest" else int(args.to_block)
+
+    w3 = connect(RPC_URL)
+    assert w3.is_connected(), "Node is not running!"
+    controller, setup, cr2, game, verify = load_contracts(w3, CONTROLLER)
+
+    start = time.monotonic()
+    rounds = fetch(w3, game, args.from_block, to_block)
+    fetched = time.monotonic()
+    results = replay(rounds)
+    replayed = time.monotonic()
+    if not args.no_check:
+        check(w3, game, results)
+
+    bad = [result for result in results if result["mismatches"]]
+    for result in bad:
+        for mismatch in result["mismatches"]:
+            print(f"game {result['game']}: {mismatch}")
+    cards = sum(len(round["cards"]) for round in rounds)
+    print(f"{len(rounds)} games, {cards} cards, {len(bad)} with mismatches "
+          f"(fetch {fetched - start:.2f}s, replay {replayed - fetched:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+from web3 import Web3
+from web3.middleware import SignAndSendRawMiddlewareBuilder
+import async_house
+from async_house import setupExec, gameExec, verifyExec, resolveExec, read, transact, get_watcher, install
+from cr2 import resume_chain
+from journal import Journal, HOUSE_JOURNAL
+from common.bundle import cached_bundle, read_abis, save_bundle, contracts
+from common.transport import RPC_URL, connect_async
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+import asyncio
+import os
+import secrets
+import sys
+
+# Multi-table house: drives the setup -> game -> verify cycle of many
+# BlackjackController deployments at once. Every table runs as its own asyncio
+# task with its own chain/salt/random and its own failure handling; tables
+# sharing a house key share one process (nonces), and each distinct house key
+# gets its own worker process.
+#
+#   python tables.py 0xCtlA 0xCtlB 0xCtlC=OTHER_HOUSE_PK
+#
+# A table spec is a controller address, optionally followed by "=ENV" naming the
+# environment variable holding that table's house key (default HOUSE_PK).
+#
+# The wiring follows main.py: RPC_URL picks the transport (common/transport.py),
+# house transactions go through a locally tracked nonce (async_house.install),
+# every table journals its rounds to HOUSE_JOURNAL.<controller> and resumes a
+# round in the game or verify phase after a restart, and METRICS_PORT serves
+# /metrics, one port up per worker process.
+
+MAX_BACKOFF = 60
+
+
+async def connect(private_key, metrics_port=0):
+    w3 = await connect_async(RPC_URL)
+    if metrics_port:
+        metrics.instrument_async(w3)
+    assert await w3.is_connected(), "Node is not running!"
+
+    house_account = w3.eth.account.from_key(private_key)
+    print("HOUSE address:", house_account.address)
+    w3.middleware_onion.inject(SignAndSendRawMiddlewareBuilder.build(house_account), layer=0)
+    w3.eth.default_account = house_account.address
+    install(w3, house_account)
+    return w3, house_account
+
+
+async def load_contracts(w3, controller_address):
+    chain_id = await w3.eth.chain_id
+    bundle = cached_bundle(chain_id, controller_address)
+    if bundle is None:
+        abis = read_abis()
+        controller = w3.eth.contract(address=Web3.to_checksum_address(controller_address), abi=abis["controller"])
+        setup_address, game_address, verify_address = await read(
+            w3, controller.functions.setup(), controller.functions.game(), controller.functions.verify()
+        )
+        setup = w3.eth.contract(address=setup_address, abi=abis["setup"])
+        cr2_address = await setup.functions.cr().call()
+        bundle = save_bundle(chain_id, {
+            "controller": controller.address,
+            "setup": setup_address,
+            "cr2": cr2_address,
+            "game": game_address,
+            "verify": verify_address,
+        }, abis)
+    return contracts(w3, bundle)
+
+
+class Table:
+    def __init__(self, w3, user, controller, setup, cr2, game, verify):
+        self.w3 = w3
+        self.user = user
+        self.controller = controller
+        self.setup = setup
+        self.cr2 = cr2
+        self.game = game
+        self.verify = verify
+        self.name = controller.address[:10]
+        self.journal = Journal(f"{HOUSE_JOURNAL}.{controller.address}")
+        self.stage = "setup"
+
+        self.chain = []
+        self.salt = secrets.randbits(256)
+        self.random = 0
+        self.failures = 0
+        self.rounds = 0
+        self.resolving = set()
+
+    def log(self, *args):
+        print(f"[{self.name}]", *args)
+
+    async def run(self):
+        id, phase = await read(self.w3, self.controller.functions.roundId(), self.controller.functions.getPhase())
+        salt = self.journal.round(id).get("salt")
+        # a journaled round is resumed in Setup too: reset() would drop its players
+        if salt is None:
+            await self.reset()
+        else:
+            self.log("resuming round", id, "in phase", phase)
+            self.salt, self.chain = int(salt["salt"], 16), None
+        while True:
+            try:
+                await self.step()
+                self.failures = 0
+            except Exception as e:
+                await self.fail(e)
+            await get_watcher(self.w3).wait_block(timeout=1)
+
+    async def step(self):
+        w3 = self.w3
+        id, phase = await read(w3, self.controller.functions.roundId(), self.controller.functions.getPhase())
+        log = self.journal.round(id)
+        if phase == 0:
+            self.log("--------------- in setup", id)
+            self.stage = "setup"
+            result = await setupExec(self.setup,self.cr2,self.controller,w3,self.user,self.user,self.salt,log)
+            if result is None:
+                # nobody joined; let startGame reset the round
+                self.chain, self.random = [], 0
+            else:
+                self.chain, self.salt, self.random = result
+            await transact(w3, self.controller.functions.startGame())
+
+        elif phase == 1:
+            self.log("--------------- in game", id)
+            self.stage = "game"
+            if self.chain is None:
+                self.chain, self.random = await self.resume(log)
+            await gameExec(self.game,self.controller,w3,self.chain,self.salt,self.random,log)
+
+        elif phase == 2:
+            self.log("--------------- in verify", id)
+            self.stage = "verify"
+            if self.chain is None:
+                self.chain, self.random = await self.resume(log, verifying=True)
+            await verifyExec(self.verify,w3,self.chain,self.salt,id,self.setup,self.game)
+            task = asyncio.create_task(resolveExec(self.verify,w3,id))
+            self.resolving.add(task)
+            task.add_done_callback(self.resolving.discard)
+            metrics.ROUNDS.inc()
+            await self.reset()
+            self.rounds += 1
+
+    async def resume(self, log, verifying=False):
+        # chain and random of a journaled round, as in main.py
+        anchor = await self.game.functions.getAnchor().call()
+        chain = await asyncio.to_thread(resume_chain, log, anchor)
+        if chain is None:
+            raise Exception("round can't be rebuilt from the journal")
+        if verifying:
+            # verifyAnchor takes the index of the final anchor
+            chain = chain[:len(chain)-1]
+        return chain, bytes.fromhex(log.get("random")["random"])
+
+    async def reset(self):
+        receipt = await transact(self.w3, self.controller.functions.reset())
+        metrics.RESETS.inc()
+        # the finished round can't be resumed anymore
+        id = await self.controller.functions.roundId().call()
+        self.journal.prune(id)
+        self.journal.round(id).record("start", block=receipt["blockNumber"])
+        self.chain = []
+        self.salt = secrets.randbits(256)
+        self.random = 0
+
+    async def fail(self, e):
+        # only this table is reset; the other tables keep running
+        self.failures += 1
+        metrics.FAILURES.inc(self.stage)
+        backoff = min(2 ** (self.failures - 1), MAX_BACKOFF)
+        self.log("round failed :(", e, f"- resetting in {backoff}s")
+        await asyncio.sleep(backoff)
+        try:
+            await self.reset()
+        except Exception as e:
+            self.log("reset failed :(", e)
+
+
+async def run_tables(private_key, controllers, metrics_port=metrics.METRICS_PORT):
+    w3, user = await connect(private_key, metrics_port)
+    tables = []
+    for address in controllers:
+        deployment = await load_contracts(w3, address)
+        tables.append(Table(w3, user, *deployment))
+        if metrics_port:
+            controller, setup, cr2, game, verify = deployment
+            metrics.label(controller=controller, setup=setup, cr2=cr2, game=game, verify=verify)
+    if metrics_port:
+        async_house.listeners.append(metrics.record_tx)
+        metrics.serve(metrics_port)
+    print(f"running {len(tables)} tables as", user.address)
+    await asyncio.gather(*[table.run() for table in tables])
+
+
+def worker(args):
+    index, (key_env, controllers) = args
+    # every worker process serves its own port
+    port = metrics.METRICS_PORT and metrics.METRICS_PORT + index
+    asyncio.run(run_tables(os.environ[key_env], controllers, port))
+
+
+def parse(specs):
+    groups = {}
+    for spec in specs:
+        address, _, key_env = spec.partition("=")
+        groups.setdefault(key_env or "HOUSE_PK", []).append(address)
+    return groups
+
+
+def main():
+    specs = sys.argv[1:] or os.environ["CONTROLLERS"].split(",")
+    groups = parse(specs)
+    if len(groups) == 1:
+        worker((0, next(iter(groups.items()))))
+        return
+    with ProcessPoolExecutor(len(groups)) as pool:
+        list(pool.map(worker, enumerate(groups.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+from hexbytes import HexBytes
+from web3 import Web3
+from anchors import CARD_PLAYED, GAME_CREATED, VERIFY_DURATION, history, verify_all, walk
+
+CONTROLLER = Web3.to_checksum_address("0x00000000000000000000000000000000000000c0")
+VERIFY = Web3.to_checksum_address("0x00000000000000000000000000000000000000ef")
+GAME = Web3.to_checksum_address("0x00000000000000000000000000000000000000ba")
+PLAYER = Web3.to_checksum_address("0x00000000000000000000000000000000000000aa")
+
+w3 = Web3()
+controller = w3.eth.contract(CONTROLLER, abi=[
+    {"type": "function", "name": "verifyGame", "inputs": [], "outputs": [], "stateMutability": "nonpayable"},
+])
+verify = w3.eth.contract(VERIFY, abi=[
+    {"type": "function", "name": "verifyAnchor", "outputs": [], "stateMutability": "nonpayable", "inputs": [
+        {"name": "_id", "type": "uint256"},
+        {"name": "salt", "type": "bytes32"},
+        {"name": "length", "type": "uint256"},
+    ]},
+])
+
+
+class Call:
+    def __init__(self, chain, key):
+        self.chain, self.key = chain, key
+
+    def call(self, block_identifier="latest"):
+        return self.chain.state(block_identifier)[self.key]
+
+
+class Functions:
+    def __init__(self, chain):
+        self.chain = chain
+
+    def getFinalRandom(self):
+        return Call(self.chain, "random")
+
+    def getAnchor(self):
+        return Call(self.chain, "anchor")
+
+
+class Contract:
+    def __init__(self, chain, address):
+        self.address = address
+        self.functions = Functions(chain)
+
+
+class Chain:
+    # blocks of a played round: logs, transactions, and Setup/Game state per block
+    def __init__(self):
+        self.blocks = []
+        self.logs = []
+        self.states = []
+        self.read = []
+        self.eth = self
+
+    def mine(self, timestamp, transactions=(), topics=(), **state):
+        number = len(self.blocks)
+        previous = self.states[-1] if self.states else {"random": bytes(32), "anchor": bytes(32)}
+        self.states.append({**previous, **state})
+        self.blocks.append({"number": number, "timestamp": timestamp, "transactions": [
+            {"to": to, "input": HexBytes(data), "hash": HexBytes(Web3.keccak(text=f"{number}:{i}"))}
+            for i, (to, data) in enumerate(transactions)
+        ]})
+        for i, topic in enumerate(topics):
+            self.logs.append({"address": GAME, "blockNumber": number, "logIndex": i, "topics": [HexBytes(topic)]})
+        return number
+
+    def state(self, number):
+        return self.states[number]
+
+    def get_logs(self, params):
+        wanted = {bytes(topic) for topic in params["topics"][0]}
+        return [
+            log for log in self.logs
+            if log["address"] == params["address"] and params["fromBlock"] <= log["blockNumber"] <= params["toBlock"]
+            and bytes(log["topics"][0]) in wanted
+        ]
+
+    def get_block(self, number, full_transactions=False):
+        self.read.append(number)
+        return self.blocks[number]
+
+
+def verify_anchor(id, salt, length):
+    return VERIFY, verify.encode_abi("verifyAnchor", args=[id, salt, length])
+
+
+def verify_game():
+    return CONTROLLER, controller.encode_abi("verifyGame", args=[])
+
+
+def played_round(chain, id, t, random, salt, length):
+    chain.mine(t, topics=[GAME_CREATED], random=random, anchor=walk(random, salt, length + 5))
+    for i in range(3):
+        chain.mine(t + 2 + i, topics=[CARD_PLAYED, CARD_PLAYED])
+    # the house pops the chain down to the final anchor while dealing
+    last = chain.mine(t + 5, topics=[CARD_PLAYED], anchor=walk(random, salt, length))
+    chain.mine(t + 6, [verify_game()])
+    anchor = chain.mine(t + 8, [(PLAYER, b"\x00" * 4), verify_anchor(id, salt, length)])
+    # too late, the verify period is over
+    chain.mine(t + 7 + VERIFY_DURATION, [verify_anchor(id, salt, length)])
+    return last, anchor
+
+
+def test_history_finds_verify_anchor_after_the_last_card():
+    chain = Chain()
+    setup, game = Contract(chain, "setup"), Contract(chain, GAME)
+    chain.mine(0)
+    last, anchor = played_round(chain, 1, 100, b"\x01" * 32, b"\x02" * 32, 40)
+    played_round(chain, 2, 300, b"\x03" * 32, b"\x04" * 32, 35)
+    # a game that is still being played
+    chain.mine(500, topics=[GAME_CREATED])
+    chain.mine(502, topics=[CARD_PLAYED])
+
+    rounds = list(history(chain, controller, verify, setup, game, 0, len(chain.blocks) - 1))
+
+    assert [(r["round"], r["salt"], r["length"]) for r in rounds] == [
+        (1, (b"\x02" * 32).hex(), 40), (2, (b"\x04" * 32).hex(), 35),
+    ]
+    assert rounds[0]["random"] == (b"\x01" * 32).hex()
+    assert rounds[0]["tx"] == chain.blocks[anchor]["transactions"][1]["hash"].hex()
+    assert [ok for _, ok, _ in verify_all(rounds)] == [True, True]
+    # only the blocks from each game's last card until its verify period is over
+    assert chain.read[:4] == [last, last + 1, last + 2, last + 3]
+    assert 1 not in chain.read and len(chain.read) < len(chain.blocks)
@@ -0,0 +1,73 @@
+from eth_hash.auto import keccak
+from hashchain import HashChain
+import pytest
+
+
+def naive(seed, length):
+    chain = [seed]
+    for _ in range(length - 1):
+        chain.append(keccak(chain[-1]))
+    return chain
+
+
+@pytest.mark.parametrize("length", [1, 2, 3, 10, 17, 201])
+def test_links_match_the_naive_chain(length):
+    seed = keccak(b"seed")
+    expected = naive(seed, length)
+    chain = HashChain(seed, length)
+    assert len(chain) == length
+    assert [bytes(link) for link in chain] == expected
+    assert [bytes(chain[i]) for i in range(length)] == expected
+    assert bytes(chain[-1]) == expected[-1]
+
+
+@pytest.mark.parametrize("stride", [1, 3, 7, 64])
+def test_pop_walks_backwards(stride):
+    seed = keccak(b"pop")
+    expected = naive(seed, 50)
+    chain = HashChain(seed, 50, stride)
+    popped = [bytes(chain.pop()) for _ in range(50)]
+    assert popped == expected[::-1]
+    assert len(chain) == 0
+    with pytest.raises(IndexError):
+        chain.pop()
+
+
+def test_peek_then_pop_like_game_reveal():
+    # game.reveal reads chain[len(chain) - 2] before popping the top
+    seed = keccak(b"reveal")
+    expected = naive(seed, 30)
+    chain = HashChain(seed, 30, 4)
+    while len(chain) > 1:
+        index = len(chain) - 2
+        assert bytes(chain[index]) == expected[index]
+        assert bytes(chain.pop()) == expected[index + 1]
+
+
+def test_cut_is_a_prefix_view():
+    seed = keccak(b"cut")
+    expected = naive(seed, 40)
+    chain = HashChain(seed, 40)
+    cut = chain[:len(chain) - 7]
+    assert len(cut) == 33
+    assert bytes(cut[-1]) == expected[32]
+    assert bytes(cut.pop()) == expected[32]
+    # the original is untouched
+    assert len(chain) == 40
+    assert bytes(chain.top()) == expected[39]
+    with pytest.raises(IndexError):
+        chain[1:5]
+
+
+def test_memory_is_sublinear():
+    chain = HashChain(keccak(b"memory"), 10_001)
+    chain.pop()
+    assert chain.memory() <= 2 * 101 * 32
+
+
+def test_index_out_of_range():
+    chain = HashChain(keccak(b"range"), 5)
+    with pytest.raises(IndexError):
+        chain[5]
+    with pytest.raises(ValueError):
+        HashChain(keccak(b"empty"), 0)
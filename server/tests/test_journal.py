@@ -0,0 +1,112 @@
+from cr2 import generate, resume_chain
+from journal import Journal, NULL_LOG
+import json
+
+RANDOM = bytes(range(32))
+SALT = 0x1234
+LENGTH = 20
+CUT = 3
+
+
+def journaled_round(path, round=7):
+    journal = Journal(str(path))
+    log = journal.round(round)
+    log.record("salt", salt=hex(SALT))
+    log.record("chain", length=LENGTH)
+    log.record("random", random=RANDOM.hex())
+    log.record("cut", length=LENGTH + 1 - CUT)
+    return journal, log
+
+
+def cut_chain():
+    chain = generate(RANDOM, SALT, LENGTH)
+    return chain[:len(chain) - CUT]
+
+
+def test_reopened_journal_has_the_round(tmp_path):
+    path = tmp_path / "house.journal"
+    journaled_round(path)
+    log = Journal(str(path)).round(7)
+    assert int(log.get("salt")["salt"], 16) == SALT
+    assert log.get("cut")["length"] == LENGTH + 1 - CUT
+    assert log.get("commit") is None
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / "house.journal"
+    journaled_round(path)
+    with open(path, "a") as f:
+        f.write('{"round": 7, "step": "rev')
+    log = Journal(str(path)).round(7)
+    assert log.get("random")["random"] == RANDOM.hex()
+    assert log.get("reveal") is None
+
+
+def test_later_records_replace_earlier_steps(tmp_path):
+    path = tmp_path / "house.journal"
+    journal, log = journaled_round(path)
+    log.record("reveal", index=16)
+    log.record("reveal", index=15)
+    assert Journal(str(path)).round(7).get("reveal")["index"] == 15
+
+
+def test_prune_keeps_only_newer_rounds(tmp_path):
+    path = tmp_path / "house.journal"
+    journal, _ = journaled_round(path, 6)
+    journal.round(7).record("start", block=12)
+    journal.prune(7)
+    assert journal.round(6).get("salt") is None
+    # still appendable after the rename
+    journal.round(7).record("salt", salt=hex(SALT))
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert {record["round"] for record in records} == {7}
+    reopened = Journal(str(path))
+    assert reopened.round(7).get("start")["block"] == 12
+    assert reopened.round(6).get("salt") is None
+
+
+def test_null_log_records_nothing():
+    NULL_LOG.record("salt", salt="0x1")
+    assert NULL_LOG.get("salt") is None
+
+
+def test_resume_chain_before_any_reveal(tmp_path):
+    _, log = journaled_round(tmp_path / "house.journal")
+    chain = cut_chain()
+    resumed = resume_chain(log, chain[len(chain) - 1])
+    assert len(resumed) == len(chain)
+    assert resumed[len(resumed) - 1] == chain[len(chain) - 1]
+
+
+def test_resume_chain_after_a_reveal_landed(tmp_path):
+    _, log = journaled_round(tmp_path / "house.journal")
+    chain = cut_chain()
+    index = len(chain) - 2
+    log.record("reveal", index=index)
+    resumed = resume_chain(log, chain[index])
+    assert len(resumed) == index + 1
+
+
+def test_resume_chain_after_a_reveal_that_did_not_land(tmp_path):
+    _, log = journaled_round(tmp_path / "house.journal")
+    chain = cut_chain()
+    index = len(chain) - 5
+    log.record("reveal", index=index)
+    # the anchor is still the link above the journaled one
+    resumed = resume_chain(log, chain[index + 1])
+    assert len(resumed) == index + 2
+
+
+def test_resume_chain_without_a_hint(tmp_path):
+    _, log = journaled_round(tmp_path / "house.journal")
+    chain = cut_chain()
+    resumed = resume_chain(log, chain[4])
+    assert len(resumed) == 5
+
+
+def test_resume_chain_unknown_anchor_or_incomplete_round(tmp_path):
+    journal, log = journaled_round(tmp_path / "house.journal")
+    assert resume_chain(log, b"\x00" * 32) is None
+    journal.round(8).record("salt", salt=hex(SALT))
+    assert resume_chain(journal.round(8), cut_chain()[0]) is None
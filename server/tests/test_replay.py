@@ -0,0 +1,63 @@
+from eth_hash.auto import keccak
+import random
+import pytest
+
+np = pytest.importorskip("numpy")
+from replay import draw, hand_totals
+
+
+# Helper._drawCard and Helper._updateHandTotal, one card at a time
+def draw_card(seed, count):
+    rand = int.from_bytes(keccak(seed + count.to_bytes(32, "big")), "big")
+    return rand % 13 + 1, (rand // 13) % 4
+
+
+def update_hand_total(hand, value):
+    total, usable_ace = hand
+    if value == 1:
+        card = 11
+        usable_ace = True
+    elif value > 10:
+        card = 10
+    else:
+        card = value
+    total += card
+    if total > 21 and usable_ace:
+        total -= 10
+        usable_ace = False
+    return total, usable_ace
+
+
+def test_draw_matches_helper():
+    rng = random.Random(1)
+    seeds = [rng.randbytes(32) for _ in range(500)]
+    counts = [rng.randrange(1, 2**16) for _ in range(500)]
+    values, suits = draw(seeds, counts)
+    assert [(int(v), int(s)) for v, s in zip(values, suits)] == [draw_card(s, c) for s, c in zip(seeds, counts)]
+
+
+@pytest.mark.parametrize("cards, total, soft", [
+    ([1, 1], 12, False),
+    ([1, 13], 21, True),
+    ([1, 5, 9], 15, False),
+    ([10, 12], 20, False),
+    ([10, 12, 5], 25, False),
+    ([1, 1, 1, 1], 14, False),
+    ([9, 1, 1], 21, False),
+])
+def test_hand_totals_edge_cases(cards, total, soft):
+    totals, softs = hand_totals(np.array([cards], dtype=np.uint8))
+    assert (int(totals[0]), bool(softs[0])) == (total, soft)
+
+
+def test_hand_totals_match_helper_with_padding():
+    rng = random.Random(2)
+    hands = [[rng.randrange(1, 14) for _ in range(rng.randrange(1, 9))] for _ in range(300)]
+    width = max(len(hand) for hand in hands)
+    values = np.array([hand + [0] * (width - len(hand)) for hand in hands], dtype=np.uint8)
+    totals, softs = hand_totals(values)
+    for hand, total, soft in zip(hands, totals, softs):
+        expected = (0, False)
+        for value in hand:
+            expected = update_hand_total(expected, value)
+        assert (int(total), bool(soft)) == expected
@@ -1,33 +1,35 @@
-import time
+from common.watcher import get_watcher
+from common.schedule import RECHECK
+from common.txpipe import send, confirm
+from anchors import preflight
 
-def waitForPhase(contract,_phase,id, name,wait=1,debug=False):
-    while True:
-        phase = contract.functions.getPhase(id).call()
-        if debug:
-            print(phase)
-        if phase >= _phase:
-            print(f"✅ Now in {name}!{_phase}<=id:{phase}")
-            break
+def waitForPhase(contract,_phase,id, name,debug=False):
+    # time based (VERIFY_DURATION); no block marks the end of the period
+    phase = get_watcher(contract.w3).wait_phase(contract, _phase, args=(id,), recheck=RECHECK)
+    if debug:
+        print(phase)
+    print(f"✅ Now in {name}!{_phase}<=id:{phase}")
 
-        print(f"⏳ Still waiting for {name}...")
-        time.sleep(wait)
-
-def verifyExec(verify,w3, chain,salt, id):
+def verifyExec(verify,w3, chain,salt, id, setup=None, game=None):
     print("submitting anchor")
     print(salt)
     try:
         print(id,salt.to_bytes(32, byteorder='big'),len(chain))
-        tx= verify.functions.verifyAnchor(id,salt.to_bytes(32, byteorder='big'),len(chain)).transact({
-            "gas": 1_000_000, })
-        receipt = w3.eth.wait_for_transaction_receipt(tx)
-        print(f"Transaction status: {receipt['status']} (1=Success, 0=Fail)")
+        # a reverting verifyAnchor costs gas and still ends in a full refund
+        # its gas is estimated on every send, it grows with length (see common/txpipe.py)
+        reason = setup and game and preflight(verify, setup, game, w3, id, salt.to_bytes(32, byteorder='big'), len(chain))
+        if reason:
+            print(f"not submitting anchor: {reason}")
+        else:
+            tx= send(w3, verify.functions.verifyAnchor(id,salt.to_bytes(32, byteorder='big'),len(chain)))
+            receipt = confirm(w3, tx)
+            print(f"Transaction status: {receipt['status']} (1=Success, 0=Fail)")
 
     except:
         print("failed verifying")
 
     waitForPhase(verify,1,id, "waiting for resolving")
     print("resolveing game anchor")
-    tx= verify.functions.resolveGame(id).transact()
-    receipt = w3.eth.wait_for_transaction_receipt(tx)
+    receipt = confirm(w3, send(w3, verify.functions.resolveGame(id)))
     print(f"Transaction status: {receipt['status']} (1=Success, 0=Fail)")
 